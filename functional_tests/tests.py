@@ -26,14 +26,17 @@ functionality and guarentee you will never break it. Unit tests should help you
 to write code thats clean and bug free.
 """
 
+from contextlib import suppress
+
 from django.test import LiveServerTestCase
 from selenium import webdriver
-from selenium.common.exceptions import WebDriverException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.common.keys import Keys
-
-import time
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
 
 MAX_WAIT = 10  # seconds
+POLL_INTERVAL = 0.05  # seconds between checks of a condition not yet met
 
 class NewVisitorTest(LiveServerTestCase):
     """Container for user orientated test conditions.
@@ -45,7 +48,9 @@ class NewVisitorTest(LiveServerTestCase):
     Methods starting with test will be invoked by the test runner.
 
     self.setUp() and self.tearDown() are special methods which get run before and
-    afer each test.
+    afer each test. setUpClass() and tearDownClass() run once for the class:
+    starting a browser takes seconds, so every test shares one and only
+    clears its cookies.
 
     https://docs.python.org/3/library/unittest.html#unittest.TestCase
     This class inherits from TestCase. TestCase provides some helpful methods
@@ -54,28 +59,54 @@ class NewVisitorTest(LiveServerTestCase):
 
     """
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.browser = webdriver.Firefox()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.browser.quit()
+        super().tearDownClass()
+
     def setUp(self):
-        self.browser = webdriver.Firefox()
+        self.browser.delete_all_cookies()
+
+    def _wait_for(self, condition):
+        """Return as soon as condition(browser) is true, up to MAX_WAIT.
+
+        WebDriver exceptions raised while the page is still changing count as
+        not yet true. Raises TimeoutException if the condition never holds.
+        """
+        return WebDriverWait(self.browser, MAX_WAIT,
+                             poll_frequency=POLL_INTERVAL,
+                             ignored_exceptions=(WebDriverException,)
+                             ).until(condition)
+
+    def _submit_item(self, text):
+        """Type an item into the input box, hit enter and wait for the page
+        the form posts to to replace this one.
+        """
+        page = self.browser.find_element_by_tag_name('html')
+        inputbox = self.browser.find_element_by_id('id_new_item')
+        inputbox.send_keys(text)
+        inputbox.send_keys(Keys.ENTER)
+        self._wait_for(expected_conditions.staleness_of(page))
 
-    def tearDown(self):
-        self.browser.quit()
+    def _rows_in_list_table(self):
+        table = self.browser.find_element_by_id('id_list_table')
+        return [row.text for row in table.find_elements_by_tag_name('tr')]
 
     def _wait_for_row_in_list_table(self, comparator_text):
         """Helper function for test_can_start_a_list_and_retrieve_it_later.
 
-        Programatic explicit waits wait upto MAX_WAIT from the call.
+        Waits upto MAX_WAIT for the row to show, e.g. when it arrives over
+        the list's event stream, then asserts it is there.
         """
-        start_time = time.time()
-        while True:
-            try:
-                table = self.browser.find_element_by_id('id_list_table')
-                rows = table.find_elements_by_tag_name('tr')
-                self.assertIn(comparator_text, [row.text for row in rows])
-                return
-            except (AssertionError, WebDriverException) as err:
-                if time.time() - start_time > MAX_WAIT:
-                    raise err
-                time.sleep(0.5)
+        with suppress(TimeoutException):
+            self._wait_for(
+                lambda browser: comparator_text in self._rows_in_list_table())
+        self.assertIn(comparator_text, self._rows_in_list_table())
 
     def test_can_start_a_list_for_one_user(self):
         """User story: User visits site, adds items to list and checks they are there.
@@ -101,21 +132,18 @@ class NewVisitorTest(LiveServerTestCase):
 
         # She types "Buy peacock feathers" into the a text box (Edith likes to make
         # fishing lures with feathers).
-        inputbox.send_keys('Buy peacock feathers')
-
         # When she hits enter, the page updates, and now the page lists:
         # "1: Buy peacock feathers" as an item in a to-do list.
         print('URL before first ENTER:', self.browser.current_url)
-        inputbox.send_keys(Keys.ENTER)
+        self._submit_item('Buy peacock feathers')
         self._wait_for_row_in_list_table("1: Buy peacock feathers")
         print('URL after first ENTER: ', self.browser.current_url)
 
         # There is still a text box inviting her to add another item.
-        inputbox = self.browser.find_element_by_id('id_new_item')
+        self.browser.find_element_by_id('id_new_item')
 
         # She enters "Use peacock feathers to make a fly".
-        inputbox.send_keys('Use peacock feathers to make a fly')
-        inputbox.send_keys(Keys.ENTER)
+        self._submit_item('Use peacock feathers to make a fly')
         print('URL after second ENTER: ', self.browser.current_url)
 
         # The page updates again and shows both items on her list.
@@ -128,9 +156,7 @@ class NewVisitorTest(LiveServerTestCase):
         """Multiple users visit the site, each with a different URL and make lists."""
         # Edith starts a new to-do list
         self.browser.get(self.live_server_url)
-        inputbox = self.browser.find_element_by_id('id_new_item')
-        inputbox.send_keys('Buy peacock feathers.')
-        inputbox.send_keys(Keys.ENTER)
+        self._submit_item('Buy peacock feathers.')
         self._wait_for_row_in_list_table("1: Buy peacock feathers.")
 
         # She notices her list has a unique URL.
@@ -140,9 +166,8 @@ class NewVisitorTest(LiveServerTestCase):
         # Now a new user, Francis, comes along to the site.
 
         ## Metacomment
-        ## We use a new browser session to make sure that no information of Edith's is coming through from the cookie etc
-        self.browser.quit()
-        self.browser = webdriver.Firefox()
+        ## We clear the browser's cookies to make sure that no information of Edith's is coming through from the cookie etc
+        self.browser.delete_all_cookies()
 
         # Francis visits the homepage. There is no sign of Eidth's lists
         self.browser.get(self.live_server_url)
@@ -151,9 +176,7 @@ class NewVisitorTest(LiveServerTestCase):
         self.assertNotIn('Make a fly', page_text)
 
         # Francis starts a new list by entering a new item.
-        inputbox = self.browser.find_element_by_id('id_new_item')
-        inputbox.send_keys('Buy milk')
-        inputbox.send_keys(Keys.ENTER)
+        self._submit_item('Buy milk')
         self._wait_for_row_in_list_table('1: Buy milk')
 
         # Francis gets his own unique URL
@@ -1,3 +1,207 @@
+"""Admin for lists and items that stays fast however many rows there are.
+
+Django's own changelist counts every row twice and pages with OFFSET, and
+its change forms load every List into a dropdown. Here changelists instead
+show rows newest first, paging with `?before=<id>` so each page is an index
+range scan, and count at most COUNT_LIMIT rows, estimating beyond that.
+Lists are picked by id, and a list's item count is its item_count column.
+Every page costs the same few queries whatever the table sizes.
+
+Item edits keep their list's item_count, last_modified and page cache up to
+date, as the views do. Statuses change only through the complete and delete
+actions, which go through Item.set_status(), and an item stays in its list.
+
+The admin sees the 'default' database only, so with sharded lists it shows
+shard 0 and the lists moved to it.
+"""
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from lists import cache, pubsub
+from lists.models import Item, List
+from lists.sharding import SHARD_ID_BITS
+
+COUNT_LIMIT = 1000  # Rows counted exactly before the count is estimated.
+CURSOR_VAR = 'before'  # Query parameter holding the id a page starts below.
+
+
+def estimated_count(queryset):
+    """Return about how many rows unfiltered `queryset` has, without a scan.
+
+    That is the row count ANALYZE last recorded in sqlite_stat1, if it has
+    been run, or else the span of the table's ids, which also counts the
+    rows deleted since. Rows moved in from other shards have ids past shard
+    0's and are left out of the span.
+    """
+    table = queryset.model._meta.db_table
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master "
+                       "WHERE type = 'table' AND name = 'sqlite_stat1'")
+        row = None
+        if cursor.fetchone():
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s '
+                           'LIMIT 1', [table])
+            row = cursor.fetchone()
+    if row:
+        return int(row[0].split()[0])
+    ids = (queryset.filter(pk__lt=1 << SHARD_ID_BITS)
+           .values_list('pk', flat=True))
+    # Two queries, as SQLite only reads MIN() or MAX() off the index alone.
+    low = ids.order_by('pk').first()
+    return 0 if low is None else ids.order_by('-pk').first() - low + 1
+
+
+class KeysetChangeList(ChangeList):
+    """A changelist paged by primary key, newest first, rather than by
+    OFFSET, with its row count bounded by COUNT_LIMIT.
+
+    Column sorting and "Show all" are not offered: both would need to
+    read past the page.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        try:
+            self.cursor = int(request.GET[CURSOR_VAR])
+        except (KeyError, ValueError):
+            self.cursor = None
+        super().__init__(request, *args, **kwargs)
+        # Filter, search and popup links start again from the first page.
+        self.params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_ordering(self, request, queryset):
+        return ['-pk']
+
+    def get_ordering_field_columns(self):
+        return {}
+
+    def get_results(self, request):
+        queryset = self.queryset
+        # Counting past the limit is what would make pages slow.
+        counted = queryset.order_by()[:COUNT_LIMIT + 1].count()
+        if counted <= COUNT_LIMIT:
+            self.result_count, self.result_count_text = counted, str(counted)
+        elif not queryset.query.where:
+            self.result_count = estimated_count(queryset)
+            self.result_count_text = f'about {self.result_count}'
+        else:
+            self.result_count = COUNT_LIMIT
+            self.result_count_text = f'over {COUNT_LIMIT}'
+
+        if self.cursor is not None:
+            queryset = queryset.filter(pk__lt=self.cursor)
+        rows = list(queryset[:self.list_per_page + 1])
+        self.result_list = rows[:self.list_per_page]
+        self.next_page_url = (
+            self.get_query_string({CURSOR_VAR: rows[-2].pk})
+            if len(rows) > self.list_per_page else None)
+        self.first_page_url = (self.get_query_string()
+                               if self.cursor is not None else None)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = bool(self.next_page_url or self.first_page_url)
+        self.paginator = None
+
+
+class KeysetAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/lists/keyset_change_list.html'
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+@admin.register(List)
+class ListAdmin(KeysetAdmin):
+    list_display = ('id', 'item_count', 'last_modified', 'items')
+    readonly_fields = ('item_count',)
+
+    def items(self, obj):
+        url = reverse('admin:lists_item_changelist')
+        return format_html('<a href="{}?list__id__exact={}">Items</a>',
+                           url, obj.id)
+
+    def has_delete_permission(self, request, obj=None):
+        # The confirmation page would list every one of the list's items.
+        return False
+
+
+@admin.register(Item)
+class ItemAdmin(KeysetAdmin):
+    list_display = ('id', 'text', 'in_list', 'status', 'status_changed')
+    list_filter = ('status',)
+    raw_id_fields = ('list',)
+    readonly_fields = ('position', 'status', 'status_changed')
+    actions = ['complete_items', 'delete_items']
+
+    def in_list(self, obj):
+        url = reverse('admin:lists_list_change', args=[obj.list_id])
+        return format_html('<a href="{}">{}</a>', url, obj.list_id)
+    in_list.short_description = 'list'
+
+    def get_readonly_fields(self, request, obj=None):
+        # Moving an item would need both lists' counts and positions redone.
+        if obj is not None:
+            return self.readonly_fields + ('list',)
+        return self.readonly_fields
+
+    def get_actions(self, request):
+        # Bulk deletion would bypass delete_model(); delete_items instead.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def save_model(self, request, obj, form, change):
+        lists = List.objects.filter(id=obj.list_id)
+        if change:
+            lists.update(last_modified=timezone.now())
+        else:
+            # Before Item.save() reads the last position; see add_items().
+            List(id=obj.list_id).record_new_items(1)
+        super().save_model(request, obj, form, change)
+        self._list_changed(obj.list_id, added=not change)
+
+    def delete_model(self, request, obj):
+        lists = List.objects.filter(id=obj.list_id)
+        lists.update(last_modified=timezone.now())
+        if Item.objects.filter(id=obj.id, status=Item.ACTIVE).exists():
+            lists.update(item_count=F('item_count') - 1)
+        super().delete_model(request, obj)
+        self._list_changed(obj.list_id)
+
+    def _set_status(self, request, queryset, status):
+        changed = [item for item in queryset.only('id', 'list_id')
+                   if item.set_status(status)]
+        for list_id in {item.list_id for item in changed}:
+            self._list_changed(list_id)
+        self.message_user(request, f'{len(changed)} items marked '
+                                   f'{dict(Item.STATUSES)[status]}.')
+
+    def complete_items(self, request, queryset):
+        self._set_status(request, queryset, Item.COMPLETED)
+    complete_items.short_description = 'Mark selected items completed'
+
+    def delete_items(self, request, queryset):
+        self._set_status(request, queryset, Item.DELETED)
+    delete_items.short_description = 'Mark selected items deleted'
 
-# Register your models here.
+    def _list_changed(self, list_id, added=False):
+        """Invalidate the list's cached pages, and wake its event streams
+        for new items, once the admin's transaction commits.
+        """
+        def changed():
+            cache.invalidate(list_id)
+            if added:
+                pubsub.publish(list_id)
+        transaction.on_commit(changed, using=router.db_for_write(Item))
@@ -0,0 +1,180 @@
+"""Admission control: per-client rate limits and a concurrency limit.
+
+AdmissionMiddleware turns requests away before they reach a view, and so
+before they touch the database:
+
+* with 503 Service Unavailable once LISTS_MAX_CONCURRENT_REQUESTS requests
+  are already in progress in this process;
+* with 429 Too Many Requests when a client has used up its token bucket for
+  one of the views named in LISTS_RATE_LIMITS.
+
+Each client's bucket for a view holds up to `burst` tokens and refills at
+`rate` tokens a second; every request takes one. Clients are told by the
+Retry-After header how long to wait. Buckets live in this process unless
+LISTS_RATE_LIMIT_CACHE names a CACHES alias to share them through, in which
+case concurrent processes may let a few extra requests past a limit, as a
+bucket is read and written back without a lock.
+"""
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+CLIENTS_TRACKED = 10000  # Buckets kept in memory before the oldest go.
+SHED_RETRY_AFTER = 1  # Seconds 503 responses tell clients to wait.
+
+_counts = Counter()
+_rate_limited = Counter()
+_counts_lock = threading.Lock()
+_in_flight = 0  # Requests of this process inside AdmissionMiddleware.
+_in_flight_lock = threading.Lock()
+
+
+def _take(state, rate, burst, now):
+    """Refill a (tokens, updated) bucket and take a token from it.
+
+    Returns the new state and the seconds to wait, 0 if a token was taken.
+    """
+    tokens, updated = state
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class LocalBuckets:
+    """Token buckets in this process's memory."""
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            state = self._buckets.pop(key, (burst, now))
+            self._buckets[key], wait = _take(state, rate, burst, now)
+            if len(self._buckets) > CLIENTS_TRACKED:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBuckets:
+    """Token buckets in a Django cache shared between processes."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, key, rate, burst, now):
+        cache = caches[self.alias]
+        key = f'lists:bucket:{key}'
+        state, wait = _take(cache.get(key, (burst, now)), rate, burst, now)
+        # A bucket left alone for burst / rate seconds is full again.
+        cache.set(key, state, timeout=math.ceil(burst / rate) + 1)
+        return wait
+
+
+local_buckets = LocalBuckets()
+
+
+def get_buckets():
+    alias = settings.LISTS_RATE_LIMIT_CACHE
+    return CacheBuckets(alias) if alias else local_buckets
+
+
+def client_key(request):
+    """Identify the client by session cookie or by IP address, as set by
+    LISTS_RATE_LIMIT_BY. Clients without a session are limited by IP.
+    """
+    if settings.LISTS_RATE_LIMIT_BY == 'session':
+        session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if session:
+            return f'session:{session}'
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def _acquire_slot():
+    """Count a request in, returning False if the limit is reached."""
+    global _in_flight
+    limit = settings.LISTS_MAX_CONCURRENT_REQUESTS
+    with _in_flight_lock:
+        if limit is not None and _in_flight >= limit:
+            return False
+        _in_flight += 1
+        return True
+
+
+def _release_slot():
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+def _count(name):
+    with _counts_lock:
+        _counts[name] += 1
+
+
+def _too_many(status, retry_after):
+    response = HttpResponse(status=status)
+    response['Retry-After'] = str(max(math.ceil(retry_after), 1))
+    return response
+
+
+class AdmissionMiddleware:
+    """Shed requests over the concurrency limit and rate limit clients.
+
+    Put it just after QueryTimingMiddleware so shed requests cost as
+    little as possible. Bodies of streamed responses are sent after the
+    request has left the concurrency count, so long event streams do not
+    use up the limit.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _acquire_slot():
+            _count('shed')
+            return _too_many(503, SHED_RETRY_AFTER)
+        try:
+            return self.get_response(request)
+        finally:
+            _release_slot()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        url_name = request.resolver_match.url_name
+        limit = settings.LISTS_RATE_LIMITS.get(url_name)
+        if limit is not None:
+            wait = get_buckets().take(f'{url_name}:{client_key(request)}',
+                                      limit['rate'], limit['burst'],
+                                      time.time())
+            if wait:
+                with _counts_lock:
+                    _counts['rate_limited'] += 1
+                    _rate_limited[url_name] += 1
+                return _too_many(429, wait)
+        _count('admitted')
+        return None
+
+
+def admission_stats():
+    """Return this process's admitted and turned away request counts."""
+    with _counts_lock:
+        counts = dict(_counts)
+        rate_limited = dict(_rate_limited)
+    return {
+        'admitted': counts.get('admitted', 0),
+        'shed': counts.get('shed', 0),
+        'rate_limited': counts.get('rate_limited', 0),
+        'rate_limited_by_view': rate_limited,
+        'in_flight': _in_flight,
+        'max_concurrent': settings.LISTS_MAX_CONCURRENT_REQUESTS,
+    }
@@ -1,5 +1,34 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+from django.template.loader import get_template
 
 
 class ListsConfig(AppConfig):
     name = 'lists'
+
+    def ready(self):
+        from lists.db import apply_sqlite_pragmas
+        connection_created.connect(apply_sqlite_pragmas,
+                                   dispatch_uid='lists.apply_sqlite_pragmas')
+        from lists.routers import reset_routing
+        request_finished.connect(reset_routing,
+                                 dispatch_uid='lists.reset_routing')
+        from lists.sharding import reserve_id_range
+        post_migrate.connect(reserve_id_range, sender=self,
+                             dispatch_uid='lists.reserve_id_range')
+        if settings.LISTS_PRECOMPILE_TEMPLATES:
+            self.precompile_templates()
+
+    def precompile_templates(self):
+        """Load every page template of this app so the cached loader holds
+        it. Admin templates, in a subdirectory, are left to the admin.
+        """
+        directory = os.path.join(self.path, 'templates')
+        for name in sorted(os.listdir(directory)):
+            if os.path.isfile(os.path.join(directory, name)):
+                get_template(name)
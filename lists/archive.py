@@ -0,0 +1,155 @@
+"""Streaming NDJSON export and import of lists and their items.
+
+An archive is one JSON object per line: a list record
+
+    {"list": 7, "last_modified": "2018-02-02T13:02:00+00:00"}
+
+followed by one record per item of that list, in order:
+
+    {"list": 7, "text": "Buy peacock feathers"}
+
+Completed items add "completed": true. Deleted items are not exported.
+
+Export reads both tables in keyset ordered chunks and writes as it goes, and
+import reads one line at a time and inserts in batches, so neither holds
+more than a chunk of rows in memory however large the archive is.
+
+Export reads every shard in turn. Import only writes to 'default', whose
+ids it would push into other shards' ranges, so importlists refuses to run
+while lists are sharded.
+"""
+import json
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from lists import ranks, routers
+from lists.models import BULK_BATCH_SIZE, Item, List
+from lists.sharding import shard_aliases
+
+EXPORT_CHUNK_SIZE = 2000  # Rows fetched per keyset query when exporting.
+
+
+def _lists():
+    after = 0
+    lists = List.objects.order_by('id').values_list('id', 'last_modified')
+    while True:
+        chunk = list(lists.filter(id__gt=after)[:EXPORT_CHUNK_SIZE])
+        yield from chunk
+        if len(chunk) < EXPORT_CHUNK_SIZE:
+            return
+        after = chunk[-1][0]
+
+
+def _items():
+    """Yield (list id, position, text, status) of items that are not
+    deleted, in (list id, position) order.
+
+    The (list, position) index serves each chunk without a sort. The cursor
+    is a row value comparison, which SQLite (3.15+) seeks to in the index;
+    it cannot for the equivalent OR of two comparisons, and would scan the
+    index from its start for every chunk.
+    """
+    list_id, position = 0, ''
+    table = Item._meta.db_table
+    items = (Item.objects.exclude(status=Item.DELETED)
+             .order_by('list_id', 'position')
+             .values_list('list_id', 'position', 'text', 'status'))
+    while True:
+        chunk = list(items.extra(
+            where=[f'({table}.list_id, {table}.position) > (%s, %s)'],
+            params=[list_id, position])[:EXPORT_CHUNK_SIZE])
+        yield from chunk
+        if len(chunk) < EXPORT_CHUNK_SIZE:
+            return
+        list_id, position = chunk[-1][:2]
+
+
+def export_lists(out):
+    """Write every list and item, from every shard, to the text stream `out`.
+
+    Returns the number of (lists, items) written.
+    """
+    lists = items = 0
+    for alias in shard_aliases():
+        with routers.on_shard(alias):
+            pending_items = _items()
+            item = next(pending_items, None)
+            for list_id, last_modified in _lists():
+                out.write(json.dumps(
+                    {'list': list_id,
+                     'last_modified': last_modified.isoformat()}))
+                out.write('\n')
+                lists += 1
+                while item is not None and item[0] <= list_id:
+                    if item[0] == list_id:
+                        record = {'list': list_id, 'text': item[2]}
+                        if item[3] == Item.COMPLETED:
+                            record['completed'] = True
+                        out.write(json.dumps(record))
+                        out.write('\n')
+                        items += 1
+                    item = next(pending_items, None)
+    return lists, items
+
+
+def import_lists(lines):
+    """Create the lists and items of an archive read from `lines`.
+
+    Lists keep their relative ids, shifted past the highest existing list
+    id so they never collide; items get new ids and positions in their
+    original order.
+    The whole import is one transaction. Returns (lists, items) imported.
+    """
+    lists, items = [], []
+    item_counts = Counter()
+    imported = [0, 0]
+
+    def flush():
+        List.objects.bulk_create(lists)
+        Item.objects.bulk_create(items)
+        for list_id, count in item_counts.items():
+            List.objects.filter(id=list_id).update(
+                item_count=F('item_count') + count)
+        imported[0] += len(lists)
+        imported[1] += len(items)
+        lists.clear()
+        items.clear()
+        item_counts.clear()
+
+    with transaction.atomic():
+        offset = List.objects.aggregate(last=Max('id'))['last'] or 0
+        current_list = None
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                list_id = offset + int(record['list'])
+                if 'text' in record:
+                    if list_id != current_list:
+                        raise ValueError('item is not under its list')
+                    item = Item(list_id=list_id, text=str(record['text']),
+                                position=next(positions))
+                    if record.get('completed'):
+                        item.status = Item.COMPLETED
+                        item.status_changed = timezone.now()
+                    else:
+                        item_counts[list_id] += 1
+                    items.append(item)
+                else:
+                    last_modified = parse_datetime(record['last_modified'])
+                    if last_modified is None:
+                        raise ValueError('bad last_modified')
+                    lists.append(List(id=list_id, last_modified=last_modified))
+                    current_list = list_id
+                    positions = ranks.keys_after(None)
+            except (KeyError, TypeError, ValueError) as err:
+                raise ValueError(f'Line {number}: invalid record ({err})')
+            if len(lists) + len(items) >= BULK_BATCH_SIZE:
+                flush()
+        flush()
+    return tuple(imported)
@@ -0,0 +1,821 @@
+"""Benchmark suites for the lists app.
+
+Run one with `python manage.py benchmark <suite>`. Each suite is a function
+registered with @suite that takes the command's options and returns a dict
+of results, which the command prints (or writes) as JSON so runs can be
+compared between commits. The command runs suites against a throwaway test
+database, never the configured one.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from http.cookiejar import CookieJar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.template import engines
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+
+from lists import ranks, search as item_search, writequeue
+from lists.compression import brotli as compression_brotli
+from lists.db import copy_database
+from lists.models import Item, List
+from lists.routers import PRIMARY
+from lists.stats import summarize
+from lists.views import _render_rows
+
+SUITES = {}
+
+
+def suite(func):
+    """Register a benchmark suite under the function's name."""
+    SUITES[func.__name__] = func
+    return func
+
+
+def time_calls(func, repeat):
+    """Call func() `repeat` times and return each call's duration."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+@contextmanager
+def scratch_database():
+    """Point the default connection at a fresh test database.
+
+    The database is a file in a temporary directory rather than SQLite's
+    default in-memory test database, so locking and concurrency behave as
+    they do in production.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    with tempfile.TemporaryDirectory() as directory:
+        connection.settings_dict.setdefault('TEST', {})
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory, 'benchmark.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+
+def seed_lists(lists, items_per_list):
+    """Create `lists` lists of `items_per_list` items, returning their ids."""
+    ids = []
+    for _ in range(lists):
+        _list = List.objects.create()
+        _list.add_items(f'benchmark item {n}' for n in range(items_per_list))
+        ids.append(_list.id)
+    return ids
+
+
+class InProcessTarget:
+    """Send requests straight to the WSGI app through the test Client."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        # Client keeps cookies, so give each worker thread its own.
+        if not hasattr(self._local, 'client'):
+            self._local.client = Client()
+        return self._local.client
+
+    def get(self, path):
+        response = self.client.get(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code, response.get('Location')
+
+    def post(self, path, data, content_type=None):
+        if content_type:
+            response = self.client.post(path, data, content_type=content_type)
+        else:
+            response = self.client.post(path, data)
+        return response.status_code, response.get('Location')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPTarget:
+    """Send requests to a running server, e.g. `manage.py runserver`.
+
+    Redirects are not followed, so add_item and new_list are timed the same
+    way as in-process: up to the 302, not including the page after it.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self._local = threading.local()
+
+    def _session(self):
+        # Each worker thread gets its own cookie jar and CSRF token.
+        if not hasattr(self._local, 'opener'):
+            self._local.opener = urllib.request.build_opener(
+                urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+            page = self._local.opener.open(self.base_url + '/').read()
+            self._local.csrf_token = re.search(
+                rb'name=.csrfmiddlewaretoken. value=.([^"\']+)',
+                page).group(1).decode()
+        return self._local.opener, self._local.csrf_token
+
+    def _open(self, request):
+        opener, _ = self._session()
+        try:
+            with opener.open(request) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as err:
+            if err.code >= 400:
+                raise
+            return err.code, err.headers.get('Location')
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data, content_type=None):
+        _, csrf_token = self._session()
+        headers = {'X-CSRFToken': csrf_token}
+        if content_type:
+            body = data.encode()
+            headers['Content-Type'] = content_type
+        else:
+            body = urllib.parse.urlencode(data).encode()
+        return self._open(urllib.request.Request(
+            self.base_url + path, data=body, headers=headers))
+
+
+def _list_id(location):
+    return int(re.search(r'/lists/(\d+)/', location).group(1))
+
+
+def seed_over_http(target, lists, items_per_list):
+    """Like seed_lists, but through the new_list and add_items views."""
+    ids = []
+    for _ in range(lists):
+        _, location = target.post('/lists/new',
+                                  {'item_text': 'benchmark item 0'})
+        list_id = _list_id(location)
+        if items_per_list > 1:
+            target.post(f'/lists/{list_id}/add_items',
+                        '\n'.join(f'benchmark item {n}'
+                                  for n in range(1, items_per_list)),
+                        content_type='text/plain')
+        ids.append(list_id)
+    return ids
+
+
+def load(request, count, concurrency):
+    """Make `count` calls of request(n) from `concurrency` threads.
+
+    Returns the latency summary plus the throughput over the wall time of
+    the whole run, which is what concurrency actually buys. Calls that raise
+    are counted as errors rather than stopping the run.
+    """
+    errors = []
+
+    def timed(n):
+        start = time.perf_counter()
+        try:
+            request(n)
+        except Exception as err:
+            errors.append(err)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(timed, range(count)))
+    else:
+        samples = [timed(n) for n in range(count)]
+    wall = time.perf_counter() - start
+    summary = summarize(samples)
+    summary['throughput_per_second'] = round(count / wall, 1)
+    summary['errors'] = len(errors)
+    return summary
+
+
+def _uncached_get(client, path):
+    def get():
+        cache.clear()
+        response = client.get(path)
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+    return get
+
+
+@suite
+def api(options):
+    """Compare the JSON items endpoint with view_list on the same list."""
+    [list_id] = seed_lists(1, options['items'])
+    client = Client()
+    paths = {
+        'html_page': f'/lists/{list_id}/',
+        'json_page': f'/lists/{list_id}/items',
+        'html_stream': f'/lists/{list_id}/?stream=1',
+        'json_stream': f'/lists/{list_id}/items?stream=1',
+    }
+    results = {}
+    for name, path in paths.items():
+        get = _uncached_get(client, path)
+        results[name] = summarize(time_calls(get, options['repeat']))
+        results[name]['bytes'] = len(get())
+    return results
+
+
+@suite
+def views(options):
+    """Load home_page, new_list, view_list and add_item in turn.
+
+    With --url the requests go to that server instead of the in-process
+    WSGI app, and the data is seeded through its own views.
+    """
+    if options.get('url'):
+        target = HTTPTarget(options['url'])
+        list_ids = seed_over_http(target, options['lists'], options['items'])
+    else:
+        target = InProcessTarget()
+        list_ids = seed_lists(options['lists'], options['items'])
+    pick = random.Random(0).choice
+    requests = {
+        'home_page': lambda n: target.get('/'),
+        'new_list': lambda n: target.post('/lists/new',
+                                          {'item_text': f'new list {n}'}),
+        'view_list': lambda n: target.get(f'/lists/{pick(list_ids)}/'),
+        'add_item': lambda n: target.post(
+            f'/lists/{pick(list_ids)}/add_item', {'item_text': f'item {n}'}),
+    }
+    return {name: load(request, options['repeat'], options['concurrency'])
+            for name, request in requests.items()}
+
+
+@contextmanager
+def file_database(alias, path, **settings_dict):
+    """Add a migrated SQLite database at `path` as connection `alias`."""
+    connections.databases[alias] = dict(
+        settings_dict, ENGINE='django.db.backends.sqlite3', NAME=path)
+    connections.ensure_defaults(alias)
+    try:
+        call_command('migrate', database=alias, verbosity=0)
+        yield alias
+    finally:
+        connections[alias].close()
+        del connections[alias]
+        del connections.databases[alias]
+
+
+def _run_for(seconds, alias, operation, reconnect):
+    """Repeat operation() until `seconds` pass; count successes and locks."""
+    done = locked = 0
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            try:
+                operation()
+                done += 1
+            except OperationalError:
+                locked += 1
+            if reconnect:
+                connections[alias].close()
+    finally:
+        connections[alias].close()
+    return done, locked
+
+
+def _stress(alias, options, reconnect):
+    list_ids = []
+    for _ in range(options['lists']):
+        _list = List.objects.using(alias).create()
+        Item.objects.using(alias).bulk_create(
+            Item(text=f'benchmark item {n}', list_id=_list.id,
+                 position=position)
+            for n, position in zip(range(options['items']),
+                                   ranks.keys_after(None)))
+        list_ids.append(_list.id)
+    connections[alias].close()
+    pick = random.Random(0).choice
+
+    def write():
+        list_id = pick(list_ids)
+        # Item.save() reads the list's last position, so update the count
+        # first to take the write lock before that read.
+        with transaction.atomic(using=alias):
+            List.objects.using(alias).filter(id=list_id).update(
+                item_count=F('item_count') + 1)
+            Item.objects.using(alias).create(text='stress', list_id=list_id)
+
+    def read():
+        list_id = pick(list_ids)
+        List.objects.using(alias).get(id=list_id)
+        list(Item.objects.using(alias).filter(list_id=list_id)
+             .order_by('id').values_list('id', 'text')[:100])
+
+    workers = options['concurrency']
+    with ThreadPoolExecutor(max_workers=2 * workers) as pool:
+        runs = [pool.submit(_run_for, options['seconds'], alias, op, reconnect)
+                for op in [write] * workers + [read] * workers]
+        writes, reads = runs[:workers], runs[workers:]
+        writes = [run.result() for run in writes]
+        reads = [run.result() for run in reads]
+    return {
+        'writes_per_second': round(sum(w[0] for w in writes)
+                                   / options['seconds'], 1),
+        'reads_per_second': round(sum(r[0] for r in reads)
+                                  / options['seconds'], 1),
+        'locked_errors': sum(w[1] for w in writes) + sum(r[1] for r in reads),
+    }
+
+
+@suite
+def sqlite_concurrency(options):
+    """Concurrent writer and reader throughput on a SQLite file, untuned
+    versus the PRAGMAs and persistent connections of settings_production.
+
+    Uses --concurrency writer threads plus as many reader threads, each
+    running for --seconds. The untuned run reconnects after every operation
+    the way CONN_MAX_AGE=0 does after every request.
+    """
+    from superlists import settings_production
+    profiles = {
+        'untuned': ({}, {}, True),
+        'tuned': (settings_production.SQLITE_PRAGMAS,
+                  settings_production.DATABASES['default']['OPTIONS'], False),
+    }
+    results = {}
+    for name, (pragmas, db_options, reconnect) in profiles.items():
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(SQLITE_PRAGMAS=pragmas), \
+                file_database('stress', os.path.join(directory, 'stress.db'),
+                              OPTIONS=db_options) as alias:
+            results[name] = _stress(alias, options, reconnect)
+    return results
+
+
+SERVER_THREADS = 8  # Worker threads given to both WSGI and ASGI in `asgi`.
+SLOW_CLIENT_SECONDS = 0.02  # Time each client takes to send its request.
+
+
+def _http_scope(path):
+    return {'type': 'http', 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'root_path': '',
+            'query_string': b'', 'server': ('testserver', 80),
+            'client': ('127.0.0.1', 50000),
+            'headers': [(b'host', b'testserver')]}
+
+
+@suite
+def asgi(options):
+    """view_list for --concurrency slow clients, WSGI threads versus ASGI.
+
+    Both servers get SERVER_THREADS worker threads and every client takes
+    SLOW_CLIENT_SECONDS to send its request. A WSGI worker is held for that
+    wait, as it is by a slow socket read; under the ASGI adapter the wait is
+    an idle coroutine and threads only run views.
+    """
+    from superlists.asgi import ASGIAdapter
+
+    list_ids = seed_lists(options['lists'], options['items'])
+    pick = random.Random(0).choice
+    wsgi_application = get_wsgi_application()
+    per_client = max(1, options['repeat'] // options['concurrency'])
+
+    def serve_wsgi(path):
+        time.sleep(SLOW_CLIENT_SECONDS)
+        environ = ASGIAdapter.environ(_http_scope(path), io.BytesIO())
+        response = wsgi_application(environ, lambda status, headers: None)
+        b''.join(response)
+        response.close()
+
+    async def wsgi_request(loop, pool, path):
+        await loop.run_in_executor(pool, serve_wsgi, path)
+
+    async def asgi_request(adapter, path):
+        async def receive():
+            await asyncio.sleep(SLOW_CLIENT_SECONDS)
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            pass
+
+        await adapter(_http_scope(path), receive, send)
+
+    async def run(request):
+        samples = []
+
+        async def client():
+            for _ in range(per_client):
+                start = time.perf_counter()
+                await request(f'/lists/{pick(list_ids)}/')
+                samples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+        summary = summarize(samples)
+        summary['throughput_per_second'] = round(
+            len(samples) / (time.perf_counter() - start), 1)
+        return summary
+
+    loop = asyncio.new_event_loop()
+    try:
+        with ThreadPoolExecutor(max_workers=SERVER_THREADS) as pool:
+            wsgi = loop.run_until_complete(
+                run(lambda path: wsgi_request(loop, pool, path)))
+        adapter = ASGIAdapter(wsgi_application, max_workers=SERVER_THREADS)
+        asgi = loop.run_until_complete(
+            run(lambda path: asgi_request(adapter, path)))
+        adapter.executor.shutdown()
+    finally:
+        loop.close()
+    return {'wsgi': wsgi, 'asgi': asgi}
+
+
+# item_rows.html as it was before rows became precomputed labels.
+INSTANCE_ROWS_TEMPLATE = """{% for item in items %}
+        <tr><td>{{ forloop.counter|add:offset }}: {{ item.text }}</td></tr>
+{% endfor %}
+"""
+
+
+@suite
+def render(options):
+    """Per-item cost of fetching and rendering --items rows, from model
+    instances through the old template versus from precomputed labels.
+    """
+    [list_id] = seed_lists(1, options['items'])
+    items = Item.objects.filter(list_id=list_id).order_by('id')
+    instance_rows = engines['django'].from_string(INSTANCE_ROWS_TEMPLATE)
+
+    def from_instances():
+        return instance_rows.render({'items': list(items), 'offset': 0})
+
+    def from_labels():
+        return _render_rows(list(items.values_list('id', 'text')), 0)
+
+    results = {}
+    for name, render_rows in (('instances', from_instances),
+                              ('labels', from_labels)):
+        summary = summarize(time_calls(render_rows, options['repeat']))
+        summary['us_per_item'] = round(
+            summary['p50_ms'] * 1000 / max(options['items'], 1), 3)
+        summary['bytes'] = len(render_rows())
+        results[name] = summary
+    return results
+
+
+SEARCH_VOCABULARY = 5000  # Distinct words in the items seeded by `search`.
+
+
+@suite
+def search(options):
+    """Search --lists x --items items for one word, through the FTS5 index
+    versus a LIKE scan of every item.
+    """
+    vocabulary = [f'word{n}' for n in range(SEARCH_VOCABULARY)]
+    words = random.Random(0).choices
+    for _ in range(options['lists']):
+        _list = List.objects.create()
+        _list.add_items(' '.join(words(vocabulary, k=6))
+                        for _ in range(options['items']))
+    query = [vocabulary[SEARCH_VOCABULARY // 2]]
+    results = {
+        'items': options['lists'] * options['items'],
+        'scan': summarize(time_calls(
+            lambda: item_search.search_scan(query, 0), options['repeat'])),
+    }
+    if item_search.has_fts():
+        results['index'] = summarize(time_calls(
+            lambda: item_search.search_index(query, 0), options['repeat']))
+    return results
+
+
+@suite
+def burst(options):
+    """add_item throughput with --concurrency clients posting at once, each
+    request in its own transaction versus coalesced by the writer thread.
+    """
+    list_ids = seed_lists(options['lists'], 1)
+    pick = random.Random(0).choice
+    target = InProcessTarget()
+    modes = {
+        'per_request': None,
+        'coalesced': {'max_batch': 500, 'max_delay': 0.005},
+    }
+    results = {}
+    # Lock errors are expected without coalescing; count them, don't log.
+    request_logger = logging.getLogger('django.request')
+    request_logger.disabled = True
+    try:
+        for name, coalescing in modes.items():
+            with override_settings(LISTS_WRITE_COALESCING=coalescing):
+                results[name] = load(
+                    lambda n: target.post(f'/lists/{pick(list_ids)}/add_item',
+                                          {'item_text': f'item {n}'}),
+                    options['repeat'], options['concurrency'])
+                writequeue.shutdown()
+    finally:
+        request_logger.disabled = False
+    return results
+
+
+STARTUP_PROFILES = ('superlists.settings', 'superlists.settings_production')
+STARTUP_TOP_MODULES = 15  # Slowest imports listed per settings profile.
+
+# Run in a fresh interpreter: time importing the WSGI app (settings, app
+# loading and all) and then serving it its first request.
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from superlists.wsgi import application
+loaded = time.perf_counter()
+environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'SERVER_NAME': 'localhost',
+           'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.input': None,
+           'wsgi.url_scheme': 'http'}
+b''.join(application(environ, lambda status, headers: None))
+served = time.perf_counter()
+print(json.dumps({'import': loaded - start, 'first_response': served - loaded}))
+"""
+
+
+def parse_importtime(stderr):
+    """Return {module: cumulative seconds} from `python -X importtime`."""
+    imports = {}
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)', line)
+        if match:
+            imports[match.group(3)] = int(match.group(1)) / 1e6
+    return imports
+
+
+@suite
+def startup(options):
+    """Cold start of superlists.wsgi.application under each settings
+    profile: time to import it and time to serve the first response, plus
+    the slowest module imports where the interpreter supports -X importtime
+    (Python 3.7+).
+    """
+    results = {}
+    for profile in STARTUP_PROFILES:
+        environ = dict(os.environ, DJANGO_SETTINGS_MODULE=profile)
+        imports, first_response, modules = [], [], {}
+        for _ in range(options['repeat']):
+            run = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+                cwd=settings.BASE_DIR, env=environ, universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            timings = json.loads(run.stdout.splitlines()[-1])
+            imports.append(timings['import'])
+            first_response.append(timings['first_response'])
+            modules = modules or parse_importtime(run.stderr)
+        slowest = sorted(modules.items(), key=lambda item: -item[1])
+        results[profile] = {
+            'import': summarize(imports),
+            'first_response': summarize(first_response),
+            'modules_imported': len(modules) or None,
+            'slowest_imports_ms': {name: round(seconds * 1000, 3) for
+                                   name, seconds in
+                                   slowest[:STARTUP_TOP_MODULES]},
+        }
+    return results
+
+
+def _cpu_and_body(client, path, **headers):
+    """Return one GET's CPU seconds, the response and its body bytes."""
+    start = time.process_time()
+    response = client.get(path, **headers)
+    if response.streaming:
+        body = b''.join(response.streaming_content)
+    else:
+        body = response.content
+    return time.process_time() - start, response, body
+
+
+@suite
+def compression(options):
+    """Bytes sent and CPU spent serving a list of --items items with each
+    Content-Encoding, and when the client's ETag is still current.
+    """
+    [list_id] = seed_lists(1, options['items'])
+    client = Client()
+    path = f'/lists/{list_id}/?stream=1'
+    encodings = ['identity', 'gzip'] + (['br'] if compression_brotli else [])
+    results = {}
+    for encoding in encodings:
+        cpu, sizes = [], set()
+        for _ in range(options['repeat']):
+            seconds, response, body = _cpu_and_body(
+                client, path, HTTP_ACCEPT_ENCODING=encoding)
+            cpu.append(seconds)
+            sizes.add(len(body))
+        results[encoding] = {'bytes': max(sizes), 'cpu': summarize(cpu)}
+        results[encoding]['encoding'] = response.get('Content-Encoding',
+                                                     'identity')
+
+    etag = client.get(f'/lists/{list_id}/')['ETag']
+    cpu, queries = [], []
+    for _ in range(options['repeat']):
+        with CaptureQueriesContext(connection) as captured:
+            seconds, response, body = _cpu_and_body(
+                client, f'/lists/{list_id}/', HTTP_IF_NONE_MATCH=etag)
+        cpu.append(seconds)
+        queries.append(len(captured))
+    results['not_modified'] = {'status': response.status_code,
+                               'bytes': len(body), 'cpu': summarize(cpu),
+                               'queries': max(queries)}
+    return results
+
+
+REPLICA_COUNTS = (0, 1, 2, 4)  # Read replicas tried in turn by `replicas`.
+
+
+@contextmanager
+def replica_databases(count, directory):
+    """Add `count` file copies of the default database as read replicas."""
+    aliases = [f'benchmark_replica{number}' for number in range(count)]
+    for alias in aliases:
+        path = os.path.join(directory, f'{alias}.sqlite3')
+        copy_database(PRIMARY, path)
+        connections.databases[alias] = dict(
+            connection.settings_dict, NAME=path)
+    try:
+        with override_settings(LISTS_READ_REPLICAS=aliases):
+            yield aliases
+    finally:
+        for alias in aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+
+
+@suite
+def replicas(options):
+    """view_list throughput from --concurrency clients, uncached, as file
+    copy read replicas are added, and the databases read from.
+    """
+    list_ids = seed_lists(options['lists'], options['items'])
+    pick = random.Random(0).choice
+    target = InProcessTarget()
+
+    def view_list(n):
+        cache.clear()
+        target.get(f'/lists/{pick(list_ids)}/')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for count in REPLICA_COUNTS:
+            with replica_databases(count, directory) as aliases:
+                results[f'{count}_replicas'] = load(
+                    view_list, options['repeat'], options['concurrency'])
+                results[f'{count}_replicas']['databases'] = aliases or [
+                    PRIMARY]
+    return results
+
+
+SHARD_COUNTS = (1, 2, 4)  # Shards tried in turn by `shards`.
+
+# Run in a fresh interpreter per worker process started by `shards`.
+SHARD_WORKER_SCRIPT = """
+import json, sys
+import django
+django.setup()
+from lists.benchmarks import run_shard_worker
+print(json.dumps(run_shard_worker(json.loads(sys.argv[1]))))
+"""
+
+
+def run_shard_worker(job):
+    """Seed job['lists'] lists, wait until stdin closes, then add
+    job['repeat'] items to them and return the timings.
+
+    Runs in a `shards` worker process under settings_production, with
+    job['default'] as the 'default' database and SUPERLISTS_SHARDS naming
+    the others.
+    """
+    connections.databases[PRIMARY]['NAME'] = job['default']
+    setup_test_environment()
+    # Lock errors are part of the result; count them, don't log.
+    logging.getLogger('django.request').disabled = True
+    target = InProcessTarget()
+    list_ids = seed_over_http(target, job['lists'], 1)
+    pick = random.Random(job['seed']).choice
+    print('ready', flush=True)
+    sys.stdin.read()
+    samples, errors = [], 0
+    for n in range(job['repeat']):
+        start = time.perf_counter()
+        try:
+            target.post(f'/lists/{pick(list_ids)}/add_item',
+                        {'item_text': f'item {n}'})
+        except Exception:
+            errors += 1
+        samples.append(time.perf_counter() - start)
+    return {'samples': samples, 'errors': errors}
+
+
+def _load_shard_workers(paths, options):
+    """Run --concurrency worker processes writing to the SQLite files
+    `paths`, the first as 'default', and combine their timings.
+
+    The clock starts once every worker has seeded its lists.
+    """
+    environ = dict(os.environ,
+                   DJANGO_SETTINGS_MODULE='superlists.settings_production',
+                   SUPERLISTS_SHARDS=','.join(paths[1:]),
+                   SUPERLISTS_READ_REPLICAS='')
+    workers = options['concurrency']
+    share, extra = divmod(options['repeat'], workers)
+    processes = []
+    try:
+        for number in range(workers):
+            job = {'default': paths[0], 'lists': options['lists'],
+                   'repeat': share + (number < extra), 'seed': number}
+            processes.append(subprocess.Popen(
+                [sys.executable, '-c', SHARD_WORKER_SCRIPT, json.dumps(job)],
+                cwd=settings.BASE_DIR, env=environ, universal_newlines=True,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE))
+        for process in processes:
+            if process.stdout.readline().strip() != 'ready':
+                raise RuntimeError('a shards worker process failed to start')
+        start = time.perf_counter()
+        for process in processes:
+            process.stdin.close()
+        outputs = [process.stdout.read() for process in processes]
+        wall = time.perf_counter() - start
+        for process in processes:
+            if process.wait():
+                raise RuntimeError('a shards worker process failed')
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+    samples, errors = [], 0
+    for output in outputs:
+        timings = json.loads(output.splitlines()[-1])
+        samples.extend(timings['samples'])
+        errors += timings['errors']
+    summary = summarize(samples)
+    summary['throughput_per_second'] = round(len(samples) / wall, 1)
+    summary['errors'] = errors
+    summary['writes_per_second'] = round((len(samples) - errors) / wall, 1)
+    return summary
+
+
+@suite
+def shards(options):
+    """add_item throughput from --concurrency worker processes, each one
+    client, with new lists spread over 1, 2 and 4 SQLite files.
+
+    Each file allows one writer at a time, so with more shards more of the
+    concurrent writes can proceed at once. The workers are separate
+    interpreters under settings_production, as behind a multi-process
+    server, so the GIL of one process does not cap the writes instead. On
+    fewer CPUs than workers, the CPUs cap them.
+    """
+    aliases = [PRIMARY] + [f'benchmark_shard{number}'
+                           for number in range(1, max(SHARD_COUNTS))]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, ExitStack() as stack:
+        paths = [os.path.join(directory, f'{alias}.sqlite3')
+                 for alias in aliases]
+        # Shard 0 holds the ListShard directory too, so copy the primary.
+        copy_database(PRIMARY, paths[0])
+        # Migrating as LISTS_SHARDS reserves each file's id range.
+        with override_settings(LISTS_SHARDS=aliases):
+            for alias, path in zip(aliases[1:], paths[1:]):
+                stack.enter_context(file_database(alias, path))
+        for count in SHARD_COUNTS:
+            results[f'{count}_shards'] = _load_shard_workers(paths[:count],
+                                                             options)
+    return results
@@ -0,0 +1,108 @@
+"""Per-list cache of rendered id_list_table rows.
+
+Each list has a small state record holding a version token. Rendered rows
+are cached under that version, so a write only has to replace the state
+record (see invalidate) and every fragment of the old version becomes
+unreachable. view_list also keys rows on the list's ETag, which comes from
+the database, so a process whose cache missed another's write cannot serve
+stale rows either.
+
+Which backend holds the entries is chosen by the LISTS_CACHE alias in
+CACHES, so LocMem, file-based or shared caches all work.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+CACHE_TIMEOUT = 60 * 60  # Seconds before an idle entry expires.
+FILLED_KEYS_TRACKED = 10000  # Recent fills remembered to spot evictions.
+
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_stats_lock = threading.Lock()
+_filled = OrderedDict()  # Row keys this process has cached, oldest first.
+
+
+def _cache():
+    return caches[getattr(settings, 'LISTS_CACHE', 'default')]
+
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def _remember_fill(key):
+    with _stats_lock:
+        _filled[key] = True
+        if len(_filled) > FILLED_KEYS_TRACKED:
+            _filled.popitem(last=False)
+
+
+def _forget_fill(key):
+    """Return True if this process had cached `key` before."""
+    with _stats_lock:
+        return _filled.pop(key, False)
+
+
+def _state_key(list_id):
+    return f'lists:state:{int(list_id)}'
+
+
+def _rows_key(list_id, state, page):
+    page = ':'.join(str(part) for part in page)
+    return f'lists:rows:{int(list_id)}:{state["version"]}:{page}'
+
+
+def _new_state():
+    return {'version': uuid.uuid4().hex}
+
+
+def get_state(list_id):
+    """Return the state record for a list, creating it when absent."""
+    state = _cache().get(_state_key(list_id))
+    if state is None:
+        state = _new_state()
+        _cache().set(_state_key(list_id), state, CACHE_TIMEOUT)
+    return state
+
+
+def get_rows(list_id, page, render):
+    """Return the cached rows of a page, calling render() on a miss.
+
+    `page` is a tuple of whatever identifies the page, e.g. the list's ETag
+    and the page's cursor, and render() returns what to cache for it.
+    """
+    key = _rows_key(list_id, get_state(list_id), page)
+    rows = _cache().get(key)
+    if rows is not None:
+        _count('hits')
+        return rows
+    _count('misses')
+    if _forget_fill(key):
+        _count('evictions')
+    rows = render()
+    _cache().set(key, rows, CACHE_TIMEOUT)
+    _remember_fill(key)
+    return rows
+
+
+def invalidate(list_id):
+    """Start a new version of a list after its items have changed."""
+    _count('invalidations')
+    _cache().set(_state_key(list_id), _new_state(), CACHE_TIMEOUT)
+
+
+def stats():
+    """Return this process's hit, miss, eviction and invalidation counts.
+
+    An eviction is a miss on rows this process cached itself and which have
+    not been invalidated since, i.e. the backend dropped them.
+    """
+    with _stats_lock:
+        counts = dict(_stats)
+    lookups = counts['hits'] + counts['misses']
+    counts['hit_rate'] = counts['hits'] / lookups if lookups else 0.0
+    return counts
@@ -0,0 +1,41 @@
+"""Move old completed and deleted items out of lists_item.
+
+Inactive items whose status changed before a cutoff are copied into the
+ArchivedItem table and deleted from lists_item one batch at a time. Each
+batch is its own short transaction, so writers are never held up for long,
+and lists_item only has to hold the live part of each list plus recent
+history.
+"""
+from django.db import router, transaction
+
+from lists.models import ArchivedItem, Item
+
+COMPACT_BATCH_SIZE = 1000  # Items moved per transaction.
+
+
+def compact_items(before, batch_size=None):
+    """Archive completed and deleted items whose status changed before
+    `before`, returning how many were moved. Works on the current shard.
+
+    Batches are found through the partial lists_item_inactive_idx index,
+    so the active items are never scanned.
+    """
+    batch_size = batch_size or COMPACT_BATCH_SIZE
+    inactive = (Item.objects.inactive().filter(status_changed__lt=before)
+                .order_by('status_changed')
+                .values_list('id', 'list_id', 'text', 'position', 'status',
+                             'status_changed'))
+    archived = 0
+    while True:
+        with transaction.atomic(using=router.db_for_write(Item)):
+            batch = list(inactive[:batch_size])
+            if not batch:
+                return archived
+            ArchivedItem.objects.bulk_create(
+                ArchivedItem(id=item_id, list_id=list_id, text=text,
+                             position=position, status=status,
+                             status_changed=status_changed)
+                for item_id, list_id, text, position, status, status_changed
+                in batch)
+            Item.objects.filter(id__in=[row[0] for row in batch]).delete()
+        archived += len(batch)
@@ -0,0 +1,102 @@
+"""Response compression with Brotli where available and gzip otherwise.
+
+Brotli needs the optional brotli package. Without it, or for clients that
+do not send br in Accept-Encoding, CompressionMiddleware compresses like
+Django's GZipMiddleware, except that streamed bodies are flushed after each
+chunk and server-sent event streams are not compressed at all.
+"""
+import re
+from gzip import GzipFile
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import StreamingBuffer
+
+try:
+    import brotli
+except ImportError:  # Optional: responses are gzipped instead.
+    brotli = None
+
+BROTLI_QUALITY = 5  # 0-11; past 5 costs much more CPU for little gain.
+GZIP_LEVEL = 6  # As GZipMiddleware uses.
+MIN_LENGTH = 200  # Shorter bodies are sent as they are, as GZipMiddleware does.
+UNCOMPRESSED_TYPES = ('text/event-stream',)  # Content types sent as they are.
+
+_accepts_brotli = re.compile(r'\bbr\b')
+_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def _brotli_sequence(sequence):
+    """Compress a streamed body, flushing after each chunk so the client
+    gets every chunk as soon as it is rendered.
+    """
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _gzip_sequence(sequence):
+    """Gzip a streamed body, sync-flushing after each chunk, which Django's
+    compress_sequence does not: it holds everything back until the
+    compressor's buffer fills, or the stream ends.
+    """
+    buffer = StreamingBuffer()
+    with GzipFile(mode='wb', compresslevel=GZIP_LEVEL, fileobj=buffer,
+                  mtime=0) as compressed:
+        for chunk in sequence:
+            compressed.write(chunk)
+            compressed.flush()
+            yield buffer.read()
+    yield buffer.read()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Compress responses with Brotli if the client and server support it,
+    else gzip.
+
+    Put it near the top of MIDDLEWARE so it compresses the final body. A
+    strong ETag is made weak on compressed responses, as GZipMiddleware
+    does, because the bytes sent differ from the uncompressed ones. Event
+    streams are left alone: their events are small, and a proxy or client
+    buffering compressed data would hold them back.
+    """
+
+    def process_response(self, request, response):
+        if (response.has_header('Content-Encoding')
+                or response.get('Content-Type', '').startswith(
+                    UNCOMPRESSED_TYPES)):
+            return response
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        use_brotli = (brotli is not None
+                      and _accepts_brotli.search(accept_encoding))
+        if not response.streaming:
+            if not use_brotli or len(response.content) < MIN_LENGTH:
+                return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.streaming:
+            if use_brotli:
+                encoding, compress = 'br', _brotli_sequence
+            elif _accepts_gzip.search(accept_encoding):
+                encoding, compress = 'gzip', _gzip_sequence
+            else:
+                return response
+            response.streaming_content = compress(response.streaming_content)
+            del response['Content-Length']
+        else:
+            encoding = 'br'
+            compressed = brotli.compress(response.content,
+                                         quality=BROTLI_QUALITY)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
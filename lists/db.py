@@ -0,0 +1,38 @@
+"""Connection setup and copying for the databases behind the lists app."""
+import os
+import re
+
+from django.conf import settings
+from django.db import connections
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Run the SQLITE_PRAGMAS setting on every new SQLite connection.
+
+    Connected to django.db.backends.signals.connection_created in
+    ListsConfig.ready(). The PRAGMAs go straight to the driver connection so
+    they never show up in query logs or counts.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        if not PRAGMA_NAME.match(name):
+            raise ValueError(f'Invalid SQLite PRAGMA name: {name!r}')
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def copy_database(alias, path):
+    """Write a consistent copy of SQLite database `alias` to `path`.
+
+    VACUUM INTO reads from a single snapshot, so writers carry on while it
+    runs, and the copy replaces `path` in one rename: connections already
+    open on the old file keep reading it until they reconnect.
+    """
+    partial = f'{path}.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    with connections[alias].cursor() as cursor:
+        cursor.execute('VACUUM INTO %s', [partial])
+    os.replace(partial, path)
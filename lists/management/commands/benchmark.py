@@ -0,0 +1,52 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from lists.benchmarks import SUITES, scratch_database
+
+OPTIONS_REPORTED = ('lists', 'items', 'repeat', 'concurrency', 'seconds',
+                    'url')
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark suite from lists.benchmarks and report JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(SUITES))
+        parser.add_argument('--lists', type=int, default=10,
+                            help='Lists to seed.')
+        parser.add_argument('--items', type=int, default=1000,
+                            help='Items per seeded list.')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Timed calls per measurement.')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Client threads making the calls.')
+        parser.add_argument('--seconds', type=float, default=2,
+                            help='Run time of duration based suites.')
+        parser.add_argument('--url',
+                            help='Benchmark a running server instead of '
+                                 'the in-process WSGI app.')
+        parser.add_argument('--output',
+                            help='Write the JSON report to this file.')
+
+    def handle(self, *args, **options):
+        if options['url']:
+            # The server owns its database; seed it through its views.
+            results = SUITES[options['suite']](options)
+        else:
+            with scratch_database():
+                results = SUITES[options['suite']](options)
+        report = json.dumps({
+            'suite': options['suite'],
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'options': {key: options[key] for key in OPTIONS_REPORTED},
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(report + '\n')
+        else:
+            self.stdout.write(report)
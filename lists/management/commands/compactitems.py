@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from lists.compaction import COMPACT_BATCH_SIZE, compact_items
+from lists.routers import on_shard
+from lists.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = ('Move items completed or deleted more than --days ago into the '
+            'archived items table, in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=30,
+                            help='Archive items inactive for this long.')
+        parser.add_argument('--batch-size', type=int,
+                            default=COMPACT_BATCH_SIZE,
+                            help='Items moved per transaction.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        before = timezone.now() - timedelta(days=options['days'])
+        archived = 0
+        for alias in shard_aliases():
+            with on_shard(alias):
+                archived += compact_items(before, options['batch_size'])
+        seconds = time.perf_counter() - start
+        self.stderr.write(f'Archived {archived} items in {seconds:.2f}s.')
@@ -0,0 +1,28 @@
+import gzip
+import io
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from lists.archive import export_lists
+
+
+class Command(BaseCommand):
+    help = 'Export every list and item as NDJSON, gzipped if PATH ends .gz.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archive to write, or '-' for stdout.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['path'] == '-':
+            lists, items = export_lists(sys.stdout)
+        else:
+            opener = gzip.open if options['path'].endswith('.gz') else io.open
+            with opener(options['path'], 'wt', encoding='utf-8') as out:
+                lists, items = export_lists(out)
+        seconds = time.perf_counter() - start
+        self.stderr.write(
+            f'Exported {lists} lists and {items} items in {seconds:.2f}s '
+            f'({(lists + items) / seconds:.0f} rows/s).')
@@ -0,0 +1,35 @@
+import gzip
+import io
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lists.archive import import_lists
+
+
+class Command(BaseCommand):
+    help = 'Import lists and items from an NDJSON archive made by exportlists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archive to read, or '-' for stdin.")
+
+    def handle(self, *args, **options):
+        if settings.LISTS_SHARDS:
+            raise CommandError('Nothing imported: importlists only writes to '
+                               "'default', and lists are sharded.")
+        start = time.perf_counter()
+        try:
+            if options['path'] == '-':
+                lists, items = import_lists(sys.stdin)
+            else:
+                opener = gzip.open if options['path'].endswith('.gz') else io.open
+                with opener(options['path'], 'rt', encoding='utf-8') as lines:
+                    lists, items = import_lists(lines)
+        except ValueError as err:
+            raise CommandError(f'Nothing imported: {err}')
+        seconds = time.perf_counter() - start
+        self.stderr.write(
+            f'Imported {lists} lists and {items} items in {seconds:.2f}s '
+            f'({(lists + items) / seconds:.0f} rows/s).')
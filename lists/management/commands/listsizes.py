@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lists.reports import SIZE_BOUNDS, list_size_histogram
+
+
+def _bounds(text):
+    return tuple(int(bound) for bound in text.split(','))
+
+
+class Command(BaseCommand):
+    help = ('Print how many lists, and active items in them, there are in '
+            'each range of list sizes, as tab-separated rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bounds', type=_bounds, default=SIZE_BOUNDS,
+                            help='Comma-separated smallest sizes of the '
+                                 'ranges, ascending from 0.')
+
+    def handle(self, *args, **options):
+        bounds = options['bounds']
+        if bounds[0] != 0 or list(bounds) != sorted(set(bounds)):
+            raise CommandError('--bounds must ascend from 0.')
+        start = time.perf_counter()
+        histogram = list_size_histogram(bounds)
+        for label, lists, items in histogram:
+            self.stdout.write(f'{label}\t{lists}\t{items}')
+        seconds = time.perf_counter() - start
+        self.stderr.write(
+            f'Counted {sum(row[1] for row in histogram)} lists with '
+            f'{sum(row[2] for row in histogram)} active items in '
+            f'{seconds:.2f}s.')
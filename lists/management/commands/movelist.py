@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lists.models import List
+from lists.sharding import move_list, shard_for
+
+
+class Command(BaseCommand):
+    help = 'Move a list and its items to another shard, keeping its id.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('list_id', type=int)
+        parser.add_argument('shard', help='One of LISTS_SHARDS.')
+
+    def handle(self, *args, **options):
+        if options['shard'] not in settings.LISTS_SHARDS:
+            raise CommandError(f'{options["shard"]!r} is not in LISTS_SHARDS.')
+        source = shard_for(options['list_id'])
+        if source == options['shard']:
+            self.stderr.write(f'List {options["list_id"]} is already on '
+                              f'{source}.')
+            return
+        start = time.perf_counter()
+        try:
+            moved = move_list(options['list_id'], options['shard'])
+        except (List.DoesNotExist, ValueError) as err:
+            raise CommandError(err)
+        seconds = time.perf_counter() - start
+        self.stderr.write(f'Moved list {options["list_id"]} with {moved} '
+                          f'items from {source} to {options["shard"]} in '
+                          f'{seconds:.2f}s.')
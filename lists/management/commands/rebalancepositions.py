@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lists import cache
+from lists.models import REBALANCE_BATCH_SIZE, List
+from lists.routers import on_shard
+from lists.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = ('Give the items of lists marked by move_item fresh, short '
+            'position keys, in batches. Run it periodically, e.g. from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=REBALANCE_BATCH_SIZE,
+                            help='Items rewritten per UPDATE.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        lists = items = 0
+        for alias in shard_aliases():
+            with on_shard(alias):
+                for list_id in list(List.objects.due_for_rebalancing()
+                                    .values_list('id', flat=True)):
+                    items += List(id=list_id).rebalance_positions(
+                        options['batch_size'])
+                    cache.invalidate(list_id)
+                    lists += 1
+        seconds = time.perf_counter() - start
+        self.stderr.write(f'Rebalanced {items} items in {lists} lists in '
+                          f'{seconds:.2f}s.')
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lists.sharding import REBALANCE_TOLERANCE, rebalance, shard_sizes
+
+
+class Command(BaseCommand):
+    help = ('Move lists from the fullest shards to the emptiest until their '
+            'active item counts are within --tolerance of each other.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-moves', type=int, default=100,
+                            help='Lists moved at most.')
+        parser.add_argument('--tolerance', type=float,
+                            default=REBALANCE_TOLERANCE,
+                            help='Largest spread between shards left alone, '
+                                 'as a fraction of the mean shard size.')
+
+    def handle(self, *args, **options):
+        if len(settings.LISTS_SHARDS) < 2:
+            raise CommandError('Lists are not sharded; set SUPERLISTS_SHARDS.')
+        start = time.perf_counter()
+        moves = rebalance(options['max_moves'], options['tolerance'])
+        for list_id, source, target, items in moves:
+            self.stdout.write(f'{list_id}\t{source}\t{target}\t{items}')
+        seconds = time.perf_counter() - start
+        sizes = ', '.join(f'{alias} {items}'
+                          for alias, items in shard_sizes().items())
+        self.stderr.write(f'Moved {len(moves)} lists in {seconds:.2f}s; '
+                          f'active items per shard: {sizes}.')
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lists.seeding import DISTRIBUTIONS, SEED_BATCH_SIZE, seed
+
+
+class Command(BaseCommand):
+    help = ('Add synthetic lists and items, the same ones for the same '
+            '--seed, generated in parallel and bulk inserted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lists', type=int, default=1000,
+                            help='Lists to create.')
+        parser.add_argument('--items', type=int, default=10000,
+                            help='Items to create across all the lists.')
+        parser.add_argument('--distribution', choices=sorted(DISTRIBUTIONS),
+                            default='zipf', help='How items spread over lists.')
+        parser.add_argument('--exponent', type=float, default=1.1,
+                            help='Skew of the zipf distribution.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed; equal seeds give equal data.')
+        parser.add_argument('--workers', type=int,
+                            help='Generator processes (default: one per CPU, '
+                                 '0: none).')
+        parser.add_argument('--batch-size', type=int, default=SEED_BATCH_SIZE,
+                            help='Items generated per worker task.')
+
+    def handle(self, *args, **options):
+        distribution = DISTRIBUTIONS[options['distribution']]
+        kwargs = ({'exponent': options['exponent']}
+                  if options['distribution'] == 'zipf' else {})
+        try:
+            sizes = distribution(options['lists'], options['items'], **kwargs)
+        except ValueError as err:
+            raise CommandError(err)
+        start = time.perf_counter()
+        lists, items = seed(sizes, options['seed'], options['workers'],
+                            options['batch_size'])
+        seconds = time.perf_counter() - start
+        self.stderr.write(
+            f'Seeded {lists} lists and {items} items in {seconds:.2f}s '
+            f'({(lists + items) / seconds:.0f} rows/s).')
@@ -0,0 +1,24 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lists.db import copy_database
+from lists.routers import PRIMARY
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary database over each LISTS_READ_REPLICAS file. '
+            'Run it as often as replicas may lag.')
+
+    def handle(self, *args, **options):
+        if not settings.LISTS_READ_REPLICAS:
+            raise CommandError('No read replicas are configured; set '
+                               'SUPERLISTS_READ_REPLICAS.')
+        start = time.perf_counter()
+        for alias in settings.LISTS_READ_REPLICAS:
+            copy_database(PRIMARY, settings.DATABASES[alias]['NAME'])
+        seconds = time.perf_counter() - start
+        self.stderr.write(f'Copied {PRIMARY} to '
+                          f'{len(settings.LISTS_READ_REPLICAS)} replicas in '
+                          f'{seconds:.2f}s.')
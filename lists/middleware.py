@@ -0,0 +1,152 @@
+"""Per-request query and timing instrumentation.
+
+QueryTimingMiddleware measures, for every request, the number of SQL
+queries, the time spent in them, the time spent rendering templates and the
+wall time. It reports them to the client in a Server-Timing header and keeps
+the most recent samples per URL name, so request_stats() can give rolling
+percentiles for view_list, add_item and so on.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.utils import CursorWrapper
+from django.template.base import Template
+
+from lists.stats import percentile, summarize
+
+SAMPLES_KEPT = 1000  # Most recent requests remembered per URL name.
+
+_samples = defaultdict(lambda: deque(maxlen=SAMPLES_KEPT))
+_samples_lock = threading.Lock()
+_local = threading.local()
+
+
+class _TimedCursor(CursorWrapper):
+    """Add each query's perf_counter() duration to the request being timed
+    on this thread, if any.
+
+    Django's query log keeps durations formatted to the millisecond, so
+    summing it counts most SQLite queries as taking no time at all.
+    """
+
+    def _timed(self, method, *args):
+        timer = getattr(_local, 'sql_timer', None)
+        if timer is None:
+            return method(*args)
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            timer['seconds'] += time.perf_counter() - start
+            timer['queries'] += 1
+
+    def execute(self, sql, params=None):
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(super().executemany, sql, param_list)
+
+
+def _timed_cursors(make_cursor):
+    """Wrap a DatabaseWrapper cursor factory to return _TimedCursors."""
+    def make_timed_cursor(self, cursor):
+        return _TimedCursor(make_cursor(self, cursor), self)
+    make_timed_cursor.timed = True
+    return make_timed_cursor
+
+
+def _timed_render(render):
+    """Wrap Template.render to add outermost render time to the request.
+
+    Included templates render inside their parent, so only the outermost
+    render on this thread is timed.
+    """
+    def timed_render(self, context):
+        timer = getattr(_local, 'template_timer', None)
+        if timer is None or timer['nested']:
+            return render(self, context)
+        timer['nested'] = True
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            timer['seconds'] += time.perf_counter() - start
+            timer['nested'] = False
+    timed_render.timed = True
+    return timed_render
+
+
+class QueryTimingMiddleware:
+    """Record SQL, template and wall time of each request.
+
+    Put it first in MIDDLEWARE so wall time covers the other middleware.
+    Queries are counted and timed by every connection's cursors, on every
+    database, without turning on Django's query log. Rows a
+    StreamingHttpResponse renders after the view returns are not included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(Template.render, 'timed', False):
+            Template.render = _timed_render(Template.render)
+        for name in ('make_cursor', 'make_debug_cursor'):
+            make_cursor = getattr(BaseDatabaseWrapper, name)
+            if not getattr(make_cursor, 'timed', False):
+                setattr(BaseDatabaseWrapper, name, _timed_cursors(make_cursor))
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        _local.template_timer = {'nested': False, 'seconds': 0.0}
+        _local.sql_timer = {'queries': 0, 'seconds': 0.0}
+        try:
+            response = self.get_response(request)
+        finally:
+            sql_timer, _local.sql_timer = _local.sql_timer, None
+            template_seconds = _local.template_timer['seconds']
+            _local.template_timer = None
+
+        sample = {
+            'wall': time.perf_counter() - start,
+            'sql': sql_timer['seconds'],
+            'queries': sql_timer['queries'],
+            'template': template_seconds,
+        }
+        response['Server-Timing'] = (
+            f'sql;dur={sample["sql"] * 1000:.3f};'
+            f'desc="{sample["queries"]} queries", '
+            f'template;dur={sample["template"] * 1000:.3f}, '
+            f'total;dur={sample["wall"] * 1000:.3f}')
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match and match.url_name else 'unresolved'
+        with _samples_lock:
+            _samples[url_name].append(sample)
+        return response
+
+
+def _summarize_counts(counts):
+    ordered = sorted(counts)
+    return {
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'p50': percentile(ordered, 50),
+        'p95': percentile(ordered, 95),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1],
+    }
+
+
+def request_stats():
+    """Return rolling percentiles of the recent requests per URL name."""
+    with _samples_lock:
+        samples = {name: list(kept) for name, kept in _samples.items()}
+    return {
+        name: {
+            'wall': summarize([sample['wall'] for sample in kept]),
+            'sql': summarize([sample['sql'] for sample in kept]),
+            'template': summarize([sample['template'] for sample in kept]),
+            'queries': _summarize_counts([sample['queries']
+                                          for sample in kept]),
+        }
+        for name, kept in samples.items()
+    }
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 05:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def count_existing_items(apps, schema_editor):
+    """Backfill List.item_count with one correlated UPDATE."""
+    List = apps.get_model('lists', 'List')
+    Item = apps.get_model('lists', 'Item')
+    counts = (Item.objects.filter(list=OuterRef('pk')).order_by()
+              .values('list').annotate(count=Count('id')).values('count'))
+    List.objects.update(item_count=Coalesce(
+        Subquery(counts, output_field=models.IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lists', '0004_item_list'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='list',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='list',
+            name='last_modified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['list', 'id'], name='lists_item_list_id_6b2b67_idx'),
+        ),
+        migrations.RunPython(count_existing_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from lists import ranks
+
+
+def rank_existing_items(apps, schema_editor):
+    """Key every existing item in its list's insertion (id) order."""
+    Item = apps.get_model('lists', 'Item')
+    items = Item.objects.order_by('list_id', 'id').values_list('id', 'list_id')
+    current_list = None
+    for item_id, list_id in items.iterator():
+        if list_id != current_list:
+            current_list, positions = list_id, ranks.keys_after(None)
+        Item.objects.filter(id=item_id).update(position=next(positions))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lists', '0006_item_fts'),
+    ]
+
+    operations = [
+        # AddField would rebuild lists_item on SQLite and drop the FTS
+        # triggers of 0006, so the column is added in place instead.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    ["ALTER TABLE lists_item ADD COLUMN position varchar(255) "
+                     "NOT NULL DEFAULT ''"],
+                    # Unapplying leaves the column; its default keeps
+                    # inserts that do not know about it working.
+                    migrations.RunSQL.noop),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='item',
+                    name='position',
+                    field=models.CharField(default='', max_length=255),
+                ),
+            ],
+        ),
+        migrations.RunPython(rank_existing_items, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='item',
+            unique_together=set([('list', 'position')]),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# The first index holds only active rows, so view_list reads stay as cheap
+# as the live part of each list however much history piles up; the second
+# holds only the inactive rows compactitems looks for. SQLite picks a partial
+# index only if the query has the index's condition in the same form, hence
+# status > 0 and not status != 0.
+CREATE_PARTIAL_INDEXES = [
+    'CREATE INDEX lists_item_active_idx ON lists_item (list_id, position) '
+    'WHERE status = 0',
+    'CREATE INDEX lists_item_inactive_idx ON lists_item (status_changed) '
+    'WHERE status > 0',
+]
+
+DROP_PARTIAL_INDEXES = [
+    'DROP INDEX lists_item_inactive_idx',
+    'DROP INDEX lists_item_active_idx',
+]
+
+
+def add_status_columns(apps, schema_editor):
+    """Add the new Item columns with ALTER TABLE.
+
+    AddField would rebuild lists_item on SQLite and drop the FTS triggers
+    of 0006, so only the migration state uses it.
+    """
+    Item = apps.get_model('lists', 'Item')
+    for name in ('status', 'status_changed'):
+        field = Item._meta.get_field(name)
+        definition, params = schema_editor.column_sql(
+            Item, field, include_default=True)
+        definition %= tuple(schema_editor.quote_value(p) for p in params)
+        schema_editor.execute(
+            f'ALTER TABLE {schema_editor.quote_name(Item._meta.db_table)} '
+            f'ADD COLUMN {schema_editor.quote_name(field.column)} {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lists', '0007_item_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedItem',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField(default='')),
+                ('position', models.CharField(default='', max_length=255)),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'active'), (1, 'completed'), (2, 'deleted')])),
+                ('status_changed', models.DateTimeField()),
+                ('archived', models.DateTimeField(default=django.utils.timezone.now)),
+                ('list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='lists.List')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archiveditem',
+            index=models.Index(fields=['list', 'position'], name='lists_archi_list_id_3803c7_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AddField(
+                model_name='item',
+                name='status',
+                field=models.PositiveSmallIntegerField(choices=[(0, 'active'), (1, 'completed'), (2, 'deleted')], default=0),
+            ),
+            migrations.AddField(
+                model_name='item',
+                name='status_changed',
+                field=models.DateTimeField(blank=True, null=True),
+            ),
+        ]),
+        # Unapplying leaves the columns; their defaults keep inserts that do
+        # not know about them working.
+        migrations.RunPython(add_status_columns, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_PARTIAL_INDEXES, DROP_PARTIAL_INDEXES),
+    ]
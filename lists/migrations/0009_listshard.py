@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lists', '0008_item_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListShard',
+            fields=[
+                ('list_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('shard', models.CharField(max_length=100)),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# Holds only the marked lists, so rebalancepositions finds them without
+# reading every list. As with the indexes of 0008, queries must use the
+# condition verbatim; see ListQuerySet.due_for_rebalancing().
+CREATE_PARTIAL_INDEX = [
+    'CREATE INDEX lists_list_rebalance_idx ON lists_list (id) '
+    'WHERE needs_rebalancing = 1',
+]
+
+DROP_PARTIAL_INDEX = [
+    'DROP INDEX lists_list_rebalance_idx',
+]
+
+
+def add_needs_rebalancing_column(apps, schema_editor):
+    """Add the new List column with ALTER TABLE.
+
+    AddField would rebuild lists_list and leave the column without a
+    default, which the raw INSERT of sharding.create_list() relies on.
+    """
+    List = apps.get_model('lists', 'List')
+    field = List._meta.get_field('needs_rebalancing')
+    definition, params = schema_editor.column_sql(
+        List, field, include_default=True)
+    definition %= tuple(schema_editor.quote_value(p) for p in params)
+    schema_editor.execute(
+        f'ALTER TABLE {schema_editor.quote_name(List._meta.db_table)} '
+        f'ADD COLUMN {schema_editor.quote_name(field.column)} {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lists', '0009_listshard'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AddField(
+                model_name='list',
+                name='needs_rebalancing',
+                field=models.BooleanField(default=False),
+            ),
+        ]),
+        # Unapplying leaves the column, as 0008 does its own.
+        migrations.RunPython(add_needs_rebalancing_column,
+                             migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_PARTIAL_INDEX, DROP_PARTIAL_INDEX),
+    ]
@@ -1,10 +1,197 @@
-from django.db import models
+from itertools import islice
+
+from django.db import models, router, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from lists import ranks
+
+BULK_BATCH_SIZE = 500  # Rows per INSERT when adding many items at once.
+# Rows per UPDATE when rebalancing; each takes three SQL parameters, and
+# SQLite allows 999 per statement.
+REBALANCE_BATCH_SIZE = 300
 
 # Create your models here.
 
+class ListQuerySet(models.QuerySet):
+
+    def due_for_rebalancing(self):
+        # Matches the partial lists_list_rebalance_idx index verbatim, as
+        # ItemQuerySet.active() does lists_item_active_idx.
+        return self.extra(
+            where=[f'{self.model._meta.db_table}.needs_rebalancing = 1'])
+
+
 class List(models.Model):
-    pass
+    item_count = models.PositiveIntegerField(default=0)  # Active items only.
+    last_modified = models.DateTimeField(default=timezone.now)
+    # Set by move_item once a key outgrows ranks.MAX_KEY_LENGTH; the
+    # rebalancepositions command gives the list fresh keys and clears it.
+    needs_rebalancing = models.BooleanField(default=False)
+
+    objects = ListQuerySet.as_manager()
+
+    def add_items(self, texts):
+        """Insert an iterable of item texts with batched bulk_create.
+
+        `texts` is consumed lazily, one batch at a time, so it may be a
+        generator over a request body of any size. Returns the number of
+        items inserted. Callers wanting all-or-nothing should wrap this in
+        transaction.atomic().
+
+        Each batch is counted before anything is read. In a transaction the
+        UPDATE takes SQLite's write lock first; reading the last position
+        first would leave a read lock to upgrade, which fails at once with
+        "database is locked" rather than waiting if another writer holds
+        the lock.
+        """
+        texts = iter(texts)
+        positions = None
+        inserted = 0
+        while True:
+            batch = [Item(text=text, list=self)
+                     for text in islice(texts, BULK_BATCH_SIZE)]
+            if not batch:
+                break
+            self.record_new_items(len(batch))
+            if positions is None:
+                positions = self.new_positions()
+            for item, position in zip(batch, positions):
+                item.position = position
+            Item.objects.bulk_create(batch)
+            inserted += len(batch)
+        return inserted
+
+    def record_new_items(self, count):
+        """Bump item_count and last_modified with one atomic UPDATE.
+
+        The F() expression is evaluated by the database, so concurrent
+        writers to the same list cannot lose each other's increments.
+        """
+        List.objects.filter(id=self.id).update(
+            item_count=F('item_count') + count,
+            last_modified=timezone.now())
+
+    def new_positions(self, using=None):
+        """Yield position keys that sort after this list's last item."""
+        last = (Item.objects.using(using).filter(list_id=self.id)
+                .order_by('-position').values_list('position', flat=True)
+                .first())
+        return ranks.keys_after(last)
+
+    def rebalance_positions(self, batch_size=None):
+        """Give every item a fresh, short position key in its current order,
+        and clear needs_rebalancing. Returns the number of items rewritten.
+
+        This rewrites every row of the list, so the rebalancepositions
+        command does it only for lists whose moves have grown some key past
+        ranks.MAX_KEY_LENGTH. The new keys follow the current last one, so
+        they never collide with old ones, and each UPDATE sets a batch of
+        rows. The list's write lock is held throughout, taken first as in
+        add_items().
+        """
+        batch_size = batch_size or REBALANCE_BATCH_SIZE
+        items = Item.objects.filter(list_id=self.id)
+        with transaction.atomic(using=router.db_for_write(Item)):
+            List.objects.filter(id=self.id).update(
+                needs_rebalancing=False, last_modified=timezone.now())
+            ids = list(items.order_by('position').values_list('id', flat=True))
+            positions = self.new_positions()
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                items.filter(id__in=batch).update(position=Case(
+                    *(When(id=item_id, then=Value(position))
+                      for item_id, position in zip(batch, positions)),
+                    output_field=models.CharField()))
+        return len(ids)
+
+class ItemQuerySet(models.QuerySet):
+    # SQLite picks a partial index only if the query has the index's WHERE
+    # term with the same literal, not a bound parameter, so these match the
+    # lists_item_active_idx and lists_item_inactive_idx indexes verbatim.
+
+    def active(self):
+        return self.extra(where=[f'{self.model._meta.db_table}.status = 0'])
+
+    def inactive(self):
+        return self.extra(where=[f'{self.model._meta.db_table}.status > 0'])
+
 
 class Item(models.Model):
+    ACTIVE, COMPLETED, DELETED = 0, 1, 2
+    STATUSES = [(ACTIVE, 'active'), (COMPLETED, 'completed'),
+                (DELETED, 'deleted')]
+
     text = models.TextField(default='')
     list = models.ForeignKey(List, default=None)
+    # A lists.ranks key; items show in position order within their list.
+    position = models.CharField(max_length=255, default='')
+    # Completed and deleted items stay in place until compactitems archives
+    # them. Partial indexes on status = 0 (see migration 0008) keep reads of
+    # the active items from touching them.
+    status = models.PositiveSmallIntegerField(choices=STATUSES, default=ACTIVE)
+    status_changed = models.DateTimeField(null=True, blank=True)
+
+    objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        # (list, position) is unique, and its index serves "items of a list
+        # in display order" without a sort or a scan of other lists' rows.
+        unique_together = [('list', 'position')]
+        # Serves "items of a list in insertion order", e.g. for new items.
+        indexes = [models.Index(fields=['list', 'id'])]
+
+    def save(self, *args, **kwargs):
+        """Append the item to the end of its list unless it has a position."""
+        if not self.position:
+            using = kwargs.get('using') or router.db_for_write(
+                Item, instance=self)
+            self.position = next(List(id=self.list_id).new_positions(using))
+        super().save(*args, **kwargs)
+
+    def set_status(self, status):
+        """Complete or delete the item, returning False if it already was.
+
+        Each step is a conditional UPDATE, so concurrent requests cannot
+        take the same item out of its list's item_count twice. Completed
+        items may still be deleted; neither can become active again.
+        """
+        now = timezone.now()
+        items = Item.objects.filter(id=self.id)
+        with transaction.atomic(using=router.db_for_write(Item)):
+            if items.filter(status=Item.ACTIVE).update(status=status,
+                                                       status_changed=now):
+                List.objects.filter(id=self.list_id).update(
+                    item_count=F('item_count') - 1, last_modified=now)
+            elif not (status == Item.DELETED and
+                      items.filter(status=Item.COMPLETED).update(
+                          status=status, status_changed=now)):
+                return False
+        self.status, self.status_changed = status, now
+        return True
+
+
+class ArchivedItem(models.Model):
+    """A completed or deleted item moved out of lists_item by compactitems.
+
+    It keeps the id, position and status it had as an Item.
+    """
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField(default='')
+    list = models.ForeignKey(List)
+    position = models.CharField(max_length=255, default='')
+    status = models.PositiveSmallIntegerField(choices=Item.STATUSES)
+    status_changed = models.DateTimeField()
+    archived = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['list', 'position'])]
+
+
+class ListShard(models.Model):
+    """The shard a list was moved to, if not the one its id comes from.
+
+    Kept in the 'default' database only; see lists.sharding.
+    """
+    list_id = models.BigIntegerField(primary_key=True)
+    shard = models.CharField(max_length=100)
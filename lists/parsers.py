@@ -0,0 +1,90 @@
+"""Incremental parsers for item batches posted to the bulk endpoint.
+
+Both parsers read a file-like object and yield item texts as they are
+decoded, so a batch never has to fit in memory at once. The bulk endpoint
+gives them the request body spooled by spool(), so they run at disk speed
+rather than at the pace of the client's upload.
+"""
+import codecs
+import json
+import shutil
+import tempfile
+
+from django.conf import settings
+
+READ_SIZE = 64 * 1024  # Bytes read from the request per step.
+
+
+def spool(stream):
+    """Copy all of `stream` to a temporary file and return it rewound.
+
+    Bodies up to FILE_UPLOAD_MAX_MEMORY_SIZE stay in memory, as Django keeps
+    uploaded files; larger ones go to disk in FILE_UPLOAD_TEMP_DIR.
+    """
+    spooled = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        dir=settings.FILE_UPLOAD_TEMP_DIR)
+    shutil.copyfileobj(stream, spooled, READ_SIZE)
+    spooled.seek(0)
+    return spooled
+
+
+def iter_lines(stream):
+    """Yield each non-blank line of a newline separated body."""
+    for line in stream:
+        text = line.decode('utf-8').rstrip('\r\n')
+        if text.strip():
+            yield text
+
+
+def iter_json_strings(stream):
+    """Yield the strings of a JSON array body, e.g. ["milk", "eggs"].
+
+    Raises ValueError if the body is not a flat array of strings.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf, pos, eof = '', 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = stream.read(READ_SIZE)
+        eof = not chunk
+        buf = buf[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+    def next_token():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                raise ValueError('Unexpected end of JSON array')
+            fill()
+
+    if next_token() != '[':
+        raise ValueError('Expected a JSON array')
+    pos += 1
+    if next_token() == ']':
+        return
+    while True:
+        next_token()
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError('Malformed JSON array')
+            fill()
+            continue
+        if not isinstance(value, str):
+            raise ValueError('Array items must be strings')
+        pos = end
+        yield value
+        token = next_token()
+        pos += 1
+        if token == ']':
+            return
+        if token != ',':
+            raise ValueError('Expected "," or "]" in JSON array')
@@ -0,0 +1,59 @@
+"""In-process notifications of new items, per list.
+
+Writers call publish(list_id) once their items are committed; every open
+event stream of that list (see views.list_events) wakes up and reads the
+items it has not sent yet. Notifications carry no data, so a missed or
+merged one only delays delivery until the stream's next poll.
+"""
+import threading
+from collections import defaultdict
+
+_subscriptions = defaultdict(set)
+_lock = threading.Lock()
+
+
+class Subscription:
+
+    def __init__(self, list_id):
+        self.list_id = list_id
+        self._event = threading.Event()
+
+    def notify(self):
+        self._event.set()
+
+    def clear(self):
+        """Forget past notifications; call before reading new items."""
+        self._event.clear()
+
+    def wait(self, timeout):
+        """Wait for a notification; return False if `timeout` passed first.
+
+        Returns at once if notified since the last clear(), so nothing
+        published while the items were being read is missed.
+        """
+        return self._event.wait(timeout)
+
+    def close(self):
+        with _lock:
+            _subscriptions[self.list_id].discard(self)
+            if not _subscriptions[self.list_id]:
+                del _subscriptions[self.list_id]
+
+
+def subscribe(list_id):
+    subscription = Subscription(int(list_id))
+    with _lock:
+        _subscriptions[subscription.list_id].add(subscription)
+    return subscription
+
+
+def publish(list_id):
+    with _lock:
+        subscriptions = list(_subscriptions.get(int(list_id), ()))
+    for subscription in subscriptions:
+        subscription.notify()
+
+
+def subscriber_count(list_id):
+    with _lock:
+        return len(_subscriptions.get(int(list_id), ()))
@@ -0,0 +1,151 @@
+"""Lexicographic rank keys for ordering the items of a list.
+
+A key is an integer part followed by an optional fraction, both written in
+base 62 with digits that sort in ASCII order. The head character of the
+integer part encodes its length ('a' is one digit, 'b' two, ... and 'Z',
+'Y', ... the same for negative integers), so keys compare correctly as plain
+strings and appending n keys only makes them O(log n) characters long.
+
+There is always a key strictly between two others, so moving an item
+rewrites that item's key alone. Repeated moves into the same gap lengthen
+the fraction by about one character per six moves; once a key is longer
+than MAX_KEY_LENGTH the list should be rebalanced with fresh keys.
+"""
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+FIRST_KEY = 'a0'
+SMALLEST_INTEGER = 'A' + DIGITS[0] * 26
+MAX_KEY_LENGTH = 32  # Longer keys mean the list is due for rebalancing.
+
+
+def _integer_length(head):
+    if 'a' <= head <= 'z':
+        return ord(head) - ord('a') + 2
+    if 'A' <= head <= 'Z':
+        return ord('Z') - ord(head) + 2
+    raise ValueError(f'invalid rank key head {head!r}')
+
+
+def _split(key):
+    """Return the (integer, fraction) parts of `key`."""
+    if not key:
+        raise ValueError('empty rank key')
+    length = _integer_length(key[0])
+    integer, fraction = key[:length], key[length:]
+    if len(integer) < length or fraction.endswith(DIGITS[0]):
+        raise ValueError(f'invalid rank key {key!r}')
+    return integer, fraction
+
+
+def is_valid(key):
+    try:
+        _split(key)
+    except ValueError:
+        return False
+    return all(char in DIGITS for char in key[1:])
+
+
+def _increment(integer):
+    """Return the next integer part, or None past the largest one."""
+    last = integer[-1]
+    if last != DIGITS[-1]:  # No carry, as for all but 1 in 62 appends.
+        return integer[:-1] + DIGITS[DIGITS.index(last) + 1]
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) + 1
+        if value < BASE:
+            digits[i] = DIGITS[value]
+            return head + ''.join(digits)
+        digits[i] = DIGITS[0]
+    if head == 'Z':
+        return FIRST_KEY
+    if head == 'z':
+        return None
+    head = chr(ord(head) + 1)
+    if head > 'a':
+        digits.append(DIGITS[0])
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+
+def _decrement(integer):
+    """Return the previous integer part, or None below the smallest one."""
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) - 1
+        if value >= 0:
+            digits[i] = DIGITS[value]
+            return head + ''.join(digits)
+        digits[i] = DIGITS[-1]
+    if head == 'a':
+        return 'Z' + DIGITS[-1]
+    if head == 'A':
+        return None
+    head = chr(ord(head) - 1)
+    if head < 'Z':
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+
+def _midpoint(low, high):
+    """Return a fraction strictly between fractions `low` and `high`.
+
+    `high` of None stands for 1. Neither argument has trailing zeros, and
+    neither does the result.
+    """
+    prefix = ''
+    while high is not None:
+        low_digit = low[0] if low else DIGITS[0]
+        if low_digit != high[0]:
+            break
+        prefix += low_digit
+        low, high = low[1:], high[1:]
+    low_value = DIGITS.index(low[0]) if low else 0
+    high_value = DIGITS.index(high[0]) if high is not None else BASE
+    if high_value - low_value > 1:
+        return prefix + DIGITS[(low_value + high_value) // 2]
+    if high is not None and len(high) > 1:
+        return prefix + high[0]
+    return prefix + DIGITS[low_value] + _midpoint(low[1:], None)
+
+
+def between(before, after):
+    """Return a key that sorts strictly between `before` and `after`.
+
+    Either may be None for the start or end of the list.
+    """
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f'{before!r} does not sort before {after!r}')
+    if before is None and after is None:
+        return FIRST_KEY
+    if before is None:
+        integer, fraction = _split(after)
+        if integer == SMALLEST_INTEGER:
+            return integer + _midpoint('', fraction)
+        if fraction:
+            return integer
+        previous = _decrement(integer)
+        if previous is None:
+            raise ValueError('no rank key sorts before the smallest one')
+        return previous
+    integer, fraction = _split(before)
+    if after is None:
+        following = _increment(integer)
+        return following or integer + _midpoint(fraction, None)
+    after_integer, after_fraction = _split(after)
+    if integer == after_integer:
+        return integer + _midpoint(fraction, after_fraction)
+    following = _increment(integer)
+    if following is not None and following < after:
+        return following
+    return integer + _midpoint(fraction, None)
+
+
+def keys_after(key):
+    """Yield an endless run of increasing keys following `key` (or None)."""
+    while True:
+        key = between(key, None)
+        yield key
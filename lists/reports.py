@@ -0,0 +1,43 @@
+"""Reports over every list, computed by the database in one pass.
+
+The listsizes command prints list_size_histogram(). It aggregates the
+List.item_count column, so it reads the lists table but never the far
+larger items table.
+"""
+from django.db.models import Case, Count, IntegerField, Sum, Value, When
+
+from lists import routers
+from lists.models import List
+from lists.sharding import shard_aliases
+
+SIZE_BOUNDS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # Bucket starts.
+
+
+def _label(low, high):
+    if high is None:
+        return f'{low}+'
+    return str(low) if high == low + 1 else f'{low}-{high - 1}'
+
+
+def list_size_histogram(bounds=SIZE_BOUNDS):
+    """Count the lists, and their active items, in each size bucket.
+
+    `bounds` are the ascending smallest sizes of the buckets, starting at 0;
+    the last bucket has no upper bound. Returns (label, lists, items) per
+    bucket, from one GROUP BY query per shard.
+    """
+    bucket = Case(*[When(item_count__lt=high, then=Value(number))
+                    for number, high in enumerate(bounds[1:])],
+                  default=Value(len(bounds) - 1), output_field=IntegerField())
+    totals = [[0, 0] for _ in bounds]
+    for alias in shard_aliases():
+        with routers.on_shard(alias):
+            rows = (List.objects.annotate(bucket=bucket).order_by()
+                    .values_list('bucket')
+                    .annotate(lists=Count('id'), items=Sum('item_count')))
+            for number, lists, items in rows:
+                totals[number][0] += lists
+                totals[number][1] += items
+    highs = list(bounds[1:]) + [None]
+    return [(_label(low, high), lists, items)
+            for low, high, (lists, items) in zip(bounds, highs, totals)]
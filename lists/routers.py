@@ -0,0 +1,135 @@
+"""Database routing for the lists app: shards, and read replicas.
+
+With LISTS_SHARDS set, ShardRouter sends list and item queries to the
+shard chosen for the current thread by use_shard(); see lists.sharding for
+how lists are placed. Otherwise ReplicaRouter applies.
+
+LISTS_READ_REPLICAS names the DATABASES aliases holding copies of
+'default'. Only requests that ReplicaPinningMiddleware marks as read-only
+have their reads spread over the replicas: anything else, such as management
+commands, the write coalescing thread or a POST that reads what it just
+wrote, reads from the primary. A client that has just written is pinned to
+the primary for LISTS_PIN_SECONDS by a cookie, so the page it is redirected
+to shows its own write however far the replicas lag.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'lists_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+
+
+def reads_use_replicas():
+    """Return whether this thread's list reads may go to a replica."""
+    return getattr(_local, 'use_replicas', False)
+
+
+def current_shard():
+    """Return the shard this thread's list queries go to, or None."""
+    return getattr(_local, 'shard', None)
+
+
+def use_shard(alias):
+    """Send this thread's list queries to shard `alias` (None: unsharded)."""
+    _local.shard = alias
+
+
+@contextmanager
+def on_shard(alias):
+    """Send list queries to shard `alias` inside the block."""
+    previous = current_shard()
+    use_shard(alias)
+    try:
+        yield alias
+    finally:
+        use_shard(previous)
+
+
+def reset_routing(sender=None, **kwargs):
+    """Send this thread's queries back to the primary.
+
+    Connected to request_finished in ListsConfig.ready(), which fires once a
+    response, streamed or not, has been sent.
+    """
+    _local.use_replicas = False
+    _local.shard = None
+
+
+def _is_sharded(model):
+    return (model._meta.app_label == 'lists'
+            and model._meta.model_name != 'listshard')
+
+
+class ShardRouter:
+    """Route the lists app to the current shard, and the shard directory
+    to the primary. Defers to the next router when nothing is sharded.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.LISTS_SHARDS:
+            return None
+        if not _is_sharded(model):
+            return PRIMARY if model._meta.app_label == 'lists' else None
+        return current_shard()
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'lists' and model_name == 'listshard':
+            return db == PRIMARY
+        return None
+
+
+class ReplicaRouter:
+    """Route the lists app's reads to a random replica when allowed."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'lists':
+            return None
+        replicas = settings.LISTS_READ_REPLICAS
+        if replicas and reads_use_replicas():
+            return random.choice(replicas)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        # Not None: Django would write an instance back where it was read.
+        return PRIMARY if model._meta.app_label == 'lists' else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        copies = {PRIMARY, *settings.LISTS_READ_REPLICAS}
+        if obj1._state.db in copies and obj2._state.db in copies:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, schema and all.
+        return False if db in settings.LISTS_READ_REPLICAS else None
+
+
+class ReplicaPinningMiddleware:
+    """Let read-only requests read from replicas unless the client is pinned.
+
+    A successful unsafe request sets a cookie that keeps the client's reads
+    on the primary for LISTS_PIN_SECONDS. Does nothing without replicas.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.LISTS_READ_REPLICAS:
+            return self.get_response(request)
+        safe = request.method in SAFE_METHODS
+        _local.use_replicas = safe and PIN_COOKIE not in request.COOKIES
+        response = self.get_response(request)
+        if not safe and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.LISTS_PIN_SECONDS,
+                                httponly=True)
+        return response
@@ -0,0 +1,141 @@
+"""Full-text search over item text.
+
+Where SQLite has FTS5, migration 0006 maintains lists_item_fts, an inverted
+index over Item.text, and search() answers from it ranked by bm25. On other
+databases it falls back to an unranked icontains scan. With sharded lists,
+search() asks every shard and merges their results.
+"""
+import heapq
+import re
+from contextlib import contextmanager
+from itertools import islice
+
+from django.db import connections
+
+from lists.models import Item
+from lists.sharding import shard_aliases
+
+RESULTS_PER_PAGE = 20
+MAX_PAGE = 500  # Deepest page served; past it the OFFSET grows unbounded.
+
+_fts_tables = {}  # Database alias -> whether lists_item_fts exists there.
+
+
+def has_fts(alias='default'):
+    if alias not in _fts_tables:
+        connection = connections[alias]
+        _fts_tables[alias] = (
+            connection.vendor == 'sqlite'
+            and 'lists_item_fts' in connection.introspection.table_names())
+    return _fts_tables[alias]
+
+
+@contextmanager
+def index_rebuilt_after(alias='default'):
+    """Drop the triggers that index each new item, and rebuild the whole
+    index once on exit instead.
+
+    A single rebuild is several times faster than a trigger per row when
+    bulk loading, but it re-reads every item, so it pays off when loading
+    into an empty or small table. Use inside a transaction so the triggers
+    are never missing for anyone else.
+    """
+    if not has_fts(alias):
+        yield
+        return
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+            "AND tbl_name = %s AND name LIKE 'lists_item_fts_%%'",
+            [Item._meta.db_table])
+        triggers = cursor.fetchall()
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER {name}')
+        yield
+        for _, sql in triggers:
+            cursor.execute(sql)
+        cursor.execute(
+            "INSERT INTO lists_item_fts(lists_item_fts) VALUES ('rebuild')")
+
+
+def fts_query(words):
+    """Build an FTS5 query matching every one of `words`.
+
+    Each word is quoted as a string, so nothing the user typed is parsed as
+    an FTS5 operator.
+    """
+    return ' '.join('"{}"'.format(word) for word in words)
+
+
+def search(text, page=1, alias=None):
+    """Return one page of (item id, list id, text) matches for `text`.
+
+    Matches contain every word of `text`, best bm25 rank first when the
+    FTS5 index is available. Every shard is searched unless `alias` is
+    given. Pages past MAX_PAGE are empty.
+    """
+    words = re.findall(r'\w+', text)
+    if not words or page > MAX_PAGE:
+        return []
+    offset = (max(page, 1) - 1) * RESULTS_PER_PAGE
+    aliases = [alias] if alias else shard_aliases()
+    if len(aliases) > 1:
+        return _search_shards(words, offset, aliases)
+    if has_fts(aliases[0]):
+        return search_index(words, offset, aliases[0])
+    return search_scan(words, offset, aliases[0])
+
+
+def _ranked_matches(words, limit, alias):
+    """Return the first `limit` (rank, item id, list id, text) matches on
+    `alias`, where ranks sort best first: bm25, else the item id.
+    """
+    if not has_fts(alias):
+        items = Item.objects.using(alias).active()
+        for word in words:
+            items = items.filter(text__icontains=word)
+        return [(row[0],) + row for row in items.order_by('id')
+                .values_list('id', 'list_id', 'text')[:limit]]
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'SELECT lists_item_fts.rank, item.id, item.list_id, item.text '
+            'FROM lists_item_fts JOIN lists_item AS item '
+            'ON item.id = lists_item_fts.rowid '
+            'WHERE lists_item_fts MATCH %s AND item.status = %s '
+            'ORDER BY lists_item_fts.rank LIMIT %s',
+            [fts_query(words), Item.ACTIVE, limit])
+        return cursor.fetchall()
+
+
+def _search_shards(words, offset, aliases):
+    """Merge the best matches of every shard into one page.
+
+    Each shard returns all its matches up to the end of the page, so deep
+    pages cost more. bm25 ranks from different shards are comparable as
+    long as lists are spread evenly enough for the shards' word statistics
+    to be alike.
+    """
+    limit = offset + RESULTS_PER_PAGE
+    merged = heapq.merge(*(_ranked_matches(words, limit, alias)
+                           for alias in aliases))
+    return [match[1:] for match in islice(merged, offset, limit)]
+
+
+def search_index(words, offset, alias='default'):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'SELECT item.id, item.list_id, item.text '
+            'FROM lists_item_fts JOIN lists_item AS item '
+            'ON item.id = lists_item_fts.rowid '
+            'WHERE lists_item_fts MATCH %s AND item.status = %s '
+            'ORDER BY lists_item_fts.rank LIMIT %s OFFSET %s',
+            [fts_query(words), Item.ACTIVE, RESULTS_PER_PAGE, offset])
+        return cursor.fetchall()
+
+
+def search_scan(words, offset, alias='default'):
+    items = Item.objects.using(alias).active()
+    for word in words:
+        items = items.filter(text__icontains=word)
+    return list(items.order_by('id').values_list('id', 'list_id', 'text')
+                [offset:offset + RESULTS_PER_PAGE])
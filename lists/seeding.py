@@ -0,0 +1,146 @@
+"""Deterministic synthetic lists and items for benchmarks and tests.
+
+List sizes follow a chosen distribution and the items of each batch of
+lists come from a random.Random seeded with (seed, first list number), so a
+given seed and batch size always produce the same database however many
+workers share the work. Worker
+processes generate the rows and the calling process writes them with
+executemany() in one transaction: SQLite allows a single writer anyway, so
+the parallelism goes where it helps, into building the rows. The search
+index is rebuilt once at the end rather than row by row.
+"""
+import multiprocessing
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from lists import ranks
+
+SEED_BATCH_SIZE = 20000  # Items generated per worker task.
+WORDS = ('buy', 'call', 'clean', 'fix', 'book', 'pay', 'email', 'plan',
+         'milk', 'eggs', 'bread', 'peacock', 'feathers', 'fly', 'net',
+         'garden', 'car', 'dentist', 'tickets', 'report', 'taxes', 'gym',
+         'birthday', 'present', 'laundry', 'rent', 'review', 'draft',
+         'meeting', 'holiday')
+
+
+def zipf_sizes(lists, items, exponent=1.1):
+    """Split `items` over `lists` lists, the nth largest getting a share
+    proportional to 1 / n ** exponent. Every list gets at least one item.
+    """
+    if items < lists:
+        raise ValueError('need at least one item per list')
+    weights = [1 / rank ** exponent for rank in range(1, lists + 1)]
+    total = sum(weights)
+    spare = items - lists
+    sizes = [1 + int(spare * weight / total) for weight in weights]
+    for rank in range(items - sum(sizes)):
+        sizes[rank % lists] += 1
+    return sizes
+
+
+def uniform_sizes(lists, items):
+    """Split `items` over `lists` lists as evenly as possible."""
+    if items < lists:
+        raise ValueError('need at least one item per list')
+    share, extra = divmod(items, lists)
+    return [share + (number < extra) for number in range(lists)]
+
+
+DISTRIBUTIONS = {'zipf': zipf_sizes, 'uniform': uniform_sizes}
+
+
+_first_keys = []  # The position keys of a new list's items, as far as needed.
+
+
+def _positions(count):
+    if len(_first_keys) < count:
+        last = _first_keys[-1] if _first_keys else None
+        _first_keys.extend(islice(ranks.keys_after(last),
+                                  count - len(_first_keys)))
+    return _first_keys[:count]
+
+
+def _generate(task):
+    """Return the (text, list id, position) rows of one task's lists."""
+    seed, first_number, lists = task
+    rows = []
+    words = random.Random(f'{seed}:{first_number}').choices
+    for list_id, size in lists:
+        text = words(WORDS, k=2 * size)
+        rows.extend(zip([f'{text[2 * n]} {text[2 * n + 1]} {n}'
+                         for n in range(size)],
+                        repeat(list_id), _positions(size)))
+    return rows
+
+
+def _tasks(seed, first_id, sizes, batch_size):
+    """Yield (seed, first list number, [(list id, size)...]) tasks of
+    about `batch_size` items each.
+    """
+    first_number, lists, pending = 0, [], 0
+    for number, size in enumerate(sizes):
+        lists.append((first_id + number, size))
+        pending += size
+        if pending >= batch_size:
+            yield seed, first_number, lists
+            first_number, lists, pending = number + 1, [], 0
+    if lists:
+        yield seed, first_number, lists
+
+
+def _generated(tasks, workers):
+    """Yield the rows of each task in order, generated by `workers`
+    processes that keep at most two tasks each ahead of the caller.
+    """
+    if workers == 0 or multiprocessing.current_process().daemon:
+        # Daemonic processes, e.g. parallel test runners, cannot fork.
+        yield from map(_generate, tasks)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_generate, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def seed(sizes, seed=0, workers=None, batch_size=None):
+    """Create one list per entry of `sizes` with that many items.
+
+    List ids follow the highest existing one. `workers` processes generate
+    the items (the default is one per CPU; 0 generates in this process).
+    Returns the number of (lists, items) created.
+    """
+    # Imported here so spawned workers, which only generate, need no setup.
+    from lists.models import Item, List
+    from lists.search import index_rebuilt_after
+
+    batch_size = batch_size or SEED_BATCH_SIZE
+    sizes = list(sizes)
+    random.Random(seed).shuffle(sizes)
+    ops = connection.ops
+    with transaction.atomic(), index_rebuilt_after(), \
+            connection.cursor() as cursor:
+        cursor.execute(f'SELECT MAX(id) FROM {List._meta.db_table}')
+        first_id = (cursor.fetchone()[0] or 0) + 1
+        now = ops.adapt_datetimefield_value(timezone.now())
+        cursor.executemany(
+            f'INSERT INTO {List._meta.db_table} '
+            '(id, item_count, last_modified) VALUES (%s, %s, %s)',
+            [(first_id + number, size, now)
+             for number, size in enumerate(sizes)])
+        insert = (f'INSERT INTO {Item._meta.db_table} '
+                  '(text, list_id, position, status) VALUES (%s, %s, %s, 0)')
+        for rows in _generated(_tasks(seed, first_id, sizes, batch_size),
+                               workers):
+            cursor.executemany(insert, rows)
+    return len(sizes), sum(sizes)
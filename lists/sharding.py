@@ -0,0 +1,256 @@
+"""Partitioning of lists and their items across several databases.
+
+LISTS_SHARDS names the DATABASES aliases that hold lists, or is empty when
+everything is in 'default'. Shard n hands out list and item ids in the
+range [n << SHARD_ID_BITS, (n + 1) << SHARD_ID_BITS), so ids are unique
+across shards without a shared counter, and a list's id says which shard
+it was created on. A shard's place in LISTS_SHARDS is part of its ids, so
+only ever append to it, and put the database the lists already live in
+first: their ids are shard 0 ids.
+
+move_list() (see the movelist and rebalanceshards commands) moves a list
+to another shard under the same id. The ListShard directory in 'default'
+records where moved lists went, and shard_for() checks it once per request.
+
+Request handling picks the shard through sharded_by_list and new_list.
+The seed and importlists commands only touch 'default', and importlists
+refuses to run while LISTS_SHARDS is set; exportlists reads every shard.
+"""
+import random
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from lists import cache, routers
+from lists.models import ArchivedItem, Item, List, ListShard
+
+SHARD_ID_BITS = 40  # Ids per shard; SQLite integers are 64 bits.
+MOVE_BATCH_SIZE = 500  # Rows per INSERT when copying a list to its new shard.
+REBALANCE_TOLERANCE = 0.1  # Spread of shard sizes rebalance() leaves alone.
+
+
+def shard_aliases():
+    """Return the aliases holding lists: every shard, or just 'default'."""
+    return list(settings.LISTS_SHARDS) or [routers.PRIMARY]
+
+
+def _id_range(alias):
+    number = settings.LISTS_SHARDS.index(alias)
+    return number << SHARD_ID_BITS, (number + 1) << SHARD_ID_BITS
+
+
+def home_shard(list_id):
+    """Return the shard list `list_id` was created on, or None."""
+    number = int(list_id) >> SHARD_ID_BITS
+    shards = settings.LISTS_SHARDS
+    return shards[number] if number < len(shards) else None
+
+
+def shard_for(list_id):
+    """Return the shard holding list `list_id`, or None if lists are not
+    sharded. Costs one primary key lookup in the ListShard directory.
+    """
+    if not settings.LISTS_SHARDS:
+        return None
+    moved = (ListShard.objects.filter(list_id=list_id)
+             .values_list('shard', flat=True).first())
+    return moved or home_shard(list_id)
+
+
+def pick_shard():
+    """Return a random shard for a new list, or None if not sharded."""
+    shards = settings.LISTS_SHARDS
+    return random.choice(shards) if shards else None
+
+
+def sharded_by_list(view):
+    """Run `view(request, list_id, ...)` on the shard holding the list.
+
+    The shard is selected for the thread running the view until the
+    request finishes. The body of a streamed response may be produced on
+    other threads (superlists/asgi.py pulls each chunk on whichever pool
+    thread is free), so such views pass routers.current_shard() to their
+    generators, which select it with routers.on_shard() around each query.
+    """
+    @wraps(view)
+    def sharded_view(request, list_id, *args, **kwargs):
+        routers.use_shard(shard_for(list_id))
+        return view(request, list_id, *args, **kwargs)
+    return sharded_view
+
+
+def create_list():
+    """Create an empty List on the current shard, with an id from its range.
+
+    The id is one past both the shard's highest list id in its range and
+    the shard's AUTOINCREMENT counter for lists, which records every id the
+    shard has handed out: the id of a list moved off the shard is not
+    handed out again. The INSERT allocates it, so concurrent writers on the
+    shard cannot be given the same one.
+    """
+    alias = routers.current_shard()
+    if alias is None:
+        return List.objects.create()
+    low, high = _id_range(alias)
+    now = timezone.now()
+    table = List._meta.db_table
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (id, item_count, last_modified) '
+            'SELECT MAX(COALESCE(MAX(id), %s), COALESCE('
+            '(SELECT seq FROM sqlite_sequence WHERE name = %s '
+            'AND seq > %s AND seq < %s), %s)) + 1, 0, %s '
+            f'FROM {table} WHERE id > %s AND id < %s',
+            [low, table, low, high, low,
+             connection.ops.adapt_datetimefield_value(now), low, high])
+        new_list = List(id=cursor.lastrowid, last_modified=now)
+    new_list._state.adding, new_list._state.db = False, alias
+    return new_list
+
+
+def reserve_id_range(sender=None, using=routers.PRIMARY, **kwargs):
+    """Keep shard `using`'s list and item ids inside its id range.
+
+    Connected to post_migrate in ListsConfig.ready(), so migrating a new
+    shard prepares it: each table's AUTOINCREMENT counter starts at the
+    bottom of the range. Items never move between shards with their ids,
+    and move_list() puts the counter back after moving a list in, so the
+    counters stay inside the range from then on. One that a moved-in list
+    did push past the range is brought back to the highest id in it.
+    """
+    if sender is not None and sender.name != 'lists':
+        return
+    if using not in settings.LISTS_SHARDS:
+        return
+    low, high = _id_range(using)
+    with connections[using].cursor() as cursor:
+        for table in (List._meta.db_table, Item._meta.db_table):
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s '
+                           'WHERE name = %s AND seq < %s', [low, table, low])
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = '
+                f'(SELECT COALESCE(MAX(id), %s) FROM {table} '
+                'WHERE id > %s AND id < %s) '
+                'WHERE name = %s AND seq >= %s',
+                [low, low, high, table, high])
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) '
+                           'SELECT %s, %s WHERE NOT EXISTS '
+                           '(SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                           [table, low, table])
+
+
+@contextmanager
+def _list_ids_kept(alias):
+    """Leave shard `alias`'s list AUTOINCREMENT counter as it was.
+
+    Inserting a list under an id from a later shard's range would raise the
+    counter past the shard's range, and create_list() would lose track of
+    the ids it has handed out. Use inside a transaction on `alias`.
+    """
+    table = List._meta.db_table
+    with connections[alias].cursor() as cursor:
+        # Writing first takes the write lock before the read.
+        cursor.execute('UPDATE sqlite_sequence SET seq = seq WHERE name = %s',
+                       [table])
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s',
+                       [table])
+        row = cursor.fetchone()
+    yield
+    with connections[alias].cursor() as cursor:
+        cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s',
+                       [row[0] if row else _id_range(alias)[0], table])
+
+
+def move_list(list_id, target):
+    """Move list `list_id` with all its items to shard `target`, keeping
+    the list's id. Returns the number of items moved.
+
+    Items get new ids on the target; archived items keep theirs. The
+    source shard's write lock is taken first and held until the source rows
+    are gone, so no item can be added to the list in between. Writers to
+    the source shard wait that long, which for a long list may be past
+    their lock timeout.
+    """
+    source = shard_for(list_id)
+    if source is None or target not in settings.LISTS_SHARDS:
+        raise ValueError('lists are only moved between LISTS_SHARDS')
+    if source == target:
+        return 0
+    with transaction.atomic(using=source):
+        lists = List.objects.using(source).filter(id=list_id)
+        if not lists.update(last_modified=F('last_modified')):
+            raise List.DoesNotExist(f'no list {list_id} on {source}')
+        moving = lists.get()
+        items = Item.objects.using(source).filter(list_id=list_id)
+        archived = ArchivedItem.objects.using(source).filter(list_id=list_id)
+        with routers.on_shard(target), transaction.atomic(using=target), \
+                _list_ids_kept(target):
+            List.objects.create(id=moving.id, item_count=moving.item_count,
+                                last_modified=timezone.now(),
+                                needs_rebalancing=moving.needs_rebalancing)
+            Item.objects.bulk_create(
+                (Item(list_id=moving.id, text=item.text,
+                      position=item.position, status=item.status,
+                      status_changed=item.status_changed)
+                 for item in items.order_by('position').iterator()),
+                batch_size=MOVE_BATCH_SIZE)
+            ArchivedItem.objects.bulk_create(archived.iterator(),
+                                             batch_size=MOVE_BATCH_SIZE)
+        with transaction.atomic(using=routers.PRIMARY):
+            if target == home_shard(list_id):
+                ListShard.objects.filter(list_id=list_id).delete()
+            else:
+                ListShard.objects.update_or_create(
+                    list_id=list_id, defaults={'shard': target})
+        moved = items.count()
+        archived.delete()
+        items.delete()
+        lists.delete()
+    cache.invalidate(list_id)
+    return moved
+
+
+def shard_sizes():
+    """Return the number of active items on each shard."""
+    sizes = {}
+    for alias in shard_aliases():
+        with routers.on_shard(alias):
+            sizes[alias] = (List.objects.aggregate(
+                items=Sum('item_count'))['items'] or 0)
+    return sizes
+
+
+def rebalance(max_moves, tolerance=REBALANCE_TOLERANCE):
+    """Move lists from the fullest shard to the emptiest, at most
+    `max_moves` of them, until no shard is further than `tolerance` times
+    the mean from another. Returns the (list id, source, target, items)
+    moves made.
+    """
+    sizes = shard_sizes()
+    mean = sum(sizes.values()) / len(sizes)
+    moves = []
+    while len(moves) < max_moves:
+        fullest = max(sizes, key=sizes.get)
+        emptiest = min(sizes, key=sizes.get)
+        gap = sizes[fullest] - sizes[emptiest]
+        if gap <= tolerance * mean:
+            break
+        # The biggest list that narrows the gap rather than reversing it.
+        with routers.on_shard(fullest):
+            candidate = (List.objects
+                         .filter(item_count__gt=0, item_count__lte=gap // 2)
+                         .order_by('-item_count')
+                         .values_list('id', 'item_count').first())
+        if candidate is None:
+            break
+        list_id, count = candidate
+        move_list(list_id, emptiest)
+        sizes[fullest] -= count
+        sizes[emptiest] += count
+        moves.append((list_id, fullest, emptiest, count))
+    return moves
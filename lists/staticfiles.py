@@ -0,0 +1,185 @@
+"""Static files for production: hashed, precompressed and served by WSGI.
+
+CompressedManifestStaticFilesStorage makes collectstatic write each file
+under a content-hashed name, e.g. lists/app.3f2a9c1e.css, plus a .gz copy
+and, when the optional brotli package is installed, a .br copy of every
+compressible file. Compressing once at deploy time lets the slowest, best
+settings be used at no cost per request.
+
+StaticFilesApplication serves STATIC_ROOT in front of the Django WSGI
+application (see superlists/wsgi.py). It indexes the directory once at
+startup, picks the best encoding the client accepts, and marks hashed
+files immutable for a year, since a changed file gets a new name. The open
+file goes to the server's wsgi.file_wrapper, which servers such as gunicorn
+and uWSGI send with sendfile() without copying it through Python.
+"""
+import gzip
+import io
+import json
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from wsgiref.util import FileWrapper
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+from lists.compression import brotli
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.map', '.svg', '.txt',
+                           '.html', '.xml', '.ico')
+STATIC_BROTLI_QUALITY = 11  # The best, affordable once per deploy.
+MIN_SAVING = 0.05  # Compressed copies must be this much smaller to be kept.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60  # Seconds hashed files are cached.
+MAX_AGE = 60  # Seconds files without a hash in their name are cached.
+FILE_BLOCK_SIZE = 64 * 1024  # Bytes per read where sendfile is unavailable.
+
+_accepts = {encoding: re.compile(rf'\b{encoding}\b')
+            for encoding in ('br', 'gzip')}
+_suffixes = {'br': '.br', 'gzip': '.gz'}
+
+
+def _gzip(data):
+    buffer = io.BytesIO()
+    # mtime=0 keeps the output, and so its ETag, the same on every deploy.
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9,
+                       mtime=0) as compressed:
+        compressed.write(data)
+    return buffer.getvalue()
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=STATIC_BROTLI_QUALITY)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes .gz and .br copies."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            data = original.read()
+        compressors = [('.gz', _gzip)] + ([('.br', _brotli)] if brotli else [])
+        for suffix, compress in compressors:
+            compressed = compress(data)
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                self._save(name + suffix, ContentFile(compressed))
+
+
+class StaticFile:
+    """One file under STATIC_ROOT, with its compressed copies."""
+
+    def __init__(self, path, immutable):
+        content_type, _ = mimetypes.guess_type(path)
+        if content_type and content_type.startswith('text/'):
+            content_type += '; charset=utf-8'
+        max_age = IMMUTABLE_MAX_AGE if immutable else MAX_AGE
+        self.headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Cache-Control', f'public, max-age={max_age}'
+                              + (', immutable' if immutable else '')),
+        ]
+        self.variants = {}  # Encoding -> (path, headers); None is identity.
+        for encoding, suffix in [(None, '')] + list(_suffixes.items()):
+            stat = _stat(path + suffix)
+            if stat is None:
+                continue
+            headers = [
+                ('Content-Length', str(stat.st_size)),
+                ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+                ('ETag', f'"{int(stat.st_mtime):x}-{stat.st_size:x}'
+                         f'{"-" + encoding if encoding else ""}"'),
+            ]
+            if encoding:
+                headers.append(('Content-Encoding', encoding))
+            self.variants[encoding] = (path + suffix, headers)
+        if len(self.variants) > 1:
+            self.headers.append(('Vary', 'Accept-Encoding'))
+
+    def choose(self, accept_encoding):
+        for encoding in ('br', 'gzip'):
+            if (encoding in self.variants
+                    and _accepts[encoding].search(accept_encoding)):
+                return self.variants[encoding]
+        return self.variants[None]
+
+    def serve(self, environ, start_response):
+        path, headers = self.choose(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        headers = self.headers + headers
+        etag = dict(headers)['ETag']
+        if etag in environ.get('HTTP_IF_NONE_MATCH', ''):
+            start_response('304 Not Modified',
+                           [header for header in headers
+                            if header[0] != 'Content-Length'])
+            return []
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(open(path, 'rb'), FILE_BLOCK_SIZE)
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _hashed_names(root):
+    """Return the hashed names in `root`'s staticfiles.json manifest."""
+    try:
+        with open(os.path.join(root, 'staticfiles.json')) as manifest:
+            return set(json.load(manifest)['paths'].values())
+    except (FileNotFoundError, ValueError, KeyError):
+        return set()
+
+
+def index_files(root, prefix):
+    """Return {URL path: StaticFile} for every file under `root`."""
+    files = {}
+    if not root or not os.path.isdir(root):
+        return files
+    hashed = _hashed_names(root)
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(tuple(_suffixes.values())):
+                continue
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            files[prefix + relative] = StaticFile(path, relative in hashed)
+    return files
+
+
+class StaticFilesApplication:
+    """Serve the files under `root` at URL `prefix`; pass other requests,
+    and unknown files, on to `application`.
+    """
+
+    def __init__(self, application, root, prefix):
+        self.application = application
+        self.prefix = prefix
+        self.files = index_files(root, prefix)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        static = (self.files.get(path) if path.startswith(self.prefix)
+                  else None)
+        if static is None:
+            return self.application(environ, start_response)
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed',
+                           [('Allow', 'GET, HEAD'), ('Content-Length', '0')])
+            return []
+        return static.serve(environ, start_response)
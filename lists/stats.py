@@ -0,0 +1,25 @@
+"""Latency summaries shared by the benchmarks and the timing middleware."""
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list of samples."""
+    index = max(0, min(len(ordered) - 1,
+                       int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Summarize durations in seconds as milliseconds and throughput."""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'count': len(ordered),
+        'mean_ms': ms(total / len(ordered)),
+        'min_ms': ms(ordered[0]),
+        'p50_ms': ms(percentile(ordered, 50)),
+        'p95_ms': ms(percentile(ordered, 95)),
+        'p99_ms': ms(percentile(ordered, 99)),
+        'max_ms': ms(ordered[-1]),
+        'per_second': round(len(ordered) / total, 1) if total else None,
+    }
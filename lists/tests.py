@@ -1,9 +1,47 @@
 #!/usr/bin/env python3
 # -*- coding: utf8 -*-
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import zlib
+from concurrent.futures import Future
+from contextlib import closing
+from datetime import timedelta
 
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.template import engines
+from django.utils import timezone
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
+from unittest.mock import patch
+
+from lists import admin as lists_admin
+from lists import (admission, cache as list_cache, compression, pubsub,
+                   ranks, reports, routers, search, seeding, sharding,
+                   staticfiles, views, writequeue)
+from lists.archive import export_lists, import_lists
+from lists.benchmarks import SUITES, parse_importtime
+from lists.db import copy_database
+from lists.stats import summarize
 from lists.views import home_page
-from lists.models import Item, List
+from superlists.asgi import ASGIAdapter, application as asgi_application
+from lists.models import ArchivedItem, Item, List, ListShard
 
 # Create your tests here.
 
@@ -69,8 +107,43 @@ class ListAndItemModelTest(TestCase):
         self.assertEqual(second_saved_item.text, 'Item the second')
         self.assertEqual(second_saved_item.list, _list)
 
+    def test_add_items_keeps_item_count_and_last_modified(self):
+        _list = List.objects.create()
+        created = _list.last_modified
+
+        inserted = _list.add_items(['first', 'second'])
+        _list.refresh_from_db()
+
+        self.assertEqual(inserted, 2)
+        self.assertEqual(_list.item_count, 2)
+        self.assertGreater(_list.last_modified, created)
+
+    def test_add_items_writes_before_it_reads(self):
+        _list = List.objects.create()
+
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                _list.add_items(['first', 'second'])
+
+        self.assertTrue(_first_statement(queries).startswith('UPDATE'))
+
+
+def _first_statement(queries):
+    """Return the first captured query after the first BEGIN or SAVEPOINT.
+
+    The first statement of a SQLite transaction decides which lock it takes
+    first; a read followed by a write has to upgrade its lock.
+    """
+    sqls = [query['sql'] for query in queries]
+    start = next(n for n, sql in enumerate(sqls)
+                 if sql.startswith(('BEGIN', 'SAVEPOINT')))
+    return sqls[start + 1]
+
 
 class ListViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
     def test_uses_list_template(self):
         _list = List.objects.create()
 
@@ -104,6 +177,46 @@ class ListViewTest(TestCase):
 
         self.assertEqual(response.context['list'], correct_list)
 
+    @patch('lists.views.ITEMS_PER_PAGE', 2)
+    def test_pages_items_with_a_keyset_cursor(self):
+        _list = List.objects.create()
+        items = [Item.objects.create(text=f'itemey {n}', list=_list)
+                 for n in range(1, 4)]
+
+        first_page = self.client.get(f'/lists/{_list.id}/')
+        next_page = first_page.context['next_page']
+        second_page = self.client.get(f'/lists/{_list.id}/', data=next_page)
+
+        self.assertEqual(next_page, {'after': items[1].position, 'start': 2})
+        self.assertContains(first_page, '2: itemey 2')
+        self.assertNotContains(first_page, 'itemey 3')
+        self.assertContains(second_page, '3: itemey 3')
+        self.assertNotContains(second_page, 'itemey 2')
+        self.assertIsNone(second_page.context['next_page'])
+
+    def test_rows_are_escaped_without_padding(self):
+        _list = List.objects.create()
+        Item.objects.create(text='<b>bold</b>', list=_list)
+
+        response = self.client.get(f'/lists/{_list.id}/')
+
+        self.assertContains(response,
+                            '<tr><td>1: &lt;b&gt;bold&lt;/b&gt;</td></tr>')
+
+    @patch('lists.views.STREAM_CHUNK_SIZE', 2)
+    def test_streams_every_row_in_chunks(self):
+        _list = List.objects.create()
+        for n in range(1, 6):
+            Item.objects.create(text=f'itemey {n}', list=_list)
+
+        response = self.client.get(f'/lists/{_list.id}/', data={'stream': 1})
+        content = b''.join(response.streaming_content).decode()
+
+        self.assertTrue(response.streaming)
+        self.assertIn('id_list_table', content)
+        for n in range(1, 6):
+            self.assertIn(f'{n}: itemey {n}', content)
+
 
 class NewItemTest(TestCase):
 
@@ -120,6 +233,8 @@ class NewItemTest(TestCase):
         new_item = Item.objects.first()
         self.assertEqual(new_item.text, new_item_txt)
         self.assertEqual(new_item.list, correct_list)
+        correct_list.refresh_from_db()
+        self.assertEqual(correct_list.item_count, 1)
 
     def test_redirects_to_list_view(self):
         new_item_txt = 'A new item for an existing list'
@@ -147,3 +262,1512 @@ class NewListsTest(TestCase):
         response = self.client.post('/lists/new', data={'item_text': 'A new list item'})
         new_list = List.objects.first()
         self.assertRedirects(response, f'/lists/{new_list.id}/')
+
+
+class TemplateLoadingTest(TestCase):
+    """Unit tests for the production template configuration."""
+
+    @override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {'loaders': [('django.template.loaders.cached.Loader', [
+            'django.template.loaders.app_directories.Loader'])]},
+    }])
+    def test_precompiles_templates_into_the_cached_loader(self):
+        apps.get_app_config('lists').precompile_templates()
+
+        [loader] = engines['django'].engine.template_loaders
+        self.assertEqual(sorted(loader.get_template_cache),
+                         ['home.html', 'item_rows.html', 'list.html'])
+
+    def test_render_suite_compares_instances_and_labels(self):
+        results = SUITES['render']({'items': 3, 'repeat': 2})
+
+        self.assertEqual(set(results), {'instances', 'labels'})
+        self.assertLess(results['labels']['bytes'],
+                        results['instances']['bytes'])
+
+
+class ListCacheTest(TestCase):
+    """Unit tests for the per-list cache of rendered rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.list = List.objects.create()
+        Item.objects.create(text='itemey 1', list=cls.list)
+        cls.url = f'/lists/{cls.list.id}/'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeat_get_renders_rows_from_cache(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(1):  # The List lookup only.
+            response = self.client.get(self.url)
+
+        self.assertContains(response, '1: itemey 1')
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_costs_one_query(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_move_and_complete_change_the_etag(self):
+        item = Item.objects.create(text='itemey 2', list=self.list)
+        etags = [self.client.get(self.url)['ETag']]
+
+        self.client.post(f'{self.url}move_item', data={'item': item.id})
+        etags.append(self.client.get(self.url)['ETag'])
+        self.client.post(f'{self.url}complete_item', data={'item': item.id})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etags[-1])
+
+        self.assertNotEqual(etags[0], etags[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'itemey 2')
+
+    def test_compresses_html_when_accepted(self):
+        self.list.add_items(f'itemey {n}' for n in range(2, 50))
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_streamed_gzip_sends_each_chunk_as_it_is_rendered(self):
+        response = self.client.get(self.url, data={'stream': 1},
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        first_chunk = next(iter(response.streaming_content))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        head = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(first_chunk)
+        self.assertIn(b'id_list_table', head)
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_prefers_brotli_when_accepted(self):
+        self.list.add_items(f'itemey {n}' for n in range(2, 50))
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('itemey 49', compression.brotli.decompress(
+            response.content).decode())
+
+    def test_add_item_invalidates_cached_rows(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.client.post(f'{self.url}add_item', data={'item_text': 'itemey 2'})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '2: itemey 2')
+
+    def test_bulk_add_invalidates_cached_rows(self):
+        self.client.get(self.url)
+
+        self.client.post(f'{self.url}add_items', data='itemey 2',
+                         content_type='text/plain')
+        response = self.client.get(self.url)
+
+        self.assertContains(response, '2: itemey 2')
+
+    @override_settings(DEBUG=True)
+    def test_stats_count_hits_and_misses(self):
+        before = list_cache.stats()
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        after = self.client.get('/lists/stats/cache').json()
+
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_stats_are_hidden_unless_debugging(self):
+        response = self.client.get('/lists/stats/cache')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ListItemsAPITest(TestCase):
+    """Unit tests for the JSON items endpoint."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.list = List.objects.create()
+        cls.items = [Item.objects.create(text=f'itemey {n}', list=cls.list)
+                     for n in range(1, 4)]
+
+    def test_returns_id_and_text_rows(self):
+        response = self.client.get(f'/lists/{self.list.id}/items')
+
+        self.assertEqual(response.json(), {
+            'list': self.list.id,
+            'fields': ['id', 'text'],
+            'items': [[item.id, item.text] for item in self.items],
+            'next_after': None,
+        })
+
+    def test_pages_with_a_keyset_cursor(self):
+        first = self.client.get(f'/lists/{self.list.id}/items',
+                                data={'limit': 2}).json()
+        second = self.client.get(f'/lists/{self.list.id}/items',
+                                 data={'limit': 2,
+                                       'after': first['next_after']}).json()
+
+        self.assertEqual([row[1] for row in first['items']],
+                         ['itemey 1', 'itemey 2'])
+        self.assertEqual([row[1] for row in second['items']], ['itemey 3'])
+        self.assertIsNone(second['next_after'])
+
+    @patch('lists.views.STREAM_CHUNK_SIZE', 2)
+    def test_streams_a_json_array(self):
+        response = self.client.get(f'/lists/{self.list.id}/items',
+                                   data={'stream': 1})
+        rows = json.loads(b''.join(response.streaming_content).decode())
+
+        self.assertEqual(rows, [[item.id, item.text] for item in self.items])
+
+    def test_gzips_when_accepted(self):
+        Item.objects.create(text='itemey ' * 100, list=self.list)
+
+        response = self.client.get(f'/lists/{self.list.id}/items',
+                                   HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_unknown_list_is_not_found(self):
+        response = self.client.get(f'/lists/{self.list.id + 1}/items')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class BenchmarkTest(TestCase):
+    """Unit tests for the benchmark helpers and suites."""
+
+    def test_summarize_reports_percentiles(self):
+        summary = summarize([n / 1000 for n in range(1, 101)])
+
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['p50_ms'], 50)
+        self.assertEqual(summary['p99_ms'], 99)
+        self.assertEqual(summary['max_ms'], 100)
+
+    def test_parses_importtime_output(self):
+        stderr = ('import time: self [us] | cumulative | imported package\n'
+                  'import time:       345 |        345 |   zipimport\n'
+                  'import time:      1200 |      52000 | django.db\n')
+
+        self.assertEqual(parse_importtime(stderr),
+                         {'zipimport': 0.000345, 'django.db': 0.052})
+
+    def test_startup_suite_times_each_settings_profile(self):
+        results = SUITES['startup']({'repeat': 1})
+
+        self.assertEqual(set(results), {'superlists.settings',
+                                        'superlists.settings_production'})
+        production = results['superlists.settings_production']
+        self.assertEqual(production['first_response']['count'], 1)
+
+    def test_api_suite_measures_html_and_json(self):
+        results = SUITES['api']({'items': 3, 'repeat': 2})
+
+        self.assertEqual(set(results), {'html_page', 'json_page',
+                                        'html_stream', 'json_stream'})
+        self.assertEqual(results['json_page']['count'], 2)
+
+    def test_compression_suite_reports_bytes_and_not_modified(self):
+        results = SUITES['compression']({'items': 50, 'repeat': 2})
+
+        self.assertLess(results['gzip']['bytes'],
+                        results['identity']['bytes'])
+        self.assertEqual(results['gzip']['encoding'], 'gzip')
+        self.assertEqual(results['not_modified']['status'], 304)
+        self.assertEqual(results['not_modified']['queries'], 1)
+
+    def test_views_suite_loads_each_view_in_process(self):
+        results = SUITES['views']({'lists': 2, 'items': 3, 'repeat': 4,
+                                   'concurrency': 1, 'url': None})
+
+        self.assertEqual(set(results), {'home_page', 'new_list',
+                                        'view_list', 'add_item'})
+        self.assertEqual(results['add_item']['count'], 4)
+        self.assertEqual(List.objects.count(), 2 + 4)
+
+
+class QueryTimingMiddlewareTest(TestCase):
+    """Unit tests for the per-request instrumentation middleware."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.list = List.objects.create()
+        Item.objects.create(text='itemey 1', list=cls.list)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sets_server_timing_header(self):
+        response = self.client.get(f'/lists/{self.list.id}/')
+
+        timing = response['Server-Timing']
+        self.assertIn('desc="2 queries"', timing)
+        self.assertRegex(timing, r'template;dur=\d+\.\d+')
+        self.assertRegex(timing, r'total;dur=\d+\.\d+')
+
+    def test_times_queries_shorter_than_a_millisecond(self):
+        response = self.client.get(f'/lists/{self.list.id}/')
+
+        sql = float(re.search(r'sql;dur=([\d.]+)',
+                              response['Server-Timing']).group(1))
+        self.assertGreater(sql, 0)
+        self.assertFalse(connection.queries_logged)
+
+    @override_settings(DEBUG=True)
+    def test_keeps_rolling_stats_per_url_name(self):
+        for _ in range(3):
+            self.client.post(f'/lists/{self.list.id}/add_item',
+                             data={'item_text': 'itemey'})
+
+        stats = self.client.get('/lists/stats/requests').json()
+
+        self.assertGreaterEqual(stats['add_item']['wall']['count'], 3)
+        self.assertGreater(stats['add_item']['queries']['max'], 0)
+
+    def test_stats_are_hidden_unless_debugging(self):
+        response = self.client.get('/lists/stats/requests')
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(LISTS_RATE_LIMITS={'new_list': {'rate': 1, 'burst': 2}})
+class AdmissionMiddlewareTest(TestCase):
+    """Unit tests for rate limiting and load shedding."""
+
+    def setUp(self):
+        admission.local_buckets.clear()
+
+    def _new_list(self, **extra):
+        return self.client.post('/lists/new', data={'item_text': 'itemey'},
+                                **extra)
+
+    def test_rate_limits_a_client_after_its_burst(self):
+        responses = [self._new_list() for _ in range(3)]
+
+        self.assertEqual([r.status_code for r in responses], [302, 302, 429])
+        self.assertEqual(responses[-1]['Retry-After'], '1')
+        self.assertEqual(List.objects.count(), 2)
+
+    def test_limits_each_client_separately(self):
+        for _ in range(2):
+            self._new_list(REMOTE_ADDR='10.0.0.1')
+
+        response = self._new_list(REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self._new_list(REMOTE_ADDR='10.0.0.1').status_code,
+                         429)
+
+    def test_bucket_refills_at_the_rate(self):
+        with patch('lists.admission.time.time', return_value=1000.0):
+            for _ in range(3):
+                self._new_list()
+        with patch('lists.admission.time.time', return_value=1001.0):
+            response = self._new_list()
+
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(LISTS_RATE_LIMIT_CACHE='default')
+    def test_buckets_can_live_in_a_shared_cache(self):
+        cache.clear()
+        for _ in range(2):
+            self._new_list()
+
+        self.assertEqual(self._new_list().status_code, 429)
+        self.assertTrue(cache.get('lists:bucket:new_list:ip:127.0.0.1'))
+
+    @override_settings(LISTS_MAX_CONCURRENT_REQUESTS=1)
+    def test_sheds_requests_over_the_concurrency_limit(self):
+        admission._acquire_slot()
+        self.addCleanup(admission._release_slot)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'],
+                         str(admission.SHED_RETRY_AFTER))
+
+    @override_settings(DEBUG=True)
+    def test_stats_count_admitted_and_limited_requests(self):
+        before = admission.admission_stats()
+        for _ in range(3):
+            self._new_list()
+
+        after = self.client.get('/lists/stats/admission').json()
+
+        self.assertEqual(after['rate_limited'] - before['rate_limited'], 1)
+        self.assertEqual(after['rate_limited_by_view']['new_list'],
+                         before['rate_limited_by_view'].get('new_list', 0) + 1)
+        self.assertEqual(after['admitted'] - before['admitted'], 2 + 1)
+
+
+class SQLitePragmasTest(TestCase):
+    """Unit tests for the PRAGMAs run on new SQLite connections."""
+
+    def _new_connection(self):
+        wrapper = DatabaseWrapper(dict(connection.settings_dict,
+                                       NAME=':memory:'), alias='pragmas')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234,
+                                       'synchronous': 'NORMAL'})
+    def test_applies_configured_pragmas(self):
+        wrapper = self._new_connection()
+
+        pragma = lambda name: wrapper.connection.execute(
+            f'PRAGMA {name}').fetchone()[0]
+        self.assertEqual(pragma('busy_timeout'), 1234)
+        self.assertEqual(pragma('synchronous'), 1)  # NORMAL
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout; DROP': 1})
+    def test_rejects_unsafe_pragma_names(self):
+        with self.assertRaises(ValueError):
+            self._new_connection()
+
+    def test_concurrency_suite_compares_untuned_and_tuned(self):
+        results = SUITES['sqlite_concurrency']({
+            'lists': 1, 'items': 2, 'concurrency': 1, 'seconds': 0.05})
+
+        self.assertEqual(set(results), {'untuned', 'tuned'})
+        self.assertGreater(results['tuned']['writes_per_second'], 0)
+
+
+class ASGIAdapterTest(TestCase):
+    """Unit tests for serving the WSGI app through the ASGI entry point."""
+
+    def _request(self, method, path, body=b'', headers=()):
+        scope = {'type': 'http', 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': path, 'root_path': '',
+                 'query_string': b'', 'server': ('testserver', 80),
+                 'client': ('127.0.0.1', 50000),
+                 'headers': [(b'host', b'testserver')] + list(headers)}
+        received = [{'type': 'http.request', 'body': body[:3],
+                     'more_body': True},
+                    {'type': 'http.request', 'body': body[3:]}]
+        sent = []
+
+        async def receive():
+            return received.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        # A single worker thread shares the test's database connection.
+        adapter = ASGIAdapter(asgi_application.wsgi_application, max_workers=1)
+        with patch.object(adapter.executor, 'submit',
+                          lambda fn, *args: _done(fn(*args))):
+            loop.run_until_complete(adapter(scope, receive, send))
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        return sent[0], body
+
+    def test_serves_view_list(self):
+        _list = List.objects.create()
+        _list.add_items(['itemey 1'])
+
+        start, body = self._request('GET', f'/lists/{_list.id}/')
+
+        self.assertEqual(start['status'], 200)
+        self.assertIn(b'1: itemey 1', body)
+
+    def test_passes_request_bodies_to_views(self):
+        _list = List.objects.create()
+
+        start, body = self._request(
+            'POST', f'/lists/{_list.id}/add_items', body=b'milk\neggs',
+            headers=[(b'content-type', b'text/plain'),
+                     (b'cookie', b'csrftoken=' + b'a' * 32),
+                     (b'x-csrftoken', b'a' * 32)])
+
+        self.assertEqual(start['status'], 201)
+        self.assertEqual(json.loads(body.decode())['inserted'], 2)
+
+
+def _done(result):
+    """Return an already finished future holding `result`."""
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class StaticFilesTest(TestCase):
+    """Unit tests for collectstatic's compressed copies and their server."""
+
+    def setUp(self):
+        source = tempfile.TemporaryDirectory()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(root.cleanup)
+        os.makedirs(os.path.join(source.name, 'lists'))
+        with open(os.path.join(source.name, 'lists', 'app.css'), 'w') as css:
+            css.write('body { margin: 0 auto; }\n' * 100)
+        self.root = root.name
+        with override_settings(
+                STATICFILES_DIRS=[source.name], STATIC_ROOT=root.name,
+                STATICFILES_STORAGE=
+                'lists.staticfiles.CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(root.name, 'staticfiles.json')) as manifest:
+            self.hashed = json.load(manifest)['paths']['lists/app.css']
+
+    def _get(self, path, method='GET', **headers):
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, **headers}
+        response = {}
+
+        def start_response(status, headers):
+            response.update(status=status, headers=dict(headers))
+
+        def application(environ, start_response):
+            start_response('200 OK', [])
+            return [b'from django']
+
+        static = staticfiles.StaticFilesApplication(application, self.root,
+                                                    '/static/')
+        body = b''.join(static(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_collectstatic_writes_hashed_names_and_gzip_copies(self):
+        self.assertRegex(self.hashed, r'^lists/app\.[0-9a-f]{12}\.css$')
+        for name in (self.hashed, self.hashed + '.gz', 'lists/app.css.gz'):
+            self.assertTrue(os.path.exists(os.path.join(self.root, name)),
+                            name)
+
+    def test_serves_gzip_copy_with_immutable_caching(self):
+        status, headers, body = self._get(f'/static/{self.hashed}',
+                                          HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(headers['Cache-Control'],
+                         'public, max-age=31536000, immutable')
+        self.assertEqual(gzip.decompress(body),
+                         b'body { margin: 0 auto; }\n' * 100)
+        self.assertEqual(int(headers['Content-Length']), len(body))
+
+    def test_serves_unhashed_names_uncompressed_and_briefly_cached(self):
+        status, headers, body = self._get('/static/lists/app.css')
+
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(headers['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(len(body), 2500)
+
+    def test_hands_the_file_to_the_servers_file_wrapper(self):
+        wrapped = []
+
+        def file_wrapper(file, block_size):
+            wrapped.append(file.name)
+            file.close()
+            return []
+
+        self._get(f'/static/{self.hashed}', **{
+            'wsgi.file_wrapper': file_wrapper})
+
+        self.assertEqual(wrapped, [os.path.join(self.root, self.hashed)])
+
+    def test_answers_unchanged_files_with_304(self):
+        _, headers, _ = self._get(f'/static/{self.hashed}')
+
+        status, _, body = self._get(f'/static/{self.hashed}',
+                                    HTTP_IF_NONE_MATCH=headers['ETag'])
+
+        self.assertEqual(status, '304 Not Modified')
+        self.assertEqual(body, b'')
+
+    def test_passes_other_paths_to_django(self):
+        self.assertEqual(self._get('/lists/1/')[2], b'from django')
+        self.assertEqual(self._get('/static/missing.css')[2], b'from django')
+
+
+class SearchTest(TestCase):
+    """Unit tests for full-text search over item text."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.list = List.objects.create()
+        cls.list.add_items(['buy peacock feathers',
+                            'use peacock feathers to make a fly',
+                            'buy milk'])
+
+    def _texts(self, query, **params):
+        response = self.client.get('/lists/search', data=dict(q=query,
+                                                               **params))
+        return [result['text'] for result in response.json()['results']]
+
+    def test_index_is_built_by_the_migrations(self):
+        self.assertTrue(search.has_fts())
+
+    def test_matches_every_word_across_lists(self):
+        other_list = List.objects.create()
+        other_list.add_items(['Peacock FEATHERS, again'])
+
+        texts = self._texts('feathers peacock')
+
+        self.assertEqual(sorted(texts), ['Peacock FEATHERS, again',
+                                         'buy peacock feathers',
+                                         'use peacock feathers to make a fly'])
+
+    def test_ranks_closer_matches_first(self):
+        self.assertEqual(self._texts('buy feathers')[0],
+                         'buy peacock feathers')
+
+    def test_user_input_is_not_parsed_as_operators(self):
+        self.assertEqual(self._texts('milk OR "NEAR(buy'), [])
+        self.assertEqual(self._texts('*'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        Item.objects.filter(text='buy milk').update(text='buy oat drink')
+        Item.objects.filter(text__startswith='use').delete()
+
+        self.assertEqual(self._texts('milk'), [])
+        self.assertEqual(self._texts('oat'), ['buy oat drink'])
+        self.assertEqual(self._texts('fly'), [])
+
+    @patch('lists.search.RESULTS_PER_PAGE', 2)
+    def test_pages_results(self):
+        first = self.client.get('/lists/search',
+                                data={'q': 'peacock'}).json()
+        second = self.client.get('/lists/search',
+                                 data={'q': 'peacock', 'page': 2}).json()
+
+        self.assertEqual(first['next_page'], 2)
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(second['results'], [])
+        self.assertIsNone(second['next_page'])
+
+    @patch('lists.search.RESULTS_PER_PAGE', 1)
+    @patch('lists.search.MAX_PAGE', 1)
+    def test_pages_stop_at_the_deepest_page(self):
+        last = self.client.get('/lists/search',
+                               data={'q': 'peacock', 'page': 1}).json()
+        response = self.client.get('/lists/search',
+                                   data={'q': 'peacock', 'page': 10 ** 25})
+
+        self.assertEqual(len(last['results']), 1)
+        self.assertIsNone(last['next_page'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_scan_fallback_finds_the_same_items(self):
+        matches = search.search_scan(['PEACOCK', 'feathers'], 0)
+
+        self.assertEqual(sorted(text for _, _, text in matches),
+                         ['buy peacock feathers',
+                          'use peacock feathers to make a fly'])
+
+
+@override_settings(LISTS_WRITE_COALESCING={'max_batch': 3, 'max_delay': 0.05})
+class WriteCoalescingTest(TransactionTestCase):
+    """Unit tests for batching add_item writes through the writer thread.
+
+    The writer commits on its own connection, so these tests commit too.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(writequeue.shutdown)
+        self.list = List.objects.create()
+
+    def test_add_item_waits_for_its_item_to_be_written(self):
+        response = self.client.post(f'/lists/{self.list.id}/add_item',
+                                    data={'item_text': 'coalesced item'})
+
+        self.assertRedirects(response, f'/lists/{self.list.id}/')
+        self.assertContains(self.client.get(f'/lists/{self.list.id}/'),
+                            '1: coalesced item')
+        self.list.refresh_from_db()
+        self.assertEqual(self.list.item_count, 1)
+
+    def test_concurrent_items_share_batches(self):
+        writer = writequeue.get_writer()
+        threads = [threading.Thread(target=writer.add,
+                                    args=(self.list.id, f'item {n}'))
+                   for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Item.objects.filter(list=self.list).count(), 6)
+        self.assertEqual(writer.items, 6)
+        self.assertLess(writer.batches, 6)
+
+    def test_failed_batch_raises_in_the_waiting_request(self):
+        writer = writequeue.get_writer()
+
+        with patch('lists.models.List.record_new_items',
+                   side_effect=RuntimeError('disk full')):
+            with self.assertRaisesMessage(RuntimeError, 'disk full'):
+                writer.add(self.list.id, 'item that is rolled back')
+        self.assertEqual(Item.objects.count(), 0)
+
+
+@patch('lists.views.EVENTS_HEARTBEAT', 0.01)
+@patch('lists.views.EVENTS_MAX_AGE', 0.05)
+@override_settings(LISTS_MAX_EVENT_STREAMS=2)
+class ListEventsTest(TestCase):
+    """Unit tests for the server-sent event stream of new items."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.list = List.objects.create()
+        cls.list.add_items(['itemey 1', 'itemey 2'])
+        cls.first, cls.second = Item.objects.order_by('id')
+
+    def setUp(self):
+        cache.clear()
+
+    def _events(self, **extra):
+        response = self.client.get(f'/lists/{self.list.id}/events', **extra)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return b''.join(response.streaming_content).decode()
+
+    def test_sends_items_after_the_cursor(self):
+        events = self._events(data={'after': self.first.id})
+
+        self.assertIn(f'id: {self.second.id}\ndata: "itemey 2"\n\n', events)
+        self.assertNotIn('itemey 1', events)
+        self.assertIn(': keep-alive', events)
+
+    def test_resumes_from_last_event_id(self):
+        events = self._events(data={'after': 0},
+                              HTTP_LAST_EVENT_ID=str(self.second.id))
+
+        self.assertNotIn('itemey', events)
+
+    def test_starts_after_the_current_last_item_by_default(self):
+        self.assertNotIn('itemey', self._events())
+
+    def test_list_page_subscribes_after_its_last_item(self):
+        response = self.client.get(f'/lists/{self.list.id}/')
+
+        self.assertContains(
+            response, f'/lists/{self.list.id}/events?after={self.second.id}')
+
+    @override_settings(LISTS_MAX_EVENT_STREAMS=0)
+    def test_live_updates_are_off_by_default(self):
+        page = self.client.get(f'/lists/{self.list.id}/')
+        events = self.client.get(f'/lists/{self.list.id}/events')
+
+        self.assertNotContains(page, 'EventSource')
+        self.assertEqual(events.status_code, 204)
+
+    def test_stops_clients_past_the_stream_limit(self):
+        url = f'/lists/{self.list.id}/events'
+        open_streams = [self.client.get(url) for _ in range(2)]
+
+        turned_away = self.client.get(url)
+        open_streams[0].close()
+        admitted = self.client.get(url)
+        admitted.close()
+        open_streams[1].close()
+
+        self.assertEqual(turned_away.status_code, 204)
+        self.assertEqual(admitted.status_code, 200)
+        self.assertEqual(views._open_streams, 0)
+
+    def test_failed_request_gives_its_stream_back(self):
+        with patch('lists.views.Item.objects.filter',
+                   side_effect=RuntimeError('database gone')):
+            with self.assertRaisesMessage(RuntimeError, 'database gone'):
+                self.client.get(f'/lists/{self.list.id}/events')
+
+        self.assertEqual(views._open_streams, 0)
+
+    def test_add_item_notifies_subscribers(self):
+        subscription = pubsub.subscribe(self.list.id)
+        self.addCleanup(subscription.close)
+
+        self.client.post(f'/lists/{self.list.id}/add_item',
+                         data={'item_text': 'itemey 3'})
+
+        self.assertTrue(subscription.wait(0))
+        subscription.clear()
+        self.assertFalse(subscription.wait(0))
+
+    def test_is_not_compressed(self):
+        response = self.client.get(f'/lists/{self.list.id}/events',
+                                   HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertTrue(b''.join(response.streaming_content)
+                        .startswith(b'retry: '))
+
+    def test_closed_streams_unsubscribe(self):
+        self._events()
+
+        self.assertEqual(pubsub.subscriber_count(self.list.id), 0)
+
+
+class ArchiveTest(TestCase):
+    """Unit tests for NDJSON export and import of lists."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empty = List.objects.create()
+        cls.full = List.objects.create()
+        cls.full.add_items(['itemey 1', 'itemey 2', 'itemey 3'])
+        other = List.objects.create()
+        other.add_items(['other itemey'])
+        cls.full.add_items(['itemey 4'])  # Interleaved ids.
+
+    def _texts(self, _list):
+        return list(_list.item_set.order_by('id').values_list('text',
+                                                              flat=True))
+
+    @patch('lists.archive.EXPORT_CHUNK_SIZE', 2)
+    def test_exports_each_list_followed_by_its_items(self):
+        out = io.StringIO()
+
+        self.assertEqual(export_lists(out), (3, 5))
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([record['list'] for record in records],
+                         [self.empty.id] + [self.full.id] * 5
+                         + [self.full.id + 1] * 2)
+        self.assertEqual([record.get('text') for record in records[1:6]],
+                         [None, 'itemey 1', 'itemey 2', 'itemey 3',
+                          'itemey 4'])
+
+    @patch('lists.archive.EXPORT_CHUNK_SIZE', 2)
+    def test_export_seeks_to_each_chunk_of_items(self):
+        with CaptureQueriesContext(connection) as queries:
+            export_lists(io.StringIO())
+
+        chunks = [query['sql'] for query in queries
+                  if 'FROM "lists_item"' in query['sql']]
+        self.assertEqual(len(chunks), 3)
+        with connection.cursor() as cursor:
+            for sql in chunks:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertIn('(list_id,position)>(?,?)', plan)
+
+    @patch('lists.models.BULK_BATCH_SIZE', 2)
+    def test_round_trips_through_a_gzipped_archive(self):
+        path = os.path.join(tempfile.mkdtemp(), 'lists.ndjson.gz')
+        self.addCleanup(os.remove, path)
+        call_command('exportlists', path, stderr=io.StringIO())
+
+        call_command('importlists', path, stderr=io.StringIO())
+
+        self.assertEqual(List.objects.count(), 6)
+        imported = List.objects.get(id=self.full.id + 3)
+        self.assertEqual(self._texts(imported), self._texts(self.full))
+        self.assertEqual(imported.item_count, 4)
+        self.full.refresh_from_db()
+        self.assertEqual(imported.last_modified, self.full.last_modified)
+
+    def test_bad_archive_imports_nothing(self):
+        lines = [json.dumps({'list': 1, 'last_modified':
+                             '2018-02-02T13:02:00+00:00'}),
+                 json.dumps({'list': 2, 'text': 'orphan'})]
+
+        with self.assertRaisesMessage(ValueError, 'Line 2'):
+            import_lists(lines)
+        self.assertEqual(List.objects.count(), 3)
+
+    def test_import_command_reports_bad_archives(self):
+        path = os.path.join(tempfile.mkdtemp(), 'lists.ndjson')
+        self.addCleanup(os.remove, path)
+        with open(path, 'w') as archive:
+            archive.write('{oops\n')
+
+        with self.assertRaises(CommandError):
+            call_command('importlists', path)
+
+
+class MoveItemTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.list = List.objects.create()
+        cls.list.add_items(['milk', 'eggs', 'bread'])
+        cls.milk, cls.eggs, cls.bread = cls.list.item_set.order_by('id')
+
+    def setUp(self):
+        cache.clear()
+
+    def _texts(self):
+        return [item.text for item in self.list.item_set.order_by('position')]
+
+    def test_rank_keys_sort_between_their_neighbours(self):
+        keys = [ranks.between(None, None)]
+        for n in range(200):
+            after = keys[n % len(keys)]
+            before = keys[n % len(keys) - 1] if n % len(keys) else None
+            keys.insert(n % len(keys), ranks.between(before, after))
+
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(set(keys)), len(keys))
+
+    def test_moves_an_item_between_two_others(self):
+        response = self.client.post(f'/lists/{self.list.id}/move_item',
+                                    data={'item': self.bread.id,
+                                          'after': self.milk.id})
+
+        self.assertEqual(response.json()['item'], self.bread.id)
+        self.assertEqual(self._texts(), ['milk', 'bread', 'eggs'])
+        self.assertContains(self.client.get(f'/lists/{self.list.id}/'),
+                            '2: bread')
+
+    def test_moves_an_item_to_the_top_writing_one_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(f'/lists/{self.list.id}/move_item',
+                             data={'item': self.eggs.id})
+
+        writes = [query['sql'] for query in queries
+                  if query['sql'].startswith('UPDATE "lists_item"')]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(self._texts(), ['eggs', 'milk', 'bread'])
+
+    def _needs_rebalancing(self):
+        return List.objects.get(id=self.list.id).needs_rebalancing
+
+    @patch('lists.ranks.MAX_KEY_LENGTH', 2)
+    def _move_until_a_key_is_too_long(self):
+        self.client.post(f'/lists/{self.list.id}/move_item',
+                         data={'item': self.bread.id})
+        self.assertFalse(self._needs_rebalancing())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/lists/{self.list.id}/move_item',
+                                        data={'item': self.eggs.id,
+                                              'after': self.bread.id})
+        return response, queries
+
+    def test_marks_the_list_when_a_key_gets_too_long(self):
+        response, queries = self._move_until_a_key_is_too_long()
+
+        writes = [query['sql'] for query in queries
+                  if query['sql'].startswith('UPDATE "lists_item"')]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(self._needs_rebalancing())
+        self.assertEqual(self._texts(), ['bread', 'eggs', 'milk'])
+        self.assertGreater(len(response.json()['position']), 2)
+
+    def test_rebalance_command_gives_marked_lists_fresh_keys(self):
+        self._move_until_a_key_is_too_long()
+        unmarked = List.objects.create()
+        unmarked.add_items(['tea'])
+        stderr = io.StringIO()
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('rebalancepositions', batch_size=2, stderr=stderr)
+
+        writes = [query['sql'] for query in queries
+                  if query['sql'].startswith('UPDATE "lists_item"')]
+        self.assertEqual(len(writes), 2)
+        self.assertEqual(self._texts(), ['bread', 'eggs', 'milk'])
+        self.assertEqual(
+            list(self.list.item_set.order_by('position')
+                 .values_list('position', flat=True)), ['a1', 'a2', 'a3'])
+        self.assertFalse(self._needs_rebalancing())
+        self.assertIn('Rebalanced 3 items in 1 lists', stderr.getvalue())
+
+    def test_rejects_items_of_another_list(self):
+        other = List.objects.create()
+        other.add_items(['stranger'])
+
+        modified = List.objects.get(id=self.list.id).last_modified
+
+        response = self.client.post(f'/lists/{self.list.id}/move_item',
+                                    data={'item': other.item_set.get().id})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(List.objects.get(id=self.list.id).last_modified,
+                         modified)
+
+    def test_writes_before_it_reads(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(f'/lists/{self.list.id}/move_item',
+                             data={'item': self.eggs.id})
+
+        self.assertTrue(_first_statement(queries).startswith(
+            'UPDATE "lists_list"'))
+
+
+class ItemStatusTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.list = List.objects.create()
+        cls.list.add_items(['milk', 'eggs', 'bread'])
+        cls.milk, cls.eggs, cls.bread = cls.list.item_set.order_by('id')
+
+    def setUp(self):
+        cache.clear()
+
+    def _post(self, action, item):
+        return self.client.post(f'/lists/{self.list.id}/{action}_item',
+                                data={'item': item.id})
+
+    def test_completed_items_leave_the_list_page_once(self):
+        response = self._post('complete', self.eggs)
+        self._post('complete', self.eggs)
+
+        self.assertEqual(response.json(), {'item': self.eggs.id,
+                                           'status': 'completed'})
+        page = self.client.get(f'/lists/{self.list.id}/')
+        self.assertNotContains(page, 'eggs')
+        self.assertContains(page, '2: bread')
+        self.list.refresh_from_db()
+        self.assertEqual(self.list.item_count, 2)
+
+    def test_deleting_a_completed_item_keeps_the_count(self):
+        self._post('complete', self.eggs)
+        response = self._post('delete', self.eggs)
+
+        self.assertEqual(response.json()['status'], 'deleted')
+        self.list.refresh_from_db()
+        self.assertEqual(self.list.item_count, 2)
+
+    def test_active_reads_use_the_partial_index(self):
+        items = (Item.objects.active().filter(list=self.list, position__gt='')
+                 .order_by('position').values_list('position', 'text'))
+        sql, params = items.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+
+        self.assertIn('lists_item_active_idx', plan)
+
+    def test_compaction_archives_old_inactive_items_in_batches(self):
+        self._post('complete', self.milk)
+        self._post('delete', self.eggs)
+        old = timezone.now() - timedelta(days=31)
+        Item.objects.filter(id=self.milk.id).update(status_changed=old)
+        Item.objects.filter(id=self.eggs.id).update(status_changed=old)
+        recent = Item.objects.create(list=self.list, text='jam')
+        recent.set_status(Item.COMPLETED)
+
+        call_command('compactitems', batch_size=1, stderr=io.StringIO())
+
+        self.assertEqual(sorted(Item.objects.values_list('text', flat=True)),
+                         ['bread', 'jam'])
+        self.assertEqual(
+            sorted(ArchivedItem.objects.values_list('id', 'status')),
+            [(self.milk.id, Item.COMPLETED), (self.eggs.id, Item.DELETED)])
+
+    def test_export_marks_completed_and_skips_deleted_items(self):
+        self._post('complete', self.milk)
+        self._post('delete', self.eggs)
+        out = io.StringIO()
+
+        export_lists(out)
+
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(records[1:], [
+            {'list': self.list.id, 'text': 'milk', 'completed': True},
+            {'list': self.list.id, 'text': 'bread'}])
+
+
+class SeedTest(TestCase):
+
+    def test_zipf_sizes_are_skewed_and_sum_to_the_items(self):
+        sizes = seeding.zipf_sizes(100, 10000)
+
+        self.assertEqual(sum(sizes), 10000)
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertGreater(sizes[0], 10 * sizes[-1])
+        self.assertGreaterEqual(sizes[-1], 1)
+
+    def test_same_seed_gives_the_same_lists(self):
+        def seeded_texts(workers):
+            first = (List.objects.order_by('-id').values_list('id', flat=True)
+                     .first() or 0)
+            seeding.seed([3, 1, 2], seed=7, workers=workers, batch_size=2)
+            return [list(Item.objects.filter(list_id=list_id)
+                         .order_by('position').values_list('text', flat=True))
+                    for list_id in range(first + 1, first + 4)]
+
+        self.assertEqual(seeded_texts(workers=0), seeded_texts(workers=2))
+
+    def test_seed_command_fills_counts_and_search_index(self):
+        call_command('seed', lists=20, items=500, workers=0,
+                     stderr=io.StringIO())
+
+        self.assertEqual(Item.objects.count(), 500)
+        self.assertEqual(sorted(List.objects.values_list('item_count',
+                                                         flat=True)),
+                         sorted(seeding.zipf_sizes(20, 500)))
+        self.assertTrue(search.search('peacock'))
+
+
+class BulkAddItemsTest(TestCase):
+
+    def test_inserts_newline_separated_items(self):
+        _list = List.objects.create()
+
+        response = self.client.post(f'/lists/{_list.id}/add_items',
+                                    data='milk\r\n\neggs\nbread\n',
+                                    content_type='text/plain')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'list': _list.id, 'inserted': 3})
+        self.assertEqual([item.text for item in _list.item_set.order_by('id')],
+                         ['milk', 'eggs', 'bread'])
+
+    @patch('lists.parsers.READ_SIZE', 3)
+    def test_inserts_json_array_items_across_reads(self):
+        _list = List.objects.create()
+
+        response = self.client.post(f'/lists/{_list.id}/add_items',
+                                    data='[ "milk", "two, \\"big\\" eggs" ]',
+                                    content_type='application/json')
+
+        self.assertEqual(response.json()['inserted'], 2)
+        self.assertEqual([item.text for item in _list.item_set.order_by('id')],
+                         ['milk', 'two, "big" eggs'])
+
+    @patch('lists.parsers.READ_SIZE', 3)
+    def test_receives_the_body_before_taking_the_write_lock(self):
+        _list = List.objects.create()
+        request = RequestFactory().post(f'/lists/{_list.id}/add_items',
+                                        data='["milk", "eggs"]',
+                                        content_type='application/json')
+        outside = len(connection.savepoint_ids)
+        depths = []
+        read = request.read
+
+        def read_and_record(*args):
+            depths.append(len(connection.savepoint_ids))
+            return read(*args)
+
+        request.read = read_and_record
+        response = views.add_items(request, str(_list.id))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(len(depths), 1)
+        self.assertEqual(set(depths), {outside})
+
+    @patch('lists.models.BULK_BATCH_SIZE', 2)
+    def test_malformed_batch_inserts_nothing(self):
+        _list = List.objects.create()
+
+        response = self.client.post(f'/lists/{_list.id}/add_items',
+                                    data='["milk", "eggs", "bread", 4]',
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Item.objects.count(), 0)
+
+    def test_unknown_list_is_not_found(self):
+        response = self.client.post('/lists/404/add_items', data='milk',
+                                    content_type='text/plain')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Item.objects.count(), 0)
+
+
+@override_settings(LISTS_READ_REPLICAS=['replica'])
+class ReadReplicaTest(TransactionTestCase):
+    """Unit tests for the read replica router and its pinning middleware."""
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.addCleanup(routers.reset_routing)
+
+    def _read_from_during(self, request):
+        """Return the database Item reads use while serving `request`."""
+        used = []
+
+        def get_response(request):
+            used.append(self.router.db_for_read(Item))
+            return HttpResponse()
+
+        response = routers.ReplicaPinningMiddleware(get_response)(request)
+        return used[0], response
+
+    def test_only_get_requests_read_from_replicas(self):
+        outside_request_reads_from = self.router.db_for_read(Item)
+        get_reads_from, _ = self._read_from_during(RequestFactory().get('/'))
+
+        self.assertEqual(outside_request_reads_from, 'default')
+        self.assertEqual(get_reads_from, 'replica')
+        self.assertEqual(self.router.db_for_write(Item), 'default')
+        self.assertIsNone(self.router.db_for_read(ContentType))
+
+    def test_write_pins_the_client_to_the_primary(self):
+        post_reads_from, response = self._read_from_during(
+            RequestFactory().post('/lists/new'))
+        get = RequestFactory().get('/')
+        get.COOKIES[routers.PIN_COOKIE] = response.cookies[
+            routers.PIN_COOKIE].value
+        pinned_reads_from, _ = self._read_from_during(get)
+
+        self.assertEqual(post_reads_from, 'default')
+        self.assertEqual(pinned_reads_from, 'default')
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'],
+                         settings.LISTS_PIN_SECONDS)
+
+    def test_copies_the_primary_for_a_replica(self):
+        List.objects.create().add_items(['milk'])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'replica.sqlite3')
+            copy_database('default', path)
+            with closing(sqlite3.connect(path)) as replica:
+                [(text,)] = replica.execute('SELECT text FROM lists_item')
+
+        self.assertEqual(text, 'milk')
+
+    def test_replicas_suite_reads_from_each_replica_count(self):
+        results = SUITES['replicas']({'lists': 2, 'items': 3, 'repeat': 4,
+                                      'concurrency': 1})
+
+        self.assertEqual(results['2_replicas']['databases'],
+                         ['benchmark_replica0', 'benchmark_replica1'])
+        self.assertEqual(results['4_replicas']['errors'], 0)
+
+
+@override_settings(LISTS_SHARDS=['default', 'shard1'])
+class ShardingTest(TestCase):
+    """Unit tests for spreading lists over shards."""
+    multi_db = True
+
+    def setUp(self):
+        cache.clear()
+        sharding.reserve_id_range(using='shard1')
+        self.addCleanup(routers.reset_routing)
+
+    def _new_list(self, shard, texts):
+        with patch('lists.sharding.pick_shard', return_value=shard):
+            response = self.client.post('/lists/new',
+                                        data={'item_text': texts[0]})
+        list_id = int(response['Location'].split('/')[2])
+        for text in texts[1:]:
+            self.client.post(f'/lists/{list_id}/add_item',
+                             data={'item_text': text})
+        return list_id
+
+    def _texts(self, shard, list_id):
+        return list(Item.objects.using(shard).filter(list_id=list_id)
+                    .order_by('position').values_list('text', flat=True))
+
+    def test_new_lists_take_ids_from_their_shards_range(self):
+        first = self._new_list('shard1', ['milk', 'eggs'])
+        second = self._new_list('shard1', ['bread'])
+        on_default = self._new_list('default', ['tea'])
+
+        self.assertEqual(first, (1 << sharding.SHARD_ID_BITS) + 1)
+        self.assertEqual(second, first + 1)
+        self.assertLess(on_default, 1 << sharding.SHARD_ID_BITS)
+        self.assertEqual(self._texts('shard1', first), ['milk', 'eggs'])
+        self.assertFalse(Item.objects.using('default')
+                         .filter(list_id=first).exists())
+        self.assertGreaterEqual(
+            Item.objects.using('shard1').get(text='milk').id,
+            1 << sharding.SHARD_ID_BITS)
+        self.assertContains(self.client.get(f'/lists/{first}/'), '2: eggs')
+
+    def test_export_covers_every_shard(self):
+        on_default = self._new_list('default', ['tea'])
+        on_shard1 = self._new_list('shard1', ['milk', 'eggs'])
+        out = io.StringIO()
+
+        self.assertEqual(export_lists(out), (2, 3))
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [(record['list'], record.get('text')) for record in records],
+            [(on_default, None), (on_default, 'tea'),
+             (on_shard1, None), (on_shard1, 'milk'), (on_shard1, 'eggs')])
+
+    def test_import_command_refuses_to_run_while_sharded(self):
+        with self.assertRaisesMessage(CommandError, 'lists are sharded'):
+            call_command('importlists', os.devnull)
+        self.assertFalse(List.objects.exists())
+
+    @patch('lists.views.STREAM_CHUNK_SIZE', 1)
+    @patch('lists.views.EVENTS_MAX_AGE', 0.05)
+    @override_settings(LISTS_MAX_EVENT_STREAMS=1)
+    def test_streamed_bodies_read_their_shard_from_any_thread(self):
+        list_id = self._new_list('shard1', ['milk', 'eggs'])
+        milk = Item.objects.using('shard1').get(text='milk')
+        responses = [
+            self.client.get(f'/lists/{list_id}/', data={'stream': 1}),
+            self.client.get(f'/lists/{list_id}/items', data={'stream': 1}),
+            self.client.get(f'/lists/{list_id}/events',
+                            data={'after': milk.id}),
+        ]
+
+        # As on an ASGI pool thread that did not run the view.
+        routers.reset_routing()
+        page, rows, events = [b''.join(response.streaming_content).decode()
+                              for response in responses]
+
+        self.assertIn('2: eggs', page)
+        self.assertEqual([text for _, text in json.loads(rows)],
+                         ['milk', 'eggs'])
+        self.assertIn('data: "eggs"', events)
+        self.assertIsNone(routers.current_shard())
+
+    def test_moved_list_keeps_its_id_and_order(self):
+        list_id = self._new_list('shard1', ['milk', 'eggs', 'bread'])
+        with routers.on_shard('shard1'):
+            Item.objects.get(text='eggs').set_status(Item.COMPLETED)
+
+        moved = sharding.move_list(list_id, 'default')
+
+        self.assertEqual(moved, 3)
+        self.assertEqual(sharding.shard_for(list_id), 'default')
+        self.assertEqual(self._texts('default', list_id),
+                         ['milk', 'eggs', 'bread'])
+        self.assertEqual(self._texts('shard1', list_id), [])
+        self.assertFalse(List.objects.using('shard1').filter(id=list_id)
+                         .exists())
+        response = self.client.get(f'/lists/{list_id}/')
+        self.assertContains(response, '2: bread')
+        self.assertNotContains(response, 'eggs')
+
+    def test_ids_of_lists_moved_away_are_not_handed_out_again(self):
+        self._new_list('default', ['a1'])
+        moved = self._new_list('default', ['b1'])
+        sharding.move_list(moved, 'shard1')
+
+        created = self._new_list('default', ['c1'])
+
+        self.assertGreater(created, moved)
+        self.assertContains(self.client.get(f'/lists/{moved}/'), 'b1')
+        self.assertNotContains(self.client.get(f'/lists/{created}/'), 'b1')
+
+    def test_lists_moved_in_leave_the_id_range_alone(self):
+        moved = self._new_list('shard1', ['milk'])
+        sharding.move_list(moved, 'default')
+
+        created = self._new_list('default', ['tea'])
+
+        self.assertLess(created, 1 << sharding.SHARD_ID_BITS)
+        self.assertEqual(self._texts('default', created), ['tea'])
+
+    def test_moving_back_home_clears_the_directory(self):
+        list_id = self._new_list('shard1', ['milk'])
+
+        sharding.move_list(list_id, 'default')
+        sharding.move_list(list_id, 'shard1')
+
+        self.assertFalse(ListShard.objects.exists())
+        self.assertEqual(self._texts('shard1', list_id), ['milk'])
+
+    def test_rebalance_evens_out_active_items(self):
+        for size in (1, 2, 3, 4):
+            self._new_list('default', [f'item {n}' for n in range(size)])
+
+        moves = sharding.rebalance(max_moves=10, tolerance=0)
+
+        self.assertEqual(sharding.shard_sizes(),
+                         {'default': 5, 'shard1': 5})
+        self.assertEqual([move[2] for move in moves], ['shard1'] * 2)
+
+    def test_search_merges_every_shard(self):
+        self._new_list('default', ['peacock feathers'])
+        self._new_list('shard1', ['peacock'])
+
+        matches = self.client.get('/lists/search', data={'q': 'peacock'})
+
+        self.assertEqual(
+            sorted(result['text'] for result in matches.json()['results']),
+            ['peacock', 'peacock feathers'])
+
+    def test_rebalance_command_reports_moves(self):
+        self._new_list('default', ['milk', 'eggs'])
+        list_id = self._new_list('default', ['tea'])
+        stdout, stderr = io.StringIO(), io.StringIO()
+
+        call_command('rebalanceshards', tolerance=0, stdout=stdout,
+                     stderr=stderr)
+
+        self.assertEqual(stdout.getvalue(),
+                         f'{list_id}\tdefault\tshard1\t1\n')
+        self.assertIn('active items per shard: default 2, shard1 1',
+                      stderr.getvalue())
+
+
+class ShardsBenchmarkTest(TransactionTestCase):
+    """Unit tests for the shards benchmark suite, which copies the primary
+    database and so cannot run inside a test transaction.
+    """
+
+    def test_writes_to_each_shard_count_from_worker_processes(self):
+        results = SUITES['shards']({'lists': 2, 'repeat': 3,
+                                    'concurrency': 2})
+
+        self.assertEqual(set(results), {'1_shards', '2_shards', '4_shards'})
+        self.assertEqual(results['4_shards']['errors'], 0)
+        self.assertEqual(results['4_shards']['count'], 3)
+
+
+class AdminTest(TestCase):
+    """Unit tests for the lists and items admin at scale."""
+
+    def setUp(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com',
+                                            'password')
+        self.client.force_login(user)
+
+    def _lists(self, count, items=0):
+        created = [List.objects.create() for _ in range(count)]
+        for _list in created:
+            _list.add_items(f'item {n}' for n in range(items))
+        return created
+
+    def _queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_the_tables(self):
+        self._lists(2, items=2)
+        few = [self._queries(f'/admin/lists/{name}/')
+               for name in ('list', 'item')]
+
+        self._lists(20, items=20)
+        many = [self._queries(f'/admin/lists/{name}/')
+                for name in ('list', 'item')]
+
+        self.assertEqual(few, many)
+
+    @patch.object(lists_admin.ItemAdmin, 'list_per_page', 2)
+    def test_pages_by_id_newest_first(self):
+        items = list(self._lists(1, items=5)[0].item_set.order_by('-id'))
+
+        first = self.client.get('/admin/lists/item/')
+        second = self.client.get('/admin/lists/item/'
+                                 + first.context['cl'].next_page_url)
+
+        self.assertEqual(first.context['cl'].result_list, items[:2])
+        self.assertEqual(second.context['cl'].result_list, items[2:4])
+        self.assertEqual(first.context['cl'].next_page_url,
+                         f'?before={items[1].id}')
+        self.assertContains(second, 'First page')
+
+    @patch('lists.admin.COUNT_LIMIT', 3)
+    def test_estimates_counts_past_the_limit(self):
+        first, *_, last = self._lists(6)
+        last.delete()
+        other, = self._lists(1, items=5)
+
+        lists_page = self.client.get('/admin/lists/list/')
+        items_page = self.client.get('/admin/lists/item/',
+                                     {'list__id__exact': other.id})
+
+        self.assertContains(lists_page, f'about {other.id - first.id + 1} '
+                                        'lists')
+        self.assertContains(items_page, 'over 3 items')
+
+    def test_item_form_picks_its_list_by_id(self):
+        self._lists(1)
+
+        response = self.client.get('/admin/lists/item/add/')
+
+        self.assertContains(response, 'vForeignKeyRawIdAdminField')
+        self.assertNotContains(response, '<select name="list"')
+
+
+class ItemAdminTest(TransactionTestCase):
+    """Unit tests for keeping lists up to date through the items admin,
+    which invalidates the list cache once its transaction commits.
+    """
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_superuser('admin', 'admin@example.com',
+                                            'password')
+        self.client.force_login(user)
+        self.list = List.objects.create()
+        self.list.add_items(['milk', 'eggs'])
+        self.milk, self.eggs = self.list.item_set.order_by('position')
+        self.state = list_cache.get_state(self.list.id)
+
+    def _assert_list(self, item_count):
+        _list = List.objects.get(id=self.list.id)
+        self.assertEqual(_list.item_count, item_count)
+        self.assertGreater(_list.last_modified, self.list.last_modified)
+        self.assertNotEqual(list_cache.get_state(self.list.id), self.state)
+
+    def test_adding_appends_and_counts_the_item(self):
+        self.client.post('/admin/lists/item/add/',
+                         {'text': 'bread', 'list': self.list.id})
+
+        self._assert_list(item_count=3)
+        self.assertEqual(
+            list(self.list.item_set.order_by('position')
+                 .values_list('text', flat=True)),
+            ['milk', 'eggs', 'bread'])
+
+    def test_editing_changes_text_but_not_status_or_list(self):
+        other = List.objects.create()
+
+        self.client.post(f'/admin/lists/item/{self.milk.id}/change/',
+                         {'text': 'oat milk', 'list': other.id,
+                          'status': Item.DELETED})
+
+        self._assert_list(item_count=2)
+        self.milk.refresh_from_db()
+        self.assertEqual((self.milk.text, self.milk.list_id, self.milk.status),
+                         ('oat milk', self.list.id, Item.ACTIVE))
+
+    def test_deleting_takes_the_item_out_of_the_count(self):
+        self.client.post(f'/admin/lists/item/{self.milk.id}/delete/',
+                         {'post': 'yes'})
+
+        self._assert_list(item_count=1)
+        self.assertFalse(Item.objects.filter(id=self.milk.id).exists())
+
+    def test_actions_change_status_through_set_status(self):
+        page = self.client.get('/admin/lists/item/')
+        self.client.post('/admin/lists/item/',
+                         {'action': 'delete_items',
+                          '_selected_action': [self.milk.id]})
+
+        self.assertNotIn('delete_selected', dict(
+            page.context['action_form'].fields['action'].choices))
+        self._assert_list(item_count=1)
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.status, Item.DELETED)
+
+
+class ListSizeReportTest(TestCase):
+    """Unit tests for the list size histogram."""
+
+    def test_counts_lists_and_items_by_size_in_one_query(self):
+        for size in (0, 1, 3, 3, 12):
+            List.objects.create().add_items(['x'] * size)
+
+        with self.assertNumQueries(1):
+            histogram = reports.list_size_histogram((0, 1, 2, 10))
+
+        self.assertEqual(histogram, [('0', 1, 0), ('1', 1, 1),
+                                     ('2-9', 2, 6), ('10+', 1, 12)])
+
+    def test_command_prints_tab_separated_rows(self):
+        List.objects.create().add_items(['x', 'y'])
+        stdout = io.StringIO()
+
+        call_command('listsizes', bounds=(0, 2), stdout=stdout,
+                     stderr=io.StringIO())
+
+        self.assertEqual(stdout.getvalue(), '0-1\t0\t0\n2+\t1\t2\n')
@@ -18,7 +18,17 @@ from lists import views
 
 urlpatterns = [
     url(r'^new$', views.new_list, name='new_list'),
+    url(r'^search$', views.search_items, name='search_items'),
+    url(r'^stats/cache$', views.cache_stats, name='cache_stats'),
+    url(r'^stats/requests$', views.request_stats, name='request_stats'),
+    url(r'^stats/admission$', views.admission_stats, name='admission_stats'),
     url(r'^(\d+)/$', views.view_list, name='view_list'),
+    url(r'^(\d+)/events$', views.list_events, name='list_events'),
+    url(r'^(\d+)/items$', views.list_items, name='list_items'),
     url(r'^(\d+)/add_item$', views.add_item, name='add_item'),
+    url(r'^(\d+)/add_items$', views.add_items, name='add_items'),
+    url(r'^(\d+)/move_item$', views.move_item, name='move_item'),
+    url(r'^(\d+)/complete_item$', views.complete_item, name='complete_item'),
+    url(r'^(\d+)/delete_item$', views.delete_item, name='delete_item'),
 ]
 #    url(r'^admin/', admin.site.urls), # supplied by default,excluded from urlpatterns
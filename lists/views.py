@@ -1,23 +1,483 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import IntegerField, OuterRef, Subquery
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         JsonResponse, StreamingHttpResponse)
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition, require_POST
+from lists import (admission, cache, middleware, pubsub, ranks, routers,
+                   search, sharding, writequeue)
 from lists.models import Item, List
+from lists.parsers import iter_json_strings, iter_lines, spool
+
+ITEMS_PER_PAGE = 100  # Rows per keyset page of view_list.
+STREAM_CHUNK_SIZE = 500  # Rows rendered per chunk of a streamed view_list.
+STREAM_SLOT = mark_safe('<!-- id_list_table rows -->')
+API_PAGE_SIZE = 1000  # Default and maximum ?limit= of list_items.
+EVENTS_HEARTBEAT = 15  # Seconds between keep-alives on an idle event stream.
+EVENTS_MAX_AGE = 300  # Seconds before an event stream ends; clients reconnect.
+
+_open_streams = 0  # Event streams this process is serving.
+_open_streams_lock = threading.Lock()
+
+
+def _atomic():
+    """A transaction on the database this request writes lists to."""
+    return transaction.atomic(using=router.db_for_write(List))
+
 
 # Create your views here.
 def home_page(request):
     return render(request, 'home.html')
 
 
+def _live_updates():
+    """Whether list pages should open an event stream for new items."""
+    return settings.LISTS_MAX_EVENT_STREAMS > 0
+
+
+def _page_cursor(request):
+    """Return the (after, start) keyset cursor from the query string.
+
+    `after` is the position of the last item already seen and `start` is
+    the number of items before it, so row numbering carries across pages
+    without a COUNT query.
+    """
+    after = request.GET.get('after', '')
+    if not ranks.is_valid(after):
+        after = ''
+    try:
+        start = int(request.GET.get('start', 0))
+    except ValueError:
+        start = 0
+    return after, max(start, 0)
+
+
+def _stream_list(request, correct_list, after, start, shard):
+    """Render list.html around rows pulled from the database in chunks.
+
+    Each chunk is its own indexed (list_id, position > after) query, so
+    memory and time-to-first-byte do not grow with the length of the list.
+    Chunks may be pulled on any thread, so each query selects `shard`.
+    """
+    page = render_to_string('list.html',
+                            {'list': correct_list, 'rows': STREAM_SLOT,
+                             'offset': start,
+                             'live_updates': _live_updates()},
+                            request=request)
+    head, tail = page.split(STREAM_SLOT, 1)
+    yield head
+    items = (Item.objects.active().filter(list=correct_list)
+             .order_by('position').values_list('position', 'text'))
+    while True:
+        with routers.on_shard(shard):
+            chunk = list(items.filter(position__gt=after)[:STREAM_CHUNK_SIZE])
+        if not chunk:
+            break
+        yield _render_rows(chunk, start)
+        after = chunk[-1][0]
+        start += len(chunk)
+    yield tail
+
+
+def _render_rows(items, start):
+    """Render (key, text, ...) items as numbered rows following row `start`.
+
+    The template gets one precomputed "counter: text" label per row, so it
+    does no unpacking, attribute lookups or forloop bookkeeping per row.
+    """
+    rows = [f'{counter}: {item[1]}'
+            for counter, item in enumerate(items, start + 1)]
+    return render_to_string('item_rows.html', {'rows': rows})
+
+
+def _render_page(correct_list, after, start):
+    """Return the rendered rows of one keyset page, the cursor of the next
+    page and, on the last page, the id of the list's newest item.
+    """
+    items = list(Item.objects.active()
+                 .filter(list=correct_list, position__gt=after)
+                 .order_by('position').values_list('position', 'text', 'id')
+                 [:ITEMS_PER_PAGE + 1])
+    next_page = last_item_id = None
+    if len(items) > ITEMS_PER_PAGE:
+        items = items[:ITEMS_PER_PAGE]
+        next_page = {'after': items[-1][0], 'start': start + len(items)}
+    elif not after:
+        # The whole list is on this page.
+        last_item_id = max((item[2] for item in items), default=None)
+    else:
+        last_item_id = (Item.objects.filter(list=correct_list)
+                        .order_by('-id').values_list('id', flat=True).first())
+    return _render_rows(items, start), next_page, last_item_id
+
+
+def _list_version(request, list_id):
+    """Return the List with its newest item's id as `latest_item_id`, or
+    None, looking it up once per request.
+
+    It is one query: the list by primary key and a (list, id) index lookup.
+    """
+    if not hasattr(request, '_list_version'):
+        latest = (Item.objects.filter(list_id=OuterRef('pk')).order_by('-id')
+                  .values('id')[:1])
+        request._list_version = (
+            List.objects.filter(id=list_id)
+            .annotate(latest_item_id=Subquery(latest,
+                                              output_field=IntegerField()))
+            .first())
+    return request._list_version
+
+
+def _list_etag(request, list_id):
+    """A strong ETag that changes whenever an item is added to, moved in,
+    completed in or deleted from the list.
+    """
+    _list = _list_version(request, list_id)
+    if _list is None:
+        return None
+    return (f'"{_list.id}-{_list.latest_item_id or 0}-'
+            f'{_list.last_modified:%Y%m%d%H%M%S%f}"')
+
+
+def _list_last_modified(request, list_id):
+    _list = _list_version(request, list_id)
+    return _list.last_modified if _list else None
+
+
+@sharding.sharded_by_list
+@condition(etag_func=_list_etag, last_modified_func=_list_last_modified)
 def view_list(request, list_id):
-    correct_list = List.objects.get(id=list_id)
-    return render(request, 'list.html', {'list': correct_list})
+    """Render a page of a list, or a 304 if the client has it already.
+
+    The conditional check runs before anything is rendered and costs the
+    one query of _list_version, which the page then reuses.
+    """
+    correct_list = _list_version(request, list_id)
+    if correct_list is None:
+        raise Http404
+    after, start = _page_cursor(request)
+    if request.GET.get('stream'):
+        return StreamingHttpResponse(
+            _stream_list(request, correct_list, after, start,
+                         routers.current_shard()))
+
+    rows, next_page, last_item_id = cache.get_rows(
+        list_id, (_list_etag(request, list_id), after, start),
+        lambda: _render_page(correct_list, after, start))
+    return render(request, 'list.html', {'list': correct_list,
+                                         'rows': mark_safe(rows),
+                                         'offset': start,
+                                         'next_page': next_page,
+                                         'last_item_id': last_item_id,
+                                         'live_updates': _live_updates()})
+
+
+def _acquire_stream():
+    """Take one of this process's LISTS_MAX_EVENT_STREAMS event streams,
+    returning False if they are all open.
+    """
+    global _open_streams
+    with _open_streams_lock:
+        if _open_streams >= settings.LISTS_MAX_EVENT_STREAMS:
+            return False
+        _open_streams += 1
+        return True
+
+
+def _release_stream():
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+
+class _EventStream:
+    """Iterate events, giving back the stream taken for them once the
+    response is closed, even if it was never iterated.
+    """
+
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.events.close()
+            _release_stream()
+
+
+def _list_changed(list_id):
+    """Tell the page cache and open event streams that items were added."""
+    cache.invalidate(list_id)
+    pubsub.publish(list_id)
+
+
+def _list_events(list_id, after, shard):
+    """Yield server-sent events for items added after item `after`.
+
+    Each wake-up reads only the items newer than the last one sent, so the
+    work per event is proportional to the new items, not the list. Wake-ups
+    may run on any thread, so each read selects `shard`.
+    """
+    items = (Item.objects.active().filter(list_id=list_id)
+             .order_by('id').values_list('id', 'text'))
+    subscription = pubsub.subscribe(list_id)
+    deadline = time.monotonic() + EVENTS_MAX_AGE
+    try:
+        yield 'retry: 1000\n\n'
+        while time.monotonic() < deadline:
+            subscription.clear()
+            with routers.on_shard(shard):
+                chunk = list(items.filter(id__gt=after)[:STREAM_CHUNK_SIZE])
+            for item_id, text in chunk:
+                yield f'id: {item_id}\ndata: {json.dumps(text)}\n\n'
+            if chunk:
+                after = chunk[-1][0]
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                continue
+            timeout = min(EVENTS_HEARTBEAT, deadline - time.monotonic())
+            if not subscription.wait(max(timeout, 0)):
+                yield ': keep-alive\n\n'
+    finally:
+        subscription.close()
+
+
+@sharding.sharded_by_list
+def list_events(request, list_id):
+    """Stream a list's new items as server-sent events.
+
+    Items after the Last-Event-ID header (sent by reconnecting clients),
+    else after ?after=, else after the list's current last item are sent.
+    Each stream holds a worker thread while it is open, so once this
+    process has LISTS_MAX_EVENT_STREAMS open, or if live updates are off,
+    the answer is 204 No Content, which tells EventSource to stop.
+    """
+    if not List.objects.filter(id=list_id).exists():
+        raise Http404
+    after = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('after')
+    try:
+        after = int(after)
+    except (TypeError, ValueError):
+        last = (Item.objects.filter(list_id=list_id).order_by('-id')
+                .values_list('id', flat=True).first())
+        after = last or 0
+    # Taken last: the response's close() gives it back, and nothing that
+    # can fail runs between the two.
+    if not _acquire_stream():
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(
+        _EventStream(_list_events(list_id, after, routers.current_shard())),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 def new_list(request):
-    new_list = List.objects.create()
-    Item.objects.create(text=request.POST['item_text'], list=new_list)
+    routers.use_shard(sharding.pick_shard())
+    with _atomic():
+        new_list = sharding.create_list()
+        new_list.add_items([request.POST['item_text']])
+    _list_changed(new_list.id)
     return redirect(f'/lists/{new_list.id}/')
 
 
+@sharding.sharded_by_list
 def add_item(request, list_id):
     correct_list = List.objects.get(id=list_id)
-    Item.objects.create(text=request.POST['item_text'], list=correct_list)
+    if writequeue.enabled():
+        writequeue.get_writer().add(correct_list.id, request.POST['item_text'])
+    else:
+        with _atomic():
+            correct_list.add_items([request.POST['item_text']])
+    _list_changed(correct_list.id)
     return redirect(f'/lists/{correct_list.id}/')
+
+
+def _stream_items_json(items, after, shard):
+    """Yield a JSON array of [id, text] rows, one keyset chunk at a time,
+    each read from `shard` whichever thread pulls it.
+    """
+    yield '['
+    separator = ''
+    while True:
+        with routers.on_shard(shard):
+            chunk = list(items.filter(position__gt=after)[:STREAM_CHUNK_SIZE])
+        if not chunk:
+            break
+        yield separator + json.dumps([row[1:] for row in chunk])[1:-1]
+        separator = ','
+        after = chunk[-1][0]
+    yield ']'
+
+
+@sharding.sharded_by_list
+def list_items(request, list_id):
+    """Return a list's items as JSON [id, text] rows without any templates.
+
+    Rows come straight from values_list() so no Item instances are built.
+    Pages follow the same ?after=<position> keyset cursor as view_list, and
+    ?stream=1 returns every remaining row as a streamed JSON array.
+    """
+    if not List.objects.filter(id=list_id).exists():
+        raise Http404
+    after, _ = _page_cursor(request)
+    items = (Item.objects.active().filter(list_id=list_id)
+             .order_by('position').values_list('position', 'id', 'text'))
+    if request.GET.get('stream'):
+        return StreamingHttpResponse(
+            _stream_items_json(items, after, routers.current_shard()),
+            content_type='application/json')
+    try:
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        limit = API_PAGE_SIZE
+    limit = max(1, min(limit, API_PAGE_SIZE))
+    rows = list(items.filter(position__gt=after)[:limit + 1])
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1][0]
+    return JsonResponse({'list': int(list_id), 'fields': ['id', 'text'],
+                         'items': [row[1:] for row in rows],
+                         'next_after': next_after})
+
+
+def search_items(request):
+    """Return ranked JSON matches for ?q= across all lists, by ?page=."""
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    matches = search.search(request.GET.get('q', ''), page)
+    return JsonResponse({
+        'page': page,
+        'results': [{'item': item_id, 'list': list_id, 'text': text}
+                    for item_id, list_id, text in matches],
+        'next_page': page + 1 if len(matches) == search.RESULTS_PER_PAGE
+                     and page < search.MAX_PAGE else None,
+    })
+
+
+@require_POST
+@sharding.sharded_by_list
+def add_items(request, list_id):
+    """Bulk insert a batch of items posted as a JSON array or as text lines.
+
+    The whole body is received into a spool file first, so a slow upload
+    never holds the write lock. It is then parsed from the spool and
+    written with batched bulk_create inside a single transaction, so a
+    malformed batch inserts nothing.
+    """
+    correct_list = List.objects.filter(id=list_id).first()
+    if correct_list is None:
+        raise Http404
+    with spool(request) as body:
+        if request.content_type == 'application/json':
+            texts = iter_json_strings(body)
+        else:
+            texts = iter_lines(body)
+        try:
+            with _atomic():
+                inserted = correct_list.add_items(texts)
+        except ValueError as err:
+            return HttpResponseBadRequest(str(err))
+    _list_changed(correct_list.id)
+    return JsonResponse({'list': correct_list.id, 'inserted': inserted},
+                        status=201)
+
+
+@require_POST
+@sharding.sharded_by_list
+def move_item(request, list_id):
+    """Move POSTed `item` to just after item `after`, or to the top.
+
+    Only the moved item is written: it gets a position key between its new
+    neighbours, so a move costs the same however long the list is. When
+    repeated moves have made a key too long, the list is only marked; the
+    rebalancepositions command gives it fresh keys later.
+    """
+    items = Item.objects.filter(list_id=list_id)
+    try:
+        with _atomic():
+            # Moves change no ids, so bump the time _list_etag includes.
+            # Doing it first takes the write lock before the reads below,
+            # as List.add_items() does; a bad request rolls it back.
+            List.objects.filter(id=list_id).update(
+                last_modified=timezone.now())
+            item_id = int(request.POST['item'])
+            after_id = request.POST.get('after')
+            after = items.get(id=int(after_id)).position if after_id else None
+            item = items.get(id=item_id)
+            if item.position != after:
+                following = (items.exclude(id=item_id)
+                             .filter(position__gt=after or '')
+                             .order_by('position')
+                             .values_list('position', flat=True).first())
+                item.position = ranks.between(after, following)
+                items.filter(id=item_id).update(position=item.position)
+                if len(item.position) > ranks.MAX_KEY_LENGTH:
+                    List.objects.filter(id=list_id).update(
+                        needs_rebalancing=True)
+    except (KeyError, ValueError, Item.DoesNotExist):
+        return HttpResponseBadRequest('item and after must be items of '
+                                      'this list')
+    _list_changed(item.list_id)
+    return JsonResponse({'item': item.id, 'position': item.position})
+
+
+def _set_item_status(request, list_id, status):
+    try:
+        item = Item.objects.get(list_id=list_id, id=int(request.POST['item']))
+    except (KeyError, ValueError, Item.DoesNotExist):
+        return HttpResponseBadRequest('item must be an item of this list')
+    if item.set_status(status):
+        _list_changed(item.list_id)
+    return JsonResponse({'item': item.id,
+                         'status': item.get_status_display()})
+
+
+@require_POST
+@sharding.sharded_by_list
+def complete_item(request, list_id):
+    """Mark POSTed `item` completed, taking it off the list's pages."""
+    return _set_item_status(request, list_id, Item.COMPLETED)
+
+
+@require_POST
+@sharding.sharded_by_list
+def delete_item(request, list_id):
+    """Soft-delete POSTed `item`; compactitems removes it for good later."""
+    return _set_item_status(request, list_id, Item.DELETED)
+
+
+def cache_stats(request):
+    """Report the list cache counters of this process (DEBUG only)."""
+    if not settings.DEBUG:
+        raise Http404
+    return JsonResponse(cache.stats())
+
+
+def request_stats(request):
+    """Report this process's rolling request timings per URL (DEBUG only)."""
+    if not settings.DEBUG:
+        raise Http404
+    return JsonResponse(middleware.request_stats())
+
+
+def admission_stats(request):
+    """Report this process's admitted and shed requests (DEBUG only)."""
+    if not settings.DEBUG:
+        raise Http404
+    return JsonResponse(admission.admission_stats())
@@ -0,0 +1,149 @@
+"""Write coalescing for add_item under burst load.
+
+With the LISTS_WRITE_COALESCING setting enabled, add_item hands its item to
+a background writer thread instead of opening its own write transaction.
+The writer drains the queue in batches, at most `max_batch` items or
+`max_delay` seconds after the first one, and writes each batch in a single
+transaction per shard. Each request still waits until its own item is
+committed, so the redirect that follows always shows it.
+"""
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+
+from lists import routers
+from lists.models import Item, List
+
+WAIT_TIMEOUT = 30  # Seconds a request waits for its batch to commit.
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class PendingItem:
+    """An item waiting in the queue, and the outcome of writing it."""
+
+    def __init__(self, list_id, text):
+        self.list_id = list_id
+        self.text = text
+        self.shard = routers.current_shard()
+        self.error = None
+        self.done = threading.Event()
+
+
+class CoalescingWriter:
+    """Background thread that commits queued items in batches."""
+
+    def __init__(self, max_batch, max_delay):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name='lists-coalescing-writer')
+        self.thread.start()
+
+    def add(self, list_id, text):
+        """Queue an item and block until the batch holding it commits."""
+        pending = PendingItem(list_id, text)
+        self.queue.put(pending)
+        if not pending.done.wait(WAIT_TIMEOUT):
+            raise TimeoutError('Timed out waiting for the item to be written')
+        if pending.error is not None:
+            raise pending.error
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch:
+                self.write(batch)
+            if batch is None or batch[-1] is None:
+                connections.close_all()
+                return
+
+    def next_batch(self):
+        """Block for one item, then gather more until the batch is due.
+
+        Returns the batch, whose last entry is None if stop() was called.
+        """
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                pending = self.queue.get(
+                    timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            batch.append(pending)
+            if pending is None:
+                break
+        return batch
+
+    def write(self, batch):
+        close_old_connections()
+        by_shard = defaultdict(list)
+        for pending in batch:
+            if pending is not None:
+                by_shard[pending.shard].append(pending)
+        for shard, pending_items in by_shard.items():
+            with routers.on_shard(shard):
+                self.write_shard(pending_items)
+
+    def write_shard(self, pending_items):
+        alias = router.db_for_write(Item)
+        try:
+            with transaction.atomic(using=alias):
+                counts = Counter(pending.list_id for pending in pending_items)
+                # Counting first takes the write lock before any read, as
+                # in List.add_items().
+                for list_id, count in sorted(counts.items()):
+                    List(id=list_id).record_new_items(count)
+                positions = {list_id: List(id=list_id).new_positions()
+                             for list_id in counts}
+                Item.objects.bulk_create(
+                    Item(text=pending.text, list_id=pending.list_id,
+                         position=next(positions[pending.list_id]))
+                    for pending in pending_items)
+        except Exception as err:
+            connections[alias].close()
+            for pending in pending_items:
+                pending.error = err
+        else:
+            self.batches += 1
+            self.items += len(pending_items)
+        for pending in pending_items:
+            pending.done.set()
+
+
+def enabled():
+    return bool(settings.LISTS_WRITE_COALESCING)
+
+
+def get_writer():
+    """Return the process's writer, starting it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = CoalescingWriter(**settings.LISTS_WRITE_COALESCING)
+        return _writer
+
+
+def shutdown():
+    """Stop the writer after it has written everything queued so far."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
@@ -0,0 +1,135 @@
+"""
+ASGI config for superlists project.
+
+It exposes the ASGI callable as a module-level variable named ``application``
+for ASGI 3 servers, e.g. ``uvicorn superlists.asgi:application``.
+
+Django 1.11 predates ASGI and async views, so ``application`` wraps the WSGI
+application instead: the event loop accepts requests, buffers their bodies
+and streams responses, and the views themselves (database access included)
+run on a bounded thread pool. Slow or idle keep-alive clients then cost a
+coroutine rather than a worker thread. Static files are served as in
+superlists/wsgi.py, without sendfile. Set SUPERLISTS_ASGI_THREADS to size
+the pool.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from superlists.wsgi import application as wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "superlists.settings")
+
+BODY_MEMORY_LIMIT = 1024 * 1024  # Larger request bodies spill to disk.
+
+_DONE = object()
+
+
+class ASGIAdapter:
+    """Serve a WSGI application to an ASGI 3 server from a thread pool."""
+
+    def __init__(self, wsgi_application, max_workers):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope type: {scope["type"]}')
+
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_MEMORY_LIMIT)
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        # The whole body is buffered, so its length is known even when the
+        # client sent it chunked.
+        environ = self.environ(scope, body)
+        environ['CONTENT_LENGTH'] = str(body.tell())
+        body.seek(0)
+
+        loop = asyncio.get_event_loop()
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_start.update(status=int(status.split(' ', 1)[0]),
+                                  headers=[(name.lower().encode('latin1'),
+                                            value.encode('latin1'))
+                                           for name, value in headers])
+
+        result = await loop.run_in_executor(
+            self.executor, self.wsgi_application, environ, start_response)
+        try:
+            await send(dict(response_start, type='http.response.start'))
+            chunks = iter(result)
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next,
+                                                   chunks, _DONE)
+                if chunk is _DONE:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk,
+                                'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Closing the response fires request_finished, which releases
+            # database connections, so it runs on a worker thread too.
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    def environ(scope, body):
+        """Build the WSGI environ for an ASGI http scope."""
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+            'QUERY_STRING': scope['query_string'].decode('latin1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin1').upper().replace('-', '_')
+            value = value.decode('latin1')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = f'HTTP_{name}'
+            if name in environ:
+                separator = '; ' if name == 'HTTP_COOKIE' else ','
+                value = f'{environ[name]}{separator}{value}'
+            environ[name] = value
+        return environ
+
+
+application = ASGIAdapter(
+    wsgi_application,
+    max_workers=int(os.environ.get('SUPERLISTS_ASGI_THREADS', 32)))
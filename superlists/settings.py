@@ -37,10 +37,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'lists',
+    'lists.apps.ListsConfig',
 ]
 
 MIDDLEWARE = [
+    'lists.middleware.QueryTimingMiddleware',
+    'lists.admission.AdmissionMiddleware',
+    'lists.compression.CompressionMiddleware',
+    'lists.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +72,10 @@ TEMPLATES = [
     },
 ]
 
+# Compile every lists template in ListsConfig.ready() rather than on first
+# use; only useful together with the cached template loader.
+LISTS_PRECOMPILE_TEMPLATES = False
+
 WSGI_APPLICATION = 'superlists.wsgi.application'
 
 
@@ -81,6 +89,90 @@ DATABASES = {
     }
 }
 
+# Read replicas: set SUPERLISTS_READ_REPLICAS to comma-separated SQLite files
+# that `manage.py syncreplicas` keeps as copies of the database above. GET
+# requests then read lists and items from a random one; a client that has
+# just written reads from the primary for LISTS_PIN_SECONDS.
+
+LISTS_READ_REPLICAS = []
+for _number, _path in enumerate(
+        filter(None, os.environ.get('SUPERLISTS_READ_REPLICAS', '').split(',')),
+        start=1):
+    DATABASES[f'replica{_number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path,
+    }
+    LISTS_READ_REPLICAS.append(f'replica{_number}')
+
+LISTS_PIN_SECONDS = 5
+
+# Shards: set SUPERLISTS_SHARDS to comma-separated SQLite files to spread
+# lists over them as well as the database above, which stays shard 0 and
+# holds the directory of moved lists. Only ever append files, then run
+# `manage.py migrate --database shardN` for each new one. Read replicas are
+# not used while lists are sharded.
+
+_shard_paths = list(
+    filter(None, os.environ.get('SUPERLISTS_SHARDS', '').split(',')))
+LISTS_SHARDS = ['default'] if _shard_paths else []
+for _number, _path in enumerate(_shard_paths, start=1):
+    DATABASES[f'shard{_number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path,
+    }
+    LISTS_SHARDS.append(f'shard{_number}')
+
+DATABASE_ROUTERS = ['lists.routers.ShardRouter', 'lists.routers.ReplicaRouter']
+
+# Set to e.g. {'max_batch': 500, 'max_delay': 0.005} to have add_item queue
+# items for a background writer that commits them in batches.
+LISTS_WRITE_COALESCING = None
+
+# Live updates: list pages keep a server-sent event stream open to show items
+# others add. Each open stream holds a worker thread (WSGI, or the ASGI
+# adapter's pool) for up to five minutes, so they are off unless
+# SUPERLISTS_EVENT_STREAMS sets how many one process may serve at once. Keep
+# it well below the server's thread count; past it, pages stop listening.
+LISTS_MAX_EVENT_STREAMS = int(os.environ.get('SUPERLISTS_EVENT_STREAMS', 0))
+
+# Admission control, see lists/admission.py. LISTS_RATE_LIMITS maps URL names
+# to per-client token buckets, e.g. {'new_list': {'rate': 1, 'burst': 20}}:
+# `rate` requests a second, in bursts of up to `burst`. Clients are told
+# apart by IP address, or by session cookie with LISTS_RATE_LIMIT_BY =
+# 'session'. Buckets are kept in process memory unless
+# LISTS_RATE_LIMIT_CACHE names a CACHES alias to share them. Past
+# LISTS_MAX_CONCURRENT_REQUESTS requests in progress, a process sheds more.
+LISTS_RATE_LIMITS = {}
+LISTS_RATE_LIMIT_BY = 'ip'
+LISTS_RATE_LIMIT_CACHE = None
+LISTS_MAX_CONCURRENT_REQUESTS = None
+
+# PRAGMAs run on every new SQLite connection, e.g. {'journal_mode': 'WAL'}.
+# See superlists/settings_production.py for the tuned set.
+SQLITE_PRAGMAS = {}
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# Set SUPERLISTS_CACHE_DIR to keep rendered lists in files across restarts.
+
+if os.environ.get('SUPERLISTS_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['SUPERLISTS_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'superlists',
+        }
+    }
+
+LISTS_CACHE = 'default'  # CACHES alias holding rendered list rows.
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -119,3 +211,10 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.environ.get('SUPERLISTS_STATIC_ROOT',
+                             os.path.join(BASE_DIR, 'static'))
+
+# Have superlists/wsgi.py serve STATIC_ROOT itself, in front of Django, as
+# lists/staticfiles.py describes. runserver serves static files in
+# development.
+LISTS_SERVE_STATIC = False
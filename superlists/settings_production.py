@@ -0,0 +1,104 @@
+"""
+Production settings for superlists.
+
+Use with DJANGO_SETTINGS_MODULE=superlists.settings_production. Everything
+not overridden here comes from superlists/settings.py.
+"""
+
+from superlists.settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('SUPERLISTS_SECRET_KEY', SECRET_KEY)
+
+ALLOWED_HOSTS = os.environ.get('SUPERLISTS_ALLOWED_HOSTS',
+                               'localhost').split(',')
+
+
+# Application definition
+# Only what the lists app uses: no admin, auth, sessions or messages, and so
+# none of their imports, middleware or context processors at startup.
+
+INSTALLED_APPS = [
+    'django.contrib.staticfiles',
+    'lists.apps.ListsConfig',
+]
+
+MIDDLEWARE = [
+    'lists.middleware.QueryTimingMiddleware',
+    'lists.admission.AdmissionMiddleware',
+    'lists.compression.CompressionMiddleware',
+    'lists.routers.ReplicaPinningMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+AUTH_PASSWORD_VALIDATORS = []
+
+
+# Templates
+# Compile each template once per process and keep it in memory, and do the
+# compiling at startup so no request pays for it.
+
+TEMPLATES = [
+    dict(TEMPLATES[0], APP_DIRS=False, OPTIONS=dict(
+        TEMPLATES[0]['OPTIONS'],
+        context_processors=[
+            'django.template.context_processors.request',
+        ],
+        loaders=[
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    )),
+]
+
+LISTS_PRECOMPILE_TEMPLATES = True
+
+
+# Database
+# Keep connections open between requests instead of reconnecting for each
+# one, and let writers wait for the lock rather than fail straight away.
+# Shards get the same; read replicas still reconnect per request, so each
+# opens the latest copy written by syncreplicas.
+
+DATABASES = {
+    alias: dict(database, CONN_MAX_AGE=600, OPTIONS={'timeout': 5})
+    if alias == 'default' or alias in LISTS_SHARDS else database
+    for alias, database in DATABASES.items()
+}
+
+# WAL lets readers run alongside the single writer, and synchronous=NORMAL
+# is durable in WAL mode bar a power cut during checkpoint. Reads are served
+# from a memory map, and busy_timeout covers the lock waits that the timeout
+# option above does not.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+
+
+# Admission control
+# Plenty for people typing, not for a script looping on new_list or
+# add_item. Past 64 requests in progress a process sheds load with 503s
+# rather than letting every request slow down.
+
+LISTS_RATE_LIMITS = {
+    'new_list': {'rate': 1, 'burst': 20},
+    'add_item': {'rate': 5, 'burst': 50},
+}
+LISTS_MAX_CONCURRENT_REQUESTS = 64
+
+
+# Static files
+# collectstatic writes content-hashed names plus gzip (and, with brotli
+# installed, Brotli) copies; the WSGI application serves them with a year's
+# immutable caching and hands the files to the server's sendfile.
+
+STATICFILES_STORAGE = 'lists.staticfiles.CompressedManifestStaticFilesStorage'
+LISTS_SERVE_STATIC = True
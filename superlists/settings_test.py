@@ -0,0 +1,61 @@
+"""
+Test settings for superlists.
+
+manage.py uses these for `manage.py test`; everything not overridden here
+comes from superlists/settings.py. Run with --parallel to spread the test
+classes over one process per CPU.
+"""
+
+from superlists.settings import *  # noqa: F401,F403
+
+TEST_RUNNER = 'superlists.test_runner.TestRunner'
+
+
+# Database
+# Django tests SQLite against in-memory databases already, and gives each
+# --parallel worker its own copy. Sharding tests turn on LISTS_SHARDS with
+# the second database, which TestRunner only creates when they run; read
+# replica tests add their own.
+
+DATABASES = {
+    'default': DATABASES['default'],
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'shard1.sqlite3'),
+    },
+}
+LISTS_READ_REPLICAS = []
+LISTS_SHARDS = []
+
+
+# Cache
+# Always in memory, whatever SUPERLISTS_CACHE_DIR says, so no cached rows
+# outlive a test run.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'superlists-test',
+    }
+}
+
+
+# Passwords
+# The default PBKDF2 hasher is deliberately slow; tests need no such
+# protection.
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+AUTH_PASSWORD_VALIDATORS = []
+
+
+# Logging
+# Tests request missing pages and bad input on purpose; keep the expected
+# 4xx warnings out of the test output.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {
+        'django.request': {'level': 'ERROR'},
+    },
+}
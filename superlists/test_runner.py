@@ -0,0 +1,31 @@
+"""
+Test runner for superlists.
+
+Django 1.11 creates a test database for every alias in DATABASES on every
+run. TestRunner creates the ones besides 'default' only when a test case it
+is about to run sets multi_db, as later Django versions do, so runs that
+leave out the sharding tests do not pay for migrating shard1.
+"""
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import DiscoverRunner
+
+
+def _tests(suite):
+    """Yield every test case of a suite, or of a --parallel suite's parts."""
+    for test in getattr(suite, 'subsuites', suite):
+        if hasattr(test, '__iter__'):
+            yield from _tests(test)
+        else:
+            yield test
+
+
+class TestRunner(DiscoverRunner):
+
+    def build_suite(self, *args, **kwargs):
+        suite = super().build_suite(*args, **kwargs)
+        if not any(getattr(test, 'multi_db', False) for test in _tests(suite)):
+            for alias in list(connections.databases):
+                if alias != DEFAULT_DB_ALIAS:
+                    del connections.databases[alias]
+        return suite
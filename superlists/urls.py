@@ -13,6 +13,7 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+from django.apps import apps
 from django.conf.urls import include, url
 from lists import views as list_views
 from lists import urls as list_urls
@@ -21,3 +22,8 @@ urlpatterns = [
     url(r'^$', list_views.home_page, name='home'),
     url(r'^lists/', include(list_urls)),
 ]
+
+# The production profile leaves the admin out, and so its imports too.
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    urlpatterns.append(url(r'^admin/', admin.site.urls))
@@ -2,6 +2,8 @@
 WSGI config for superlists project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+With LISTS_SERVE_STATIC set, it serves the files collected in STATIC_ROOT
+itself before passing other requests to Django; see lists/staticfiles.py.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/1.11/howto/deployment/wsgi/
@@ -9,8 +11,14 @@ https://docs.djangoproject.com/en/1.11/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "superlists.settings")
 
 application = get_wsgi_application()
+
+if settings.LISTS_SERVE_STATIC:
+    from lists.staticfiles import StaticFilesApplication
+    application = StaticFilesApplication(application, settings.STATIC_ROOT,
+                                         settings.STATIC_URL)